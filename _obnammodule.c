@@ -47,6 +47,7 @@
 #include <sys/stat.h>
 #include <unistd.h>
 #include <stdlib.h>
+#include <string.h>
 
 #if defined(__FreeBSD__)
     #include <sys/extattr.h>
@@ -65,6 +66,13 @@
     #define NO_NANOSECONDS 0
 #endif
 
+#ifdef __linux__
+    #include <limits.h>
+    #include <poll.h>
+    #include <time.h>
+    #include <sys/inotify.h>
+#endif
+
 
 static PyObject *
 fadvise_dontneed(PyObject *self, PyObject *args)
@@ -305,6 +313,886 @@ lsetxattr_wrapper(PyObject *self, PyObject *args)
 }
 
 
+#ifdef __linux__
+static long
+monotonic_ms(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec * 1000L + ts.tv_nsec / 1000000L;
+}
+
+
+/*
+ * Wait for a file to be removed or renamed away, using inotify on its
+ * directory. Return 1 if it has happened, 0 on timeout, or -1 if
+ * inotify can't be used.
+ */
+static int
+wait_for_removal_inotify(const char *pathname, int timeout_ms)
+{
+    char buf[sizeof(struct inotify_event) + NAME_MAX + 1]
+        __attribute__ ((aligned(__alignof__(struct inotify_event))));
+    const struct inotify_event *event;
+    const char *slash;
+    const char *basename;
+    char *dirname;
+    struct pollfd pfd;
+    struct stat st;
+    long deadline;
+    ssize_t len;
+    char *p;
+    int fd;
+    int n;
+    int ret;
+
+    slash = strrchr(pathname, '/');
+    if (slash == NULL) {
+        dirname = strdup(".");
+        basename = pathname;
+    } else {
+        dirname = strndup(pathname, slash == pathname ? 1 : slash - pathname);
+        basename = slash + 1;
+    }
+    if (dirname == NULL)
+        return -1;
+
+    fd = inotify_init();
+    if (fd == -1) {
+        free(dirname);
+        return -1;
+    }
+    n = inotify_add_watch(fd, dirname, IN_DELETE | IN_MOVED_FROM);
+    free(dirname);
+    if (n == -1) {
+        close(fd);
+        return -1;
+    }
+
+    /* The file may have gone away before the watch was added. */
+    if (lstat(pathname, &st) == -1) {
+        close(fd);
+        return errno == ENOENT ? 1 : -1;
+    }
+
+    deadline = monotonic_ms() + timeout_ms;
+    ret = 0;
+    while (ret == 0) {
+        timeout_ms = deadline - monotonic_ms();
+        if (timeout_ms < 0)
+            timeout_ms = 0;
+        pfd.fd = fd;
+        pfd.events = POLLIN;
+        n = poll(&pfd, 1, timeout_ms);
+        if (n == 0)
+            break;
+        if (n == -1) {
+            ret = errno == EINTR ? 0 : -1;
+            break;
+        }
+
+        len = read(fd, buf, sizeof buf);
+        if (len <= 0) {
+            ret = -1;
+            break;
+        }
+        for (p = buf; p < buf + len; p += sizeof(*event) + event->len) {
+            event = (const struct inotify_event *) p;
+            if (event->len > 0 && strcmp(event->name, basename) == 0)
+                ret = 1;
+        }
+    }
+
+    close(fd);
+    return ret;
+}
+#endif
+
+
+static PyObject *
+wait_for_removal(PyObject *self, PyObject *args)
+{
+    const char *pathname;
+    int timeout_ms;
+    int ret;
+
+    if (!PyArg_ParseTuple(args, "si", &pathname, &timeout_ms))
+        return NULL;
+
+#ifdef __linux__
+    Py_BEGIN_ALLOW_THREADS
+    ret = wait_for_removal_inotify(pathname, timeout_ms);
+    Py_END_ALLOW_THREADS
+#else
+    ret = -1;
+#endif
+    return Py_BuildValue("i", ret);
+}
+
+
+/*
+ * Serialisation of objects, compatible with obnamlib/obj_serialiser.py,
+ * which describes the encoding. Values of types not handled here are
+ * given to a Python fallback function, which returns their encoding.
+ */
+
+struct outbuf {
+    char *data;
+    size_t len;
+    size_t size;
+};
+
+
+static int
+outbuf_reserve(struct outbuf *buf, size_t more)
+{
+    size_t size;
+    char *data;
+
+    if (buf->len + more <= buf->size)
+        return 0;
+    size = buf->size == 0 ? 256 : buf->size;
+    while (size < buf->len + more)
+        size *= 2;
+    data = PyMem_Realloc(buf->data, size);
+    if (data == NULL) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    buf->data = data;
+    buf->size = size;
+    return 0;
+}
+
+
+static int
+outbuf_append(struct outbuf *buf, const char *data, size_t len)
+{
+    if (outbuf_reserve(buf, len) == -1)
+        return -1;
+    memcpy(buf->data + buf->len, data, len);
+    buf->len += len;
+    return 0;
+}
+
+
+/* Lengths are 64-bit unsigned integers in network byte order. */
+
+static void
+put_length(char *p, unsigned long long n)
+{
+    int i;
+
+    for (i = 7; i >= 0; --i) {
+        p[i] = n & 0xff;
+        n >>= 8;
+    }
+}
+
+
+static unsigned long long
+get_length(const char *p)
+{
+    unsigned long long n;
+    int i;
+
+    n = 0;
+    for (i = 0; i < 8; ++i)
+        n = (n << 8) | (unsigned char) p[i];
+    return n;
+}
+
+
+static int
+outbuf_append_length(struct outbuf *buf, size_t n)
+{
+    if (outbuf_reserve(buf, 8) == -1)
+        return -1;
+    put_length(buf->data + buf->len, n);
+    buf->len += 8;
+    return 0;
+}
+
+
+/*
+ * Append the type byte of a value and room for its length. Return the
+ * offset of the length, to be given to finish_value once the value
+ * itself has been appended, or -1 on error.
+ */
+static Py_ssize_t
+start_value(struct outbuf *buf, char type)
+{
+    if (outbuf_reserve(buf, 9) == -1)
+        return -1;
+    buf->data[buf->len] = type;
+    buf->len += 9;
+    return buf->len - 8;
+}
+
+
+static void
+finish_value(struct outbuf *buf, Py_ssize_t length_pos)
+{
+    put_length(buf->data + length_pos, buf->len - length_pos - 8);
+}
+
+
+static int
+serialise_str_list(struct outbuf *buf, PyObject **strings, Py_ssize_t n)
+{
+    Py_ssize_t i;
+
+    if (outbuf_append_length(buf, n) == -1)
+        return -1;
+    for (i = 0; i < n; ++i) {
+        if (outbuf_append_length(buf, PyString_GET_SIZE(strings[i])) == -1)
+            return -1;
+    }
+    for (i = 0; i < n; ++i) {
+        if (outbuf_append(buf, PyString_AS_STRING(strings[i]),
+                          PyString_GET_SIZE(strings[i])) == -1)
+            return -1;
+    }
+    return 0;
+}
+
+
+static int serialise_value(struct outbuf *, PyObject *, PyObject *);
+
+
+/*
+ * A dict is encoded as lists of the keys with int values, the int
+ * values as decimal strings, the keys with str values, the str values,
+ * and the other keys, followed by the encoded other values.
+ */
+static int
+serialise_dict(struct outbuf *buf, PyObject *dict, PyObject *fallback)
+{
+    PyObject *items;
+    PyObject **keys;
+    PyObject **values;
+    PyObject *key;
+    PyObject *value;
+    Py_ssize_t n;
+    Py_ssize_t i;
+    Py_ssize_t k;
+    int ok;
+    int ret;
+
+    /* Work on a copy, in case the fallback changes the dict. */
+    items = PyDict_Items(dict);
+    if (items == NULL)
+        return -1;
+    n = PyList_GET_SIZE(items);
+    keys = PyMem_New(PyObject *, n + 1);
+    values = PyMem_New(PyObject *, n + 1);
+    if (keys == NULL || values == NULL) {
+        PyMem_Free(keys);
+        PyMem_Free(values);
+        Py_DECREF(items);
+        PyErr_NoMemory();
+        return -1;
+    }
+
+    ret = -1;
+    for (i = 0; i < n; ++i) {
+        if (!PyString_Check(PyTuple_GET_ITEM(PyList_GET_ITEM(items, i), 0))) {
+            PyErr_SetString(PyExc_TypeError, "dict keys must be strings");
+            goto out;
+        }
+    }
+
+    k = 0;
+    ok = 1;
+    for (i = 0; i < n && ok; ++i) {
+        key = PyTuple_GET_ITEM(PyList_GET_ITEM(items, i), 0);
+        value = PyTuple_GET_ITEM(PyList_GET_ITEM(items, i), 1);
+        if (PyInt_CheckExact(value) || PyLong_CheckExact(value)) {
+            values[k] = PyObject_Str(value);
+            if (values[k] == NULL)
+                ok = 0;
+            else
+                keys[k++] = key;
+        }
+    }
+    if (ok)
+        ok = (serialise_str_list(buf, keys, k) == 0 &&
+              serialise_str_list(buf, values, k) == 0);
+    for (i = 0; i < k; ++i)
+        Py_DECREF(values[i]);
+    if (!ok)
+        goto out;
+
+    k = 0;
+    for (i = 0; i < n; ++i) {
+        key = PyTuple_GET_ITEM(PyList_GET_ITEM(items, i), 0);
+        value = PyTuple_GET_ITEM(PyList_GET_ITEM(items, i), 1);
+        if (PyString_CheckExact(value)) {
+            values[k] = value;
+            keys[k++] = key;
+        }
+    }
+    if (serialise_str_list(buf, keys, k) == -1 ||
+            serialise_str_list(buf, values, k) == -1)
+        goto out;
+
+    k = 0;
+    for (i = 0; i < n; ++i) {
+        key = PyTuple_GET_ITEM(PyList_GET_ITEM(items, i), 0);
+        value = PyTuple_GET_ITEM(PyList_GET_ITEM(items, i), 1);
+        if (!PyInt_CheckExact(value) && !PyLong_CheckExact(value) &&
+                !PyString_CheckExact(value)) {
+            values[k] = value;
+            keys[k++] = key;
+        }
+    }
+    if (serialise_str_list(buf, keys, k) == -1)
+        goto out;
+    for (i = 0; i < k; ++i) {
+        if (serialise_value(buf, values[i], fallback) == -1)
+            goto out;
+    }
+
+    ret = 0;
+
+out:
+    PyMem_Free(keys);
+    PyMem_Free(values);
+    Py_DECREF(items);
+    return ret;
+}
+
+
+static int
+serialise_list(struct outbuf *buf, PyObject *list, PyObject *fallback)
+{
+    PyObject *item;
+    Py_ssize_t i;
+    int ret;
+
+    /* The size is checked each time, in case the fallback changes
+       the list. */
+    for (i = 0; i < PyList_GET_SIZE(list); ++i) {
+        item = PyList_GET_ITEM(list, i);
+        Py_INCREF(item);
+        ret = serialise_value(buf, item, fallback);
+        Py_DECREF(item);
+        if (ret == -1)
+            return -1;
+    }
+    return 0;
+}
+
+
+static int
+serialise_with_fallback(struct outbuf *buf, PyObject *obj, PyObject *fallback)
+{
+    PyObject *encoded;
+    int ret;
+
+    encoded = PyObject_CallFunctionObjArgs(fallback, obj, NULL);
+    if (encoded == NULL)
+        return -1;
+    if (!PyString_Check(encoded)) {
+        PyErr_SetString(PyExc_TypeError, "fallback must return a string");
+        Py_DECREF(encoded);
+        return -1;
+    }
+    ret = outbuf_append(buf, PyString_AS_STRING(encoded),
+                        PyString_GET_SIZE(encoded));
+    Py_DECREF(encoded);
+    return ret;
+}
+
+
+static int
+serialise_value(struct outbuf *buf, PyObject *obj, PyObject *fallback)
+{
+    PyObject *s;
+    Py_ssize_t length_pos;
+    int ret;
+
+    if (obj == Py_None) {
+        length_pos = start_value(buf, 'n');
+        if (length_pos == -1)
+            return -1;
+    } else if (PyBool_Check(obj)) {
+        length_pos = start_value(buf, 'b');
+        if (length_pos == -1 ||
+                outbuf_append(buf, obj == Py_True ? "\1" : "\0", 1) == -1)
+            return -1;
+    } else if (PyInt_CheckExact(obj) || PyLong_CheckExact(obj)) {
+        length_pos = start_value(buf, 'i');
+        if (length_pos == -1)
+            return -1;
+        s = PyObject_Str(obj);
+        if (s == NULL)
+            return -1;
+        ret = outbuf_append(buf, PyString_AS_STRING(s), PyString_GET_SIZE(s));
+        Py_DECREF(s);
+        if (ret == -1)
+            return -1;
+    } else if (PyString_CheckExact(obj)) {
+        length_pos = start_value(buf, 's');
+        if (length_pos == -1 ||
+                outbuf_append(buf, PyString_AS_STRING(obj),
+                              PyString_GET_SIZE(obj)) == -1)
+            return -1;
+    } else if (PyList_CheckExact(obj) || PyDict_CheckExact(obj)) {
+        length_pos = start_value(buf, PyList_CheckExact(obj) ? 'L' : 'D');
+        if (length_pos == -1)
+            return -1;
+        if (Py_EnterRecursiveCall(" while serialising an object"))
+            return -1;
+        if (PyList_CheckExact(obj))
+            ret = serialise_list(buf, obj, fallback);
+        else
+            ret = serialise_dict(buf, obj, fallback);
+        Py_LeaveRecursiveCall();
+        if (ret == -1)
+            return -1;
+    } else {
+        return serialise_with_fallback(buf, obj, fallback);
+    }
+
+    finish_value(buf, length_pos);
+    return 0;
+}
+
+
+static PyObject *
+serialise_object(PyObject *self, PyObject *args)
+{
+    PyObject *obj;
+    PyObject *fallback;
+    PyObject *ret;
+    struct outbuf buf = { NULL, 0, 0 };
+
+    if (!PyArg_ParseTuple(args, "OO", &obj, &fallback))
+        return NULL;
+
+    ret = NULL;
+    if (serialise_value(&buf, obj, fallback) == 0)
+        ret = PyString_FromStringAndSize(buf.data, buf.len);
+    PyMem_Free(buf.data);
+    return ret;
+}
+
+
+static int
+truncated(void)
+{
+    PyErr_SetString(PyExc_ValueError, "serialised object is truncated");
+    return -1;
+}
+
+
+/* Set *length to n, if n bytes fit in the avail bytes left. */
+static int
+fits(unsigned long long n, Py_ssize_t avail, Py_ssize_t *length)
+{
+    if (n > (unsigned long long) avail)
+        return truncated();
+    *length = n;
+    return 0;
+}
+
+
+/*
+ * Read a length at *pos, and move *pos past it. Lengths larger than
+ * the data left before end are treated as truncation: whatever they
+ * count can't fit.
+ */
+static int
+read_length(const char *data, Py_ssize_t end, Py_ssize_t *pos,
+            Py_ssize_t *length)
+{
+    if (end - *pos < 8)
+        return truncated();
+    *pos += 8;
+    return fits(get_length(data + *pos - 8), end - *pos, length);
+}
+
+
+/* Like int(s) in Python, for a decimal integer string. */
+static PyObject *
+decode_int(const char *s, Py_ssize_t len)
+{
+    char small[64];
+    char *copy;
+    PyObject *ret;
+
+    if (memchr(s, '\0', len) != NULL) {
+        PyErr_SetString(PyExc_ValueError, "invalid integer in serialised "
+                        "object");
+        return NULL;
+    }
+
+    if (len < (Py_ssize_t) sizeof(small)) {
+        copy = small;
+    } else {
+        copy = PyMem_Malloc(len + 1);
+        if (copy == NULL)
+            return PyErr_NoMemory();
+    }
+    memcpy(copy, s, len);
+    copy[len] = '\0';
+    ret = PyInt_FromString(copy, NULL, 10);
+    if (copy != small)
+        PyMem_Free(copy);
+    return ret;
+}
+
+
+/*
+ * Decode a list of strings at *pos into a new Python list. If as_ints
+ * is true, the strings are decimal integers, and are converted.
+ */
+static PyObject *
+decode_str_list(const char *data, Py_ssize_t end, Py_ssize_t *pos,
+                int as_ints)
+{
+    PyObject *list;
+    PyObject *item;
+    Py_ssize_t lengths_pos;
+    Py_ssize_t n;
+    Py_ssize_t i;
+    Py_ssize_t len;
+
+    if (read_length(data, end, pos, &n) == -1)
+        return NULL;
+    if (n > (end - *pos) / 8) {
+        truncated();
+        return NULL;
+    }
+    lengths_pos = *pos;
+    *pos += n * 8;
+
+    list = PyList_New(n);
+    if (list == NULL)
+        return NULL;
+    for (i = 0; i < n; ++i) {
+        if (fits(get_length(data + lengths_pos + i * 8), end - *pos,
+                 &len) == -1) {
+            Py_DECREF(list);
+            return NULL;
+        }
+        if (as_ints)
+            item = decode_int(data + *pos, len);
+        else
+            item = PyString_FromStringAndSize(data + *pos, len);
+        if (item == NULL) {
+            Py_DECREF(list);
+            return NULL;
+        }
+        PyList_SET_ITEM(list, i, item);
+        *pos += len;
+    }
+    return list;
+}
+
+
+static PyObject *decode_value(const char *, Py_ssize_t, Py_ssize_t *);
+
+
+static int
+add_to_dict(PyObject *dict, PyObject *keys, PyObject *values)
+{
+    Py_ssize_t i;
+
+    if (PyList_GET_SIZE(keys) != PyList_GET_SIZE(values)) {
+        PyErr_SetString(PyExc_ValueError,
+                        "serialised dict has a different number of keys "
+                        "and values");
+        return -1;
+    }
+    for (i = 0; i < PyList_GET_SIZE(keys); ++i) {
+        if (PyDict_SetItem(dict, PyList_GET_ITEM(keys, i),
+                           PyList_GET_ITEM(values, i)) == -1)
+            return -1;
+    }
+    return 0;
+}
+
+
+static PyObject *
+decode_dict(const char *data, Py_ssize_t pos, Py_ssize_t end)
+{
+    PyObject *dict;
+    PyObject *keys;
+    PyObject *values;
+    PyObject *value;
+    Py_ssize_t i;
+    int ret;
+
+    dict = PyDict_New();
+    if (dict == NULL)
+        return NULL;
+
+    /* Keys with int values, then keys with str values. */
+    for (i = 0; i < 2; ++i) {
+        keys = decode_str_list(data, end, &pos, 0);
+        if (keys == NULL)
+            goto error;
+        values = decode_str_list(data, end, &pos, i == 0);
+        if (values == NULL) {
+            Py_DECREF(keys);
+            goto error;
+        }
+        ret = add_to_dict(dict, keys, values);
+        Py_DECREF(keys);
+        Py_DECREF(values);
+        if (ret == -1)
+            goto error;
+    }
+
+    /* Keys with other values, followed by the values. */
+    keys = decode_str_list(data, end, &pos, 0);
+    if (keys == NULL)
+        goto error;
+    for (i = 0; i < PyList_GET_SIZE(keys); ++i) {
+        value = decode_value(data, end, &pos);
+        if (value == NULL) {
+            Py_DECREF(keys);
+            goto error;
+        }
+        ret = PyDict_SetItem(dict, PyList_GET_ITEM(keys, i), value);
+        Py_DECREF(value);
+        if (ret == -1) {
+            Py_DECREF(keys);
+            goto error;
+        }
+    }
+    Py_DECREF(keys);
+    return dict;
+
+error:
+    Py_DECREF(dict);
+    return NULL;
+}
+
+
+static PyObject *
+decode_list(const char *data, Py_ssize_t pos, Py_ssize_t end)
+{
+    PyObject *list;
+    PyObject *item;
+    int ret;
+
+    list = PyList_New(0);
+    if (list == NULL)
+        return NULL;
+    while (pos < end) {
+        item = decode_value(data, end, &pos);
+        if (item == NULL) {
+            Py_DECREF(list);
+            return NULL;
+        }
+        ret = PyList_Append(list, item);
+        Py_DECREF(item);
+        if (ret == -1) {
+            Py_DECREF(list);
+            return NULL;
+        }
+    }
+    return list;
+}
+
+
+/*
+ * Decode the value at *pos, which must fit before end, and move *pos
+ * past it.
+ */
+static PyObject *
+decode_value(const char *data, Py_ssize_t end, Py_ssize_t *pos)
+{
+    PyObject *ret;
+    Py_ssize_t start;
+    Py_ssize_t len;
+    char type;
+
+    if (*pos >= end) {
+        truncated();
+        return NULL;
+    }
+    type = data[*pos];
+    *pos += 1;
+    if (read_length(data, end, pos, &len) == -1)
+        return NULL;
+    start = *pos;
+    *pos += len;
+
+    switch (type) {
+    case 'n':
+        Py_RETURN_NONE;
+    case 'b':
+        if (len < 1) {
+            truncated();
+            return NULL;
+        }
+        return PyBool_FromLong(data[start] != '\0');
+    case 'i':
+        return decode_int(data + start, len);
+    case 's':
+        return PyString_FromStringAndSize(data + start, len);
+    case 'L':
+    case 'D':
+        if (Py_EnterRecursiveCall(" while deserialising an object"))
+            return NULL;
+        if (type == 'L')
+            ret = decode_list(data, start, start + len);
+        else
+            ret = decode_dict(data, start, start + len);
+        Py_LeaveRecursiveCall();
+        return ret;
+    default:
+        PyErr_Format(PyExc_ValueError,
+                     "unknown type 0x%02x in serialised object",
+                     (unsigned char) type);
+        return NULL;
+    }
+}
+
+
+static PyObject *
+deserialise_object(PyObject *self, PyObject *args)
+{
+    PyObject *str;
+    Py_ssize_t pos;
+
+    /* Not "s#": without PY_SSIZE_T_CLEAN it gives the length as an
+       int. */
+    if (!PyArg_ParseTuple(args, "S", &str))
+        return NULL;
+    pos = 0;
+    return decode_value(
+        PyString_AS_STRING(str), PyString_GET_SIZE(str), &pos);
+}
+
+
+#if defined(__linux__) && defined(O_TMPFILE)
+/*
+ * Write a new file into a directory, using an unnamed temporary file
+ * that is linked into the directory once it has been written. If
+ * tempname is not NULL, link it with that name, and then rename it
+ * over name, replacing any existing file. Otherwise linking fails if
+ * name already exists. Return 0 for success, 1 if O_TMPFILE is not
+ * supported by the filesystem, or -1 with errno set on error.
+ */
+static int
+write_via_tmpfile(int dirfd, const char *name, const char *data,
+                  size_t size, mode_t mode, const char *tempname)
+{
+    char procpath[64];
+    const char *linkname;
+    ssize_t n;
+    int saved;
+    int fd;
+
+    fd = openat(dirfd, ".", O_TMPFILE | O_WRONLY | O_CLOEXEC, mode);
+    if (fd == -1) {
+        if (errno == EISDIR || errno == EOPNOTSUPP || errno == EINVAL)
+            return 1;
+        return -1;
+    }
+
+    /* The mode given to openat is subject to the umask. */
+    if (fchmod(fd, mode) == -1)
+        goto error;
+
+    while (size > 0) {
+        n = write(fd, data, size);
+        if (n == -1) {
+            if (errno == EINTR)
+                continue;
+            goto error;
+        }
+        data += n;
+        size -= n;
+    }
+
+    linkname = tempname != NULL ? tempname : name;
+    snprintf(procpath, sizeof procpath, "/proc/self/fd/%d", fd);
+    if (linkat(AT_FDCWD, procpath, dirfd, linkname, AT_SYMLINK_FOLLOW) == -1)
+        goto error;
+    if (close(fd) == -1) {
+        fd = -1;
+        goto error;
+    }
+    fd = -1;
+
+    if (tempname != NULL && renameat(dirfd, tempname, dirfd, name) == -1) {
+        saved = errno;
+        (void) unlinkat(dirfd, tempname, 0);
+        errno = saved;
+        return -1;
+    }
+    return 0;
+
+error:
+    saved = errno;
+    if (fd != -1)
+        (void) close(fd);
+    errno = saved;
+    return -1;
+}
+#endif
+
+
+static PyObject *
+write_file_at(PyObject *self, PyObject *args)
+{
+    int dirfd;
+    const char *name;
+    PyObject *data;
+    int mode;
+    const char *tempname;
+#if defined(__linux__) && defined(O_TMPFILE)
+    int ret;
+#endif
+
+    if (!PyArg_ParseTuple(args, "isSiz", &dirfd, &name, &data, &mode,
+                          &tempname))
+        return NULL;
+
+#if defined(__linux__) && defined(O_TMPFILE)
+    Py_BEGIN_ALLOW_THREADS
+    ret = write_via_tmpfile(dirfd, name, PyString_AS_STRING(data),
+                            PyString_GET_SIZE(data), mode, tempname);
+    Py_END_ALLOW_THREADS
+    if (ret == -1)
+        return PyErr_SetFromErrnoWithFilename(PyExc_OSError, (char *) name);
+    return PyBool_FromLong(ret == 0);
+#else
+    return PyBool_FromLong(0);
+#endif
+}
+
+
+static PyObject *
+sync_filesystem(PyObject *self, PyObject *args)
+{
+    int fd;
+    int ret;
+
+    if (!PyArg_ParseTuple(args, "i", &fd))
+        return NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+#ifdef __linux__
+    ret = syncfs(fd);
+#else
+    sync();
+    ret = 0;
+#endif
+    Py_END_ALLOW_THREADS
+    if (ret == -1)
+        return PyErr_SetFromErrno(PyExc_OSError);
+    Py_RETURN_NONE;
+}
+
+
 static PyMethodDef methods[] = {
     {"fadvise_dontneed",  fadvise_dontneed, METH_VARARGS,
      "Call posix_fadvise(2) with POSIX_FADV_DONTNEED argument."},
@@ -318,6 +1206,20 @@ static PyMethodDef methods[] = {
      "lgetxattr(2) wrapper; arg is filename, returns tuple."},
     {"lsetxattr", lsetxattr_wrapper, METH_VARARGS,
      "lsetxattr(2) wrapper; arg is filename, returns errno."},
+    {"wait_for_removal", wait_for_removal, METH_VARARGS,
+     "Wait until a file is removed; args are filename and timeout in "
+     "milliseconds; returns 1 if removed, 0 on timeout, -1 if "
+     "not supported."},
+    {"serialise_object", serialise_object, METH_VARARGS,
+     "Serialise an object like obnamlib.serialise_object; args are the "
+     "object and a function that serialises values of other types."},
+    {"deserialise_object", deserialise_object, METH_VARARGS,
+     "Deserialise an object serialised by serialise_object."},
+    {"write_file_at", write_file_at, METH_VARARGS,
+     "Write a new file; args are directory fd, basename, data, mode, "
+     "and temporary name or None; returns False if not supported."},
+    {"sync_filesystem", sync_filesystem, METH_VARARGS,
+     "Commit the filesystem containing an open file to disk; arg is fd."},
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
@@ -325,5 +1227,17 @@ static PyMethodDef methods[] = {
 PyMODINIT_FUNC
 init_obnam(void)
 {
-    (void) Py_InitModule("_obnam", methods);
+    PyObject *module;
+
+    module = Py_InitModule("_obnam", methods);
+    if (module == NULL)
+        return;
+
+    /* Python 2's os module does not know these lseek whence values. */
+#ifdef SEEK_DATA
+    (void) PyModule_AddIntConstant(module, "SEEK_DATA", SEEK_DATA);
+#endif
+#ifdef SEEK_HOLE
+    (void) PyModule_AddIntConstant(module, "SEEK_HOLE", SEEK_HOLE);
+#endif
 }
@@ -33,6 +33,13 @@ from .defaults import (
     DEFAULT_DIR_CACHE_BYTES,
     DEFAULT_CHUNK_CACHE_BYTES,
     DEFAULT_CHUNK_BAG_BYTES,
+    DEFAULT_RESTORE_BATCH_BYTES,
+    DEFAULT_FUSE_CHUNK_CACHE_BYTES,
+    DEFAULT_FUSE_READ_AHEAD_CHUNKS,
+    DEFAULT_FUSE_METADATA_CACHE_ENTRIES,
+    DEFAULT_FUSE_REPOSITORY_HANDLES,
+    DEFAULT_FSCK_WORKERS,
+    DEFAULT_MOVED_FILE_MIN_SIZE,
 
     IDPATH_DEPTH,
     IDPATH_BITS,
@@ -57,6 +64,7 @@ except ImportError:
     _obnam = DummyExtension()
 
 
+from .tracer import Tracer, add_trace_pattern
 from .sizeparse import SizeSyntaxError, UnitNameError, ByteSizeParser
 
 from .encryption import (
@@ -85,18 +93,33 @@ from .vfs import (
     NEW_FILE_MODE)
 from .vfs_local import LocalFS
 from .fsck_work_item import WorkItem
+from .fsck_journal import (
+    FsckBudgetSyntaxError,
+    parse_fsck_budget,
+    FsckJournal,
+    JournalledChunkIds)
 from .repo_fs import RepositoryFS
 from .lockmgr import LockManager
 from .forget_policy import ForgetPolicy
 from .app import App, ObnamIOError, ObnamSystemError
 from .humanise import humanise_duration, humanise_size, humanise_speed
 from .chunkid_token_map import ChunkIdTokenMap
+from .moved_file_index import MovedFileIndex
+from .phase_stats import PhaseStats
+from .vfs_latency import (
+    LatencyHistogram,
+    VfsLatencyStats,
+    TIMED_VFS_OPERATIONS)
 from .pathname_excluder import PathnameExcluder
 from .splitpath import split_pathname
 
 from .obj_serialiser import serialise_object, deserialise_object
 from .bag import Bag, BagIdNotSetError, make_object_id, parse_object_id
-from .bag_store import BagStore, serialise_bag, deserialise_bag
+from .bag_store import (
+    BagStore,
+    IDS_PER_BLOCK,
+    serialise_bag,
+    deserialise_bag)
 from .blob_store import BlobStore
 
 from .repo_factory import (
@@ -154,6 +177,8 @@ from .repo_interface import (
     REPO_FILE_SHA256,
     REPO_FILE_SHA384,
     REPO_FILE_SHA512,
+    REPO_FILE_BLAKE2B,
+    REPO_FILE_BLAKE2S,
     REPO_FILE_INTEGER_KEYS,
     metadata_file_key_mapping)
 
@@ -162,6 +187,8 @@ from .checksummer import (
     get_checksum_algorithm,
     get_checksum_algorithm_name,
     get_checksum_algorithm_key,
+    UnknownChecksumAlgorithm,
+    ChecksumAlgorithmNotAvailable,
 )
 
 from .whole_file_checksummer import WholeFileCheckSummer
@@ -190,6 +217,10 @@ from .fmt_ga import (
     LeafStore,
     CowLeaf,
     CowTree,
+    CheckGABags,
+    CheckGAChunkStore,
+    CheckGAChunkIndexes,
+    CheckGAClientDirectories,
 )
 
 
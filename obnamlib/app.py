@@ -18,7 +18,6 @@ import logging
 import socket
 import sys
 import time
-import tracing
 
 import cliapp
 import larch
@@ -27,6 +26,9 @@ import ttystatus
 import obnamlib
 
 
+tracer = obnamlib.Tracer(__file__)
+
+
 class ObnamIOError(obnamlib.ObnamError):
 
     msg = 'I/O error: {filename}: {errno}: {strerror}'
@@ -100,8 +102,9 @@ class App(cliapp.Application):
         self.settings.choice(
             ['checksum-algorithm'],
             algos,
-            'use CHECKSUM for checksum algorithm '
-            '(not for repository format 6); '
+            'use CHECKSUM for checksum algorithm for new repositories '
+            'and clients (not for repository format 6); '
+            'blake2b is usually fastest, if available; '
             'one of: ' +
             ', '.join(algos),
             metavar='CHECKSUM')
@@ -192,6 +195,8 @@ class App(cliapp.Application):
 
         self.fsf = obnamlib.VfsFactory()
         self.repo_factory = obnamlib.RepositoryFactory()
+        self.phase_stats = obnamlib.PhaseStats()
+        self.vfs_latency = obnamlib.VfsLatencyStats()
 
         self.setup_hooks()
 
@@ -217,9 +222,10 @@ class App(cliapp.Application):
                 if self.settings['quiet']:
                     self.ts.disable()
                 for pattern in self.settings['trace']:
-                    tracing.trace_add_pattern(pattern)
+                    obnamlib.add_trace_pattern(pattern)
                 self.hooks.call('config-loaded')
                 cliapp.Application.process_args(self, args)
+                self.vfs_latency.log()
                 self.hooks.call('shutdown')
             except IOError as e:
                 logging.critical('Caught IOError: %s', str(e), exc_info=True)
@@ -247,8 +253,8 @@ class App(cliapp.Application):
         '''Return an implementation of obnamlib.RepositoryInterface.'''
 
         logging.info('Opening repository: %s', self.settings['repository'])
-        tracing.trace('create=%s', create)
-        tracing.trace('repofs=%s', repofs)
+        tracer.trace('create=%s', create)
+        tracer.trace('repofs=%s', repofs)
 
         repopath = self.settings['repository']
         if repofs is None:
@@ -256,6 +262,7 @@ class App(cliapp.Application):
             if self.settings['crash-limit'] > 0:
                 repofs.crash_limit = self.settings['crash-limit']
             repofs.connect()
+            self.vfs_latency.instrument('repository', repofs)
         else:
             repofs.reinit(repopath)
 
@@ -275,6 +282,8 @@ class App(cliapp.Application):
             'dir_cache_size': self.settings['dir-cache-size'],
             'dir_bag_size': self.settings['dir-bag-size'],
             'checksum_algorithm': self.settings['checksum-algorithm'],
+            'phase_stats': self.phase_stats,
+            'vfs_latency': self.vfs_latency,
         }
 
         if create:
@@ -15,6 +15,7 @@
 
 
 import logging
+import threading
 import time
 
 import obnamlib
@@ -22,23 +23,45 @@ import obnamlib
 
 class BackupProgress(object):
 
-    def __init__(self, ts):
+    '''Keep track of, and show, the progress of a backup.
+
+    The backup updates plain counters and attributes, which are cheap
+    to change for every file and chunk. A background thread renders
+    them on the terminal a few times a second. With quiet, nothing is
+    rendered, and only errors are shown.
+
+    '''
+
+    render_interval = 0.2
+
+    def __init__(self, ts, quiet=False):
         self.file_count = 0
         self.backed_up_count = 0
         self.uploaded_bytes = 0
         self.scanned_bytes = 0
+        self.current_file = ''
+        self.what_text = ''
+        self.removed_checkpoint = None
         self.started = None
         self.errors = False
 
         self._ts = ts
-        self._ts['current-file'] = ''
+        self._quiet = quiet
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._renderer = None
+
+        if quiet:
+            return
+
+        self._ts['file-count'] = 0
         self._ts['scanned-bytes'] = 0
         self._ts['uploaded-bytes'] = 0
 
         if self.ttystatus_supports_multiline():
             self._ts.format(
                 '%ElapsedTime() Backing up: '
-                'found %Counter(current-file) files, '
+                'found %Integer(file-count) files, '
                 '%ByteSize(scanned-bytes); '
                 'uploaded: %ByteSize(uploaded-bytes)\n'
                 '%String(what)'
@@ -46,7 +69,7 @@ class BackupProgress(object):
         else:
             self._ts.format(
                 '%ElapsedTime() '
-                '%Counter(current-file) '
+                '%Integer(file-count) '
                 'files '
                 '%ByteSize(scanned-bytes) scanned: '
                 '%String(what)')
@@ -54,44 +77,94 @@ class BackupProgress(object):
     def ttystatus_supports_multiline(self):
         return hasattr(self._ts, 'start_new_line')
 
+    def _start_rendering(self):
+        if self._quiet or self._renderer is not None:
+            return
+        self._renderer = threading.Thread(target=self._render_periodically)
+        self._renderer.daemon = True
+        self._renderer.start()
+
+    def _render_periodically(self):
+        # Sleep rather than wait on the event with a timeout: in
+        # Python 2 the latter polls many times a second.
+        while not self._stopped.is_set():
+            time.sleep(self.render_interval)
+            self._render()
+
+    def _render(self):
+        with self._lock:
+            if self._stopped.is_set():
+                return
+            self._ts['file-count'] = self.file_count
+            self._ts['scanned-bytes'] = self.scanned_bytes
+            self._ts['uploaded-bytes'] = self.uploaded_bytes
+            self._ts['what'] = self.what_text
+            self._ts.flush()
+
+    def stop(self):
+        '''Stop rendering progress.'''
+        self._stopped.set()
+        if self._renderer is not None:
+            self._renderer.join()
+            self._renderer = None
+
     def clear(self):
+        self.stop()
         self._ts.clear()
 
     def finish(self):
+        self.stop()
         self._ts.finish()
 
     def error(self, msg, exc=None):
         self.errors = True
 
         logging.error(msg, exc_info=exc)
-        self._ts.error('ERROR: %s' % msg)
+        with self._lock:
+            self._ts.error('ERROR: %s' % msg)
 
     def what(self, what_what):
         if self.started is None:
             self.started = time.time()
-        self._ts['what'] = what_what
-        self._ts.flush()
-
-    def update_progress(self):
-        self._ts['not-shown'] = 'not shown'
+            self._start_rendering()
+        self.what_text = what_what
 
     def update_progress_with_file(self, filename, metadata):
-        self._ts['what'] = filename
-        self._ts['current-file'] = filename
+        self.what_text = filename
+        self.current_file = filename
         self.file_count += 1
 
     def update_progress_with_scanned(self, amount):
         self.scanned_bytes += amount
-        self._ts['scanned-bytes'] = self.scanned_bytes
 
     def update_progress_with_upload(self, amount):
         self.uploaded_bytes += amount
-        self._ts['uploaded-bytes'] = self.uploaded_bytes
 
     def update_progress_with_removed_checkpoint(self, gen):
-        self._ts['checkpoint'] = gen
+        self.removed_checkpoint = gen
+
+    def get_stats(self, fs, phase_stats=None):
+        '''Return the statistics of the backup run as a dict.
 
-    def report_stats(self, output, fs, quiet):
+        The dict can be serialised as JSON as is.
+
+        '''
+
+        stats = {
+            'files-found': self.file_count,
+            'files-backed-up': self.backed_up_count,
+            'scanned-bytes': self.scanned_bytes,
+            'uploaded-chunk-bytes': self.uploaded_bytes,
+            'bytes-written': fs.bytes_written,
+            'bytes-read': fs.bytes_read,
+            'duration': time.time() - self.started,
+        }
+        if phase_stats is not None:
+            stats.update(phase_stats.as_dict())
+        return stats
+
+    def report_stats(self, output, fs, quiet, phase_stats=None,
+                     verbose=False):
         duration = time.time() - self.started
         duration_string = obnamlib.humanise_duration(duration)
 
@@ -142,6 +215,20 @@ class BackupProgress(object):
             '* average speed: %s %s',
             speed_amount, speed_unit)
 
+        phase_lines = []
+        if phase_stats is not None:
+            for phase in phase_stats.get_phases():
+                phase_lines.append(
+                    '%s: %.3f s in %d calls' %
+                    (phase,
+                     phase_stats.get_time(phase),
+                     phase_stats.get_calls(phase)))
+            for name in phase_stats.get_counters():
+                phase_lines.append(
+                    '%s: %d' % (name, phase_stats.get_counter(name)))
+        for line in phase_lines:
+            logging.info('* %s', line)
+
         scanned_amount, scanned_unit = obnamlib.humanise_size(
             self.scanned_bytes)
 
@@ -172,3 +259,7 @@ class BackupProgress(object):
                  overhead_amount,
                  overhead_unit,
                  overhead_percent))
+            if verbose and phase_lines:
+                output.write('Time spent in phases of the backup:\n')
+                for line in phase_lines:
+                    output.write('  %s\n' % line)
@@ -23,9 +23,9 @@ import random
 import obnamlib
 
 
-# Start with a new random id after this many sequential ones.
-# This avoids putting all the ids in one directory.
-MAX_IDS_UNTIL_RESET = 512
+# Bag ids are reserved in blocks of this many consecutive ids. The
+# ids in a block all go into the same directory.
+IDS_PER_BLOCK = 512
 
 
 class BagStore(object):
@@ -34,19 +34,24 @@ class BagStore(object):
         self._fs = None
         self._dirname = None
         self._id_inventor = IdInventor()
-        self._id_inventor.set_filename_maker(self._make_bag_filename)
+        self._id_inventor.set_marker_maker(self._make_block_marker_filename)
 
     def _make_bag_filename(self, bag_id):
         if isinstance(bag_id, str):
             return os.path.join(self._dirname, '%s.bag' % bag_id)
+        return self._make_numbered_filename(bag_id, '.bag')
 
-        basename = '%016x' % bag_id
+    def _make_block_marker_filename(self, first_id):
+        return self._make_numbered_filename(first_id, '.ids')
+
+    def _make_numbered_filename(self, number, suffix):
+        basename = '%016x' % number
         return os.path.join(
             self._dirname,
             basename[0:2],
             basename[2:4],
             basename[4:6],
-            '%s.bag' % basename)
+            basename + suffix)
 
     def set_location(self, fs, dirname):
         self._fs = fs
@@ -56,6 +61,16 @@ class BagStore(object):
     def reserve_bag_id(self):
         return self._id_inventor.reserve_id()
 
+    def release_unused_bag_ids(self):
+        '''Let others use the reserved bag ids that haven't been used.
+
+        Bags with ids already reserved must have been put before this
+        is called, or their ids may be reserved by someone else.
+
+        '''
+
+        self._id_inventor.release_ids()
+
     def put_bag(self, bag):
         filename = self._make_bag_filename(bag.get_id())
         serialised = serialise_bag(bag)
@@ -66,6 +81,10 @@ class BagStore(object):
         serialised = self._fs.cat(filename)
         return deserialise_bag(serialised)
 
+    def prefetch_bags(self, bag_ids):
+        self._fs.prefetch(
+            [self._make_bag_filename(bag_id) for bag_id in bag_ids])
+
     def has_bag(self, bag_id):
         filename = self._make_bag_filename(bag_id)
         try:
@@ -84,7 +103,13 @@ class BagStore(object):
 
     def _get_bag_id_from_filename(self, pathname):
         basename = os.path.basename(pathname)
-        return int(basename[:-len('.bag')], 16)
+        name = basename[:-len('.bag')]
+        try:
+            return int(name, 16)
+        except ValueError:
+            # Bags with well-known names, such as "root", keep their
+            # name as the id.
+            return name
 
     def remove_bag(self, bag_id):
         filename = self._make_bag_filename(bag_id)
@@ -93,50 +118,75 @@ class BagStore(object):
 
 class IdInventor(object):
 
+    '''Invent ids for new bags.
+
+    Ids are reserved a block at a time, by creating a marker file for
+    a block of IDS_PER_BLOCK consecutive ids, starting at a random,
+    aligned id. The ids in the block are then handed out without
+    touching the filesystem. Nobody else reserves a block that has a
+    marker file.
+
+    When the ids are released, the marker files of all blocks reserved
+    so far are removed, and the unused ids in them may be reserved
+    again later. Ids of bags that exist by then are skipped. If Obnam
+    crashes before releasing the ids, the marker files stay, and the
+    unused ids are never used. There are plenty of ids.
+
+    '''
+
     def __init__(self):
+        self._marker_maker = None
         self.set_fs(None)
-        self._filename_maker = None
 
     def set_fs(self, fs):
         self._fs = fs
-        self._reset_ids()
+        self._forget_blocks()
 
-    def _reset_ids(self):
-        self._prev_id = None
-        self._ids_since_reset = 0
-        self._max_ids_until_reset = MAX_IDS_UNTIL_RESET
+    def _forget_blocks(self):
+        self._markers = []
+        self._free_ids = []
 
-    def set_filename_maker(self, maker):
-        self._filename_maker = maker
+    def set_marker_maker(self, maker):
+        self._marker_maker = maker
 
     def reserve_id(self):
-        while True:
-            if self._time_to_reset_ids():  # pragma: no cover
-                self._reset_ids()
-            self._next_id()
-            if self._reserve_succeeds():
-                return self._prev_id
-            self._prev_id = None  # pragma: no cover
-
-    def _time_to_reset_ids(self):
-        return self._ids_since_reset >= self._max_ids_until_reset
-
-    def _next_id(self):
-        if self._prev_id is None:
-            self._prev_id = random.randint(0, obnamlib.MAX_ID)
-        else:
-            self._prev_id += 1  # pragma: no cover
-        self._ids_since_reset += 1
-
-    def _reserve_succeeds(self):
-        filename = self._filename_maker(self._prev_id)
+        while not self._free_ids:
+            self._reserve_block()
+        return self._free_ids.pop()
+
+    def _reserve_block(self):
+        first = random.randint(0, obnamlib.MAX_ID) & ~(IDS_PER_BLOCK - 1)
+        marker = self._marker_maker(first)
         try:
-            self._fs.write_file(filename, '')
+            self._fs.write_file(marker, '')
         except OSError as e:  # pragma: no cover
             if e.errno == errno.EEXIST:
-                return False
+                return
             raise
-        return True
+        self._markers.append(marker)
+
+        used = self._find_used_ids(os.path.dirname(marker))
+        ids = [first + i for i in xrange(IDS_PER_BLOCK)]
+        self._free_ids = [x for x in reversed(ids) if x not in used]
+
+    def _find_used_ids(self, dirname):
+        used = set()
+        for name in self._fs.listdir(dirname):
+            if name.endswith('.bag'):
+                try:
+                    used.add(int(name[:-len('.bag')], 16))
+                except ValueError:  # pragma: no cover
+                    pass
+        return used
+
+    def release_ids(self):
+        for marker in self._markers:
+            try:
+                self._fs.remove(marker)
+            except OSError as e:  # pragma: no cover
+                if e.errno != errno.ENOENT:
+                    raise
+        self._forget_blocks()
 
 
 def serialise_bag(bag):
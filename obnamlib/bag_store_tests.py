@@ -16,6 +16,8 @@
 # =*= License: GPL-3+ =*=
 
 
+import os
+import random
 import shutil
 import tempfile
 import unittest
@@ -80,3 +82,77 @@ class BagStoreTests(unittest.TestCase):
         self.store.put_bag(self.bag)
         returned = self.store.get_bag('well-known')
         self.assertEqualBags(returned, self.bag)
+
+    def test_lists_bag_with_nonnumeric_id(self):
+        self.bag.set_id('well-known')
+        self.store.put_bag(self.bag)
+        self.assertEqual(list(self.store.get_bag_ids()), ['well-known'])
+
+
+class BagIdReservationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.fs = obnamlib.LocalFS(self.tempdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def new_store(self):
+        store = obnamlib.BagStore()
+        store.set_location(self.fs, 'bags')
+        return store
+
+    def find_files(self):
+        result = []
+        for _, _, basenames in os.walk(self.tempdir):
+            result += basenames
+        return result
+
+    def put_bag(self, store, bag_id):
+        bag = obnamlib.Bag()
+        bag.set_id(bag_id)
+        store.put_bag(bag)
+
+    def test_reserves_different_ids(self):
+        store = self.new_store()
+        ids = [store.reserve_bag_id() for i in range(1000)]
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_reserves_block_of_ids_with_one_marker_file(self):
+        store = self.new_store()
+        ids = [store.reserve_bag_id() for i in range(10)]
+        self.assertEqual(ids, range(ids[0], ids[0] + 10))
+        files = self.find_files()
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith('.ids'))
+
+    def test_removes_marker_file_when_releasing_ids(self):
+        store = self.new_store()
+        self.put_bag(store, store.reserve_bag_id())
+        store.release_unused_bag_ids()
+        files = self.find_files()
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith('.bag'))
+
+    def test_does_not_reserve_ids_from_block_reserved_by_another(self):
+        random.seed(0)
+        store1 = self.new_store()
+        id1 = store1.reserve_bag_id()
+        random.seed(0)
+        store2 = self.new_store()
+        id2 = store2.reserve_bag_id()
+        self.assertNotEqual(
+            id1 / obnamlib.IDS_PER_BLOCK, id2 / obnamlib.IDS_PER_BLOCK)
+
+    def test_skips_ids_of_existing_bags_in_released_block(self):
+        random.seed(0)
+        store1 = self.new_store()
+        id1 = store1.reserve_bag_id()
+        self.put_bag(store1, id1)
+        store1.release_unused_bag_ids()
+
+        random.seed(0)
+        store2 = self.new_store()
+        id2 = store2.reserve_bag_id()
+        self.assertEqual(id2, id1 + 1)
@@ -34,7 +34,7 @@ class BlobStore(object):
     def set_max_bag_size(self, max_bag_size):
         self._max_bag_size = max_bag_size
 
-    def set_max_cache_bytes(self, max_bytes):  # pragma: no cover
+    def set_max_cache_bytes(self, max_bytes):
         self._cached_blobs.set_max_bytes(max_bytes)
 
     def get_blob(self, blob_id):
@@ -51,6 +51,56 @@ class BlobStore(object):
             return bag[index]
         return None
 
+    def get_blobs(self, blob_ids):
+        '''Generate (blob_id, blob) pairs for several blobs.
+
+        The blobs are grouped by the bag they are in, so that each bag
+        is read at most once, no matter what order the ids are given
+        in. Each distinct blob id is returned once. A blob that does
+        not exist is returned as None.
+
+        '''
+
+        wanted = {}
+        for blob_id in set(blob_ids):
+            bag_id, index = obnamlib.parse_object_id(blob_id)
+            wanted.setdefault(bag_id, []).append((index, blob_id))
+
+        # Let the filesystem start reading all the bags we need,
+        # before we wait for the first one.
+        self._bag_store.prefetch_bags(
+            [bag_id for bag_id in sorted(wanted)
+             if not self._have_blobs_in_memory(bag_id, wanted[bag_id])])
+
+        for bag_id in sorted(wanted):
+            indexes = sorted(wanted[bag_id])
+            bag = self._get_bag_for_blobs(bag_id, indexes)
+            for index, blob_id in indexes:
+                if bag is None:
+                    yield blob_id, None
+                elif bag is self._cached_blobs:
+                    yield blob_id, self._cached_blobs.get(blob_id)
+                else:
+                    yield blob_id, bag[index]
+
+    def _have_blobs_in_memory(self, bag_id, indexes):
+        if self._bag and bag_id == self._bag.get_id():
+            return True
+        return all(blob_id in self._cached_blobs for _, blob_id in indexes)
+
+    def _get_bag_for_blobs(self, bag_id, indexes):
+        if self._bag and bag_id == self._bag.get_id():
+            return self._bag
+        if all(blob_id in self._cached_blobs for _, blob_id in indexes):
+            return self._cached_blobs
+        if self._bag_store.has_bag(bag_id):
+            bag = self._bag_store.get_bag(bag_id)
+            for i, this_blob in enumerate(bag):
+                this_id = obnamlib.make_object_id(bag_id, i)
+                self._cached_blobs.put(this_id, this_blob)
+            return bag
+        return None
+
     def put_blob(self, blob):
         if self._bag is None:
             self._bag = self._new_bag()
@@ -82,6 +132,11 @@ class BlobStore(object):
             self._bag_store.put_bag(self._bag)
             self._bag = None
 
+    def release_unused_bag_ids(self):
+        # Call this after flush, or when any unflushed blobs are
+        # going to be thrown away.
+        self._bag_store.release_unused_bag_ids()
+
 
 class BlobCache(object):
 
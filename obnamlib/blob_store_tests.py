@@ -16,6 +16,9 @@
 # =*= License: GPL-3+ =*=
 
 
+import os
+import shutil
+import tempfile
 import unittest
 
 import obnamlib
@@ -98,6 +101,75 @@ class BlobStoreTests(unittest.TestCase):
         retrieved = blob_store.get_blob(blob_id)
         self.assertEqual(blob, retrieved)
 
+    def test_gets_several_blobs_reading_each_bag_once(self):
+        bag_store = DummyBagStore()
+
+        blob_store = obnamlib.BlobStore()
+        blob_store.set_bag_store(bag_store)
+        blob_store.set_max_bag_size(2)
+        blob_store.set_max_cache_bytes(0)
+        blob_ids = [blob_store.put_blob(x) for x in ['a', 'b', 'c', 'd']]
+        blob_store.flush()
+
+        wanted = [blob_ids[3], blob_ids[0], blob_ids[2], blob_ids[1]]
+        got = dict(blob_store.get_blobs(wanted + wanted))
+        self.assertEqual(
+            got,
+            dict(zip(blob_ids, ['a', 'b', 'c', 'd'])))
+        self.assertEqual(bag_store.bags_read, 2)
+
+    def test_gets_several_unflushed_blobs(self):
+        bag_store = DummyBagStore()
+
+        blob_store = obnamlib.BlobStore()
+        blob_store.set_bag_store(bag_store)
+        blob_store.set_max_bag_size(1024)
+        blob_ids = [blob_store.put_blob(x) for x in ['a', 'b']]
+        self.assertTrue(bag_store.is_empty())
+
+        got = dict(blob_store.get_blobs(blob_ids))
+        self.assertEqual(got, dict(zip(blob_ids, ['a', 'b'])))
+        self.assertEqual(bag_store.bags_read, 0)
+
+    def test_gets_several_cached_blobs_without_reading_bag_again(self):
+        bag_store = DummyBagStore()
+
+        blob_store = obnamlib.BlobStore()
+        blob_store.set_bag_store(bag_store)
+        blob_store.set_max_bag_size(1024)
+        blob_ids = [blob_store.put_blob(x) for x in ['a', 'b']]
+        blob_store.flush()
+
+        self.assertEqual(blob_store.get_blob(blob_ids[0]), 'a')
+        self.assertEqual(bag_store.bags_read, 1)
+        got = dict(blob_store.get_blobs(blob_ids))
+        self.assertEqual(got, dict(zip(blob_ids, ['a', 'b'])))
+        self.assertEqual(bag_store.bags_read, 1)
+
+    def test_prefetches_only_bags_it_needs_to_read(self):
+        bag_store = DummyBagStore()
+
+        blob_store = obnamlib.BlobStore()
+        blob_store.set_bag_store(bag_store)
+        blob_store.set_max_bag_size(1)
+        blob_ids = [blob_store.put_blob(x) for x in ['a', 'b', 'c']]
+        self.assertEqual(blob_store.get_blob(blob_ids[0]), 'a')
+
+        got = dict(blob_store.get_blobs(blob_ids))
+        self.assertEqual(got, dict(zip(blob_ids, ['a', 'b', 'c'])))
+        self.assertEqual(
+            bag_store.bags_prefetched,
+            [obnamlib.parse_object_id(x)[0] for x in blob_ids[1:]])
+
+    def test_gets_None_for_missing_blobs(self):
+        bag_store = DummyBagStore()
+
+        blob_store = obnamlib.BlobStore()
+        blob_store.set_bag_store(bag_store)
+        blob_id = obnamlib.make_object_id(123, 456)
+        self.assertEqual(
+            list(blob_store.get_blobs([blob_id])), [(blob_id, None)])
+
     def test_returns_None_if_well_known_blog_does_not_exist(self):
         bag_store = DummyBagStore()
         well_known_id = 'bobby'
@@ -123,11 +195,43 @@ class BlobStoreTests(unittest.TestCase):
         self.assertEqual(well_known_blob, retrieved)
 
 
+class BlobStoreBagIdTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.fs = obnamlib.LocalFS(self.tempdir)
+        self.bag_store = obnamlib.BagStore()
+        self.bag_store.set_location(self.fs, '.')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def find_marker_files(self):
+        return [
+            basename
+            for dirname, subdirs, basenames in os.walk(self.tempdir)
+            for basename in basenames
+            if basename.endswith('.ids')]
+
+    def test_releases_unused_bag_ids(self):
+        blob_store = obnamlib.BlobStore()
+        blob_store.set_bag_store(self.bag_store)
+        blob_id = blob_store.put_blob('blob')
+        blob_store.flush()
+        self.assertEqual(len(self.find_marker_files()), 1)
+
+        blob_store.release_unused_bag_ids()
+        self.assertEqual(self.find_marker_files(), [])
+        self.assertEqual(blob_store.get_blob(blob_id), 'blob')
+
+
 class DummyBagStore(object):
 
     def __init__(self):
         self._bags = {}
         self._prev_id = 0
+        self.bags_read = 0
+        self.bags_prefetched = []
 
     def is_empty(self):
         return len(self._bags) == 0
@@ -142,5 +246,9 @@ class DummyBagStore(object):
     def has_bag(self, bag_id):
         return bag_id in self._bags
 
+    def prefetch_bags(self, bag_ids):
+        self.bags_prefetched.extend(bag_ids)
+
     def get_bag(self, bag_id):
+        self.bags_read += 1
         return self._bags[bag_id]
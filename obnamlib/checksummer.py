@@ -21,21 +21,43 @@ import hashlib
 import obnamlib
 
 
+# BLAKE2 is in hashlib from Python 3.6 on. For older Pythons, use the
+# pyblake2 module, if it is installed. If neither is available, the
+# algorithms are still known, so that we can give a helpful error
+# message for a repository that uses them, but they can't be chosen
+# for new repositories.
+
+def _find_blake2(name):
+    func = getattr(hashlib, name, None)
+    if func is None:
+        try:
+            import pyblake2
+        except ImportError:
+            return None
+        func = getattr(pyblake2, name, None)
+    return func
+
+
 _algorithm_list = [
     ('md5', obnamlib.REPO_FILE_MD5, hashlib.md5),
     ('sha224', obnamlib.REPO_FILE_SHA224, hashlib.sha224),
     ('sha256', obnamlib.REPO_FILE_SHA256, hashlib.sha256),
     ('sha384', obnamlib.REPO_FILE_SHA384, hashlib.sha384),
     ('sha512', obnamlib.REPO_FILE_SHA512, hashlib.sha512),
+    ('blake2b', obnamlib.REPO_FILE_BLAKE2B, _find_blake2('blake2b')),
+    ('blake2s', obnamlib.REPO_FILE_BLAKE2S, _find_blake2('blake2s')),
 ]
 
 
-checksum_algorithms = [_name for _name, _, _ in _algorithm_list]
+checksum_algorithms = [
+    _name for _name, _, _func in _algorithm_list if _func is not None]
 
 
 def get_checksum_algorithm(wanted):
     for name, _, func in _algorithm_list:
         if wanted == name:
+            if func is None:
+                raise ChecksumAlgorithmNotAvailable(algorithm=wanted)
             return func()
     raise UnknownChecksumAlgorithm(algorithm=wanted)
 
@@ -58,3 +80,10 @@ def get_checksum_algorithm_key(wanted_name):
 class UnknownChecksumAlgorithm(obnamlib.ObnamError):
 
     msg = 'Unknown checksum algorithm {algorithm}.'
+
+
+class ChecksumAlgorithmNotAvailable(obnamlib.ObnamError):
+
+    msg = (
+        'Checksum algorithm {algorithm} is not available: '
+        'it needs Python 3.6 or the pyblake2 module.')
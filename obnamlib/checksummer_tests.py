@@ -16,6 +16,8 @@
 # =*= License: GPL-3+ =*=
 
 
+import sys
+import types
 import unittest
 
 import obnamlib
@@ -73,3 +75,55 @@ class TestGetChecksummer(unittest.TestCase):
             self.assertNotEqual(hexdigest, '')
             for c in hexdigest:
                 self.assertTrue(c in '0123456789abcdef')
+
+    def test_finds_file_key_from_name_for_blake2b(self):
+        self.assertEqual(
+            obnamlib.get_checksum_algorithm_key('blake2b'),
+            obnamlib.REPO_FILE_BLAKE2B)
+
+    def test_offers_blake2b_only_if_it_is_available(self):
+        try:
+            obnamlib.get_checksum_algorithm('blake2b')
+        except obnamlib.ChecksumAlgorithmNotAvailable:
+            self.assertFalse('blake2b' in obnamlib.checksum_algorithms)
+        else:
+            self.assertTrue('blake2b' in obnamlib.checksum_algorithms)
+
+    def test_raises_error_if_algorithm_is_not_available(self):
+        checksummer = obnamlib.checksummer
+        algorithms = checksummer._algorithm_list
+        checksummer._algorithm_list = [
+            ('blake2b', obnamlib.REPO_FILE_BLAKE2B, None)]
+        try:
+            self.assertRaises(
+                obnamlib.ChecksumAlgorithmNotAvailable,
+                obnamlib.get_checksum_algorithm, 'blake2b')
+        finally:
+            checksummer._algorithm_list = algorithms
+
+
+class FindBlake2Tests(unittest.TestCase):
+
+    # The tests use a name hashlib doesn't have, so that the pyblake2
+    # module is looked at, even if hashlib has BLAKE2.
+
+    def setUp(self):
+        self.module = sys.modules.get('pyblake2')
+
+    def tearDown(self):
+        if self.module is None:
+            sys.modules.pop('pyblake2', None)
+        else:
+            sys.modules['pyblake2'] = self.module
+
+    def test_finds_algorithm_in_pyblake2(self):
+        pyblake2 = types.ModuleType('pyblake2')
+        pyblake2.blake2x = object()
+        sys.modules['pyblake2'] = pyblake2
+        self.assertEqual(
+            obnamlib.checksummer._find_blake2('blake2x'), pyblake2.blake2x)
+
+    def test_finds_nothing_without_pyblake2(self):
+        # None in sys.modules makes importing the module fail.
+        sys.modules['pyblake2'] = None
+        self.assertEqual(obnamlib.checksummer._find_blake2('blake2x'), None)
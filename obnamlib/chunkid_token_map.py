@@ -37,6 +37,9 @@ class ChunkIdTokenMap(object):
     def get(self, token):
         return self._mapping.get(token, [])
 
+    def get_tokens(self):
+        return self._mapping.keys()
+
     def clear(self):
         self._mapping.clear()
 
@@ -58,6 +58,12 @@ class ChunkIdTokenMapTests(unittest.TestCase):
         self.map.add(chunk_id, token)
         self.assertEqual(self.map.get(token), [chunk_id])
 
+    def test_returns_tokens(self):
+        self.map.add('123', 'foo')
+        self.map.add('456', 'bar')
+        self.map.add('789', 'foo')
+        self.assertEqual(sorted(self.map.get_tokens()), ['bar', 'foo'])
+
     def test_clears_itself(self):
         chunk_id = '123'
         token = 'foobar'
@@ -29,6 +29,13 @@ DEFAULT_DIR_BAG_BYTES = 1 * _MEBIBYTE
 DEFAULT_DIR_CACHE_BYTES = 256 * _MEBIBYTE
 DEFAULT_CHUNK_BAG_BYTES = 1 * _MEBIBYTE
 DEFAULT_CHUNK_CACHE_BYTES = 1 * _MEBIBYTE
+DEFAULT_RESTORE_BATCH_BYTES = 64 * _MEBIBYTE
+DEFAULT_FUSE_CHUNK_CACHE_BYTES = 64 * _MEBIBYTE
+DEFAULT_FUSE_READ_AHEAD_CHUNKS = 4
+DEFAULT_FUSE_METADATA_CACHE_ENTRIES = 64 * 1024
+DEFAULT_FUSE_REPOSITORY_HANDLES = 4
+DEFAULT_FSCK_WORKERS = 4
+DEFAULT_MOVED_FILE_MIN_SIZE = 1 * _MEBIBYTE
 
 # The following values have been determined empirically on a laptop
 # with an encrypted ext4 filesystem. Other values might be better for
@@ -30,6 +30,9 @@ class RepositoryDelegator(obnamlib.RepositoryInterface):
         self._hooks = kwargs['hooks']
         self._lock_timeout = kwargs.get('lock_timeout', 0)
         self._lockmgr = None
+        self._phase_stats = (
+            kwargs.get('phase_stats') or obnamlib.PhaseStats())
+        self._vfs_latency = kwargs.get('vfs_latency')
 
         self._client_list = None
         self._chunk_store = None
@@ -57,7 +60,10 @@ class RepositoryDelegator(obnamlib.RepositoryInterface):
         return self._fs.fs
 
     def set_fs(self, fs):
-        self._fs = obnamlib.RepositoryFS(self, fs, self._hooks)
+        self._fs = obnamlib.RepositoryFS(
+            self, fs, self._hooks, phase_stats=self._phase_stats)
+        if self._vfs_latency is not None:
+            self._vfs_latency.instrument('repository-filtered', self._fs)
         self._lockmgr = obnamlib.LockManager(self._fs, self._lock_timeout, '')
 
         self._client_list.set_fs(self._fs)
@@ -108,6 +114,7 @@ class RepositoryDelegator(obnamlib.RepositoryInterface):
     def commit_client_list(self):
         self._require_we_got_client_list_lock()
         self._client_list.commit()
+        self._fs.sync()
 
     def got_client_list_lock(self):
         dirname = self._client_list.get_dirname()
@@ -185,7 +192,9 @@ class RepositoryDelegator(obnamlib.RepositoryInterface):
     def commit_client(self, client_name):
         self._require_got_client_lock(client_name)
         client = self._lookup_client(client_name)
-        client.commit()
+        with self._phase_stats.timer('commit-client'):
+            client.commit()
+            self._fs.sync()
 
     def got_client_lock(self, client_name):
         client = self._lookup_client(client_name)
@@ -309,11 +318,15 @@ class RepositoryDelegator(obnamlib.RepositoryInterface):
     def get_chunk_content(self, chunk_id):
         return self._chunk_store.get_chunk_content(chunk_id)
 
+    def get_chunk_contents(self, chunk_ids):
+        return self._chunk_store.get_chunk_contents(chunk_ids)
+
     def has_chunk(self, chunk_id):
         return self._chunk_store.has_chunk(chunk_id)
 
     def flush_chunks(self):
-        self._chunk_store.flush_chunks()
+        with self._phase_stats.timer('flush-chunks'):
+            self._chunk_store.flush_chunks()
 
     def get_chunk_ids(self):
         return self._chunk_store.get_chunk_ids()
@@ -322,11 +335,10 @@ class RepositoryDelegator(obnamlib.RepositoryInterface):
     # Chunk indexes methods.
     #
 
-    def lock_chunk_indexes(self):
+    def lock_chunk_indexes(self, tokens=None):
         self._require_we_have_not_locked_chunk_indexes()
-        dirname = self._chunk_indexes.get_dirname()
-        self._fs.create_and_init_toplevel(dirname)
-        self._lockmgr.lock([dirname])
+        self._fs.create_and_init_toplevel(self._chunk_indexes.get_dirname())
+        self._lockmgr.lock(self._chunk_indexes.get_lock_dirnames(tokens))
         self._chunk_indexes.clear()
 
     def _require_we_have_not_locked_chunk_indexes(self):
@@ -336,31 +348,52 @@ class RepositoryDelegator(obnamlib.RepositoryInterface):
     def unlock_chunk_indexes(self):
         self._require_we_got_chunk_indexes_lock()
         self._chunk_indexes.clear()
-        dirname = self._chunk_indexes.get_dirname()
-        self._lockmgr.unlock([dirname])
+        self._lockmgr.unlock(self._get_locked_chunk_index_dirnames())
+
+    def _get_locked_chunk_index_dirnames(self):
+        return [
+            dirname
+            for dirname in self._chunk_indexes.get_lock_dirnames()
+            if self._lockmgr.got_lock(dirname)]
+
+    def _require_we_got_chunk_indexes_lock(self, tokens=None):
+        # Without tokens, any part of the chunk indexes will do.
+        # Otherwise, we need the parts for all the tokens.
+        if tokens is None:
+            ok = self.got_chunk_indexes_lock()
+        else:
+            ok = all(
+                self._lockmgr.got_lock(dirname)
+                for dirname in self._chunk_indexes.get_lock_dirnames(tokens))
+        if not ok:
+            raise obnamlib.RepositoryChunkIndexesNotLocked()
 
-    def _require_we_got_chunk_indexes_lock(self):
-        if not self.got_chunk_indexes_lock():
+    def _require_we_got_all_chunk_indexes_locks(self):
+        dirnames = self._chunk_indexes.get_lock_dirnames()
+        if self._get_locked_chunk_index_dirnames() != dirnames:
             raise obnamlib.RepositoryChunkIndexesNotLocked()
 
     def commit_chunk_indexes(self):
         self._require_we_got_chunk_indexes_lock()
-        self._chunk_indexes.commit()
+        with self._phase_stats.timer('commit-chunk-indexes'):
+            self._chunk_indexes.commit()
+            self._fs.sync()
 
     def got_chunk_indexes_lock(self):
-        dirname = self._chunk_indexes.get_dirname()
-        return self._lockmgr.got_lock(dirname)
+        return bool(self._get_locked_chunk_index_dirnames())
 
     def force_chunk_indexes_lock(self):
-        dirname = self._chunk_indexes.get_dirname()
-        self._lockmgr.force([dirname])
+        self._lockmgr.force(self._chunk_indexes.get_lock_dirnames())
         self._chunk_indexes.clear()
 
+    def get_chunk_index_lock_groups(self, tokens):
+        return self._chunk_indexes.get_lock_groups(tokens)
+
     def prepare_chunk_for_indexes(self, chunk_content):
         return self._chunk_indexes.prepare_chunk_for_indexes(chunk_content)
 
     def put_chunk_into_indexes(self, chunk_id, token, client_id):
-        self._require_we_got_chunk_indexes_lock()
+        self._require_we_got_chunk_indexes_lock([token])
         return self._chunk_indexes.put_chunk_into_indexes(
             chunk_id, token, client_id)
 
@@ -368,15 +401,15 @@ class RepositoryDelegator(obnamlib.RepositoryInterface):
         return self._chunk_indexes.find_chunk_ids_by_token(token)
 
     def remove_chunk_from_indexes(self, chunk_id, client_id):
-        self._require_we_got_chunk_indexes_lock()
+        self._require_we_got_all_chunk_indexes_locks()
         self._chunk_indexes.remove_chunk_from_indexes(chunk_id, client_id)
 
     def remove_chunk_from_indexes_for_all_clients(self, chunk_id):
-        self._require_we_got_chunk_indexes_lock()
+        self._require_we_got_all_chunk_indexes_locks()
         self._chunk_indexes.remove_chunk_from_indexes_for_all_clients(chunk_id)
 
     def remove_unused_chunks(self):
-        self._require_we_got_chunk_indexes_lock()
+        self._require_we_got_all_chunk_indexes_locks()
         # Note that we need to give remove_unused_chunks the chunk
         # store as an argument, so that it can actually remove chunks.
         return self._chunk_indexes.remove_unused_chunks(self._chunk_store)
@@ -18,11 +18,13 @@ import os
 import shutil
 import subprocess
 import tempfile
-import tracing
 
 import obnamlib
 
 
+tracer = obnamlib.Tracer(__file__)
+
+
 class EncryptionError(obnamlib.ObnamError):
 
     pass
@@ -37,7 +39,7 @@ class GpgError(EncryptionError):
 def generate_symmetric_key(numbits, filename='/dev/random'):
     '''Generate a random key of at least numbits for symmetric encryption.'''
 
-    tracing.trace('numbits=%d', numbits)
+    tracer.trace('numbits=%d', numbits)
 
     count = (numbits + 7) / 8
     f = open(filename, 'rb')
@@ -120,10 +122,10 @@ def _gpg(args, stdin='', gpghome=None):
     env.update(os.environ)
     if gpghome is not None:
         env['GNUPGHOME'] = gpghome
-        tracing.trace('gpghome=%s' % gpghome)
+        tracer.trace('gpghome=%s', gpghome)
 
     argv = ['gpg', '-q', '--batch', '--no-textmode'] + args
-    tracing.trace('argv=%s', repr(argv))
+    tracer.trace('argv=%r', argv)
     p = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
                          stderr=subprocess.PIPE, env=env)
     out, err = p.communicate(stdin)
@@ -15,11 +15,13 @@
 
 
 import struct
-import tracing
 
 import obnamlib
 
 
+tracer = obnamlib.Tracer(__file__)
+
+
 class ChecksumTree(obnamlib.RepositoryTree):
 
     '''Repository map of checksum to integer id.
@@ -31,7 +33,7 @@ class ChecksumTree(obnamlib.RepositoryTree):
 
     def __init__(self, fs, name, checksum_length, node_size,
                  upload_queue_size, lru_size, hooks):
-        tracing.trace('new ChecksumTree name=%s' % name)
+        tracer.trace('new ChecksumTree name=%s', name)
         self.fmt = '!%dsQQ' % checksum_length
         key_bytes = struct.calcsize(self.fmt)
         obnamlib.RepositoryTree.__init__(self, fs, name, key_bytes, node_size,
@@ -49,9 +51,9 @@ class ChecksumTree(obnamlib.RepositoryTree):
         return struct.unpack(self.fmt, key)
 
     def add(self, checksum, chunk_id, client_id):
-        tracing.trace('checksum=%s', repr(checksum))
-        tracing.trace('chunk_id=%s', chunk_id)
-        tracing.trace('client_id=%s', client_id)
+        tracer.trace('checksum=%r', checksum)
+        tracer.trace('chunk_id=%s', chunk_id)
+        tracer.trace('client_id=%s', client_id)
         self.start_changes()
         key = self.key(checksum, chunk_id, client_id)
         self.tree.insert(key, '')
@@ -67,16 +69,16 @@ class ChecksumTree(obnamlib.RepositoryTree):
             return []
 
     def remove(self, checksum, chunk_id, client_id):
-        tracing.trace('checksum=%s', repr(checksum))
-        tracing.trace('chunk_id=%s', chunk_id)
-        tracing.trace('client_id=%s', client_id)
+        tracer.trace('checksum=%r', checksum)
+        tracer.trace('chunk_id=%s', chunk_id)
+        tracer.trace('client_id=%s', client_id)
         self.start_changes()
         key = self.key(checksum, chunk_id, client_id)
         self.tree.remove_range(key, key)
 
     def remove_for_all_clients(self, checksum, chunk_id):
-        tracing.trace('checksum=%s', repr(checksum))
-        tracing.trace('chunk_id=%s', chunk_id)
+        tracer.trace('checksum=%r', checksum)
+        tracer.trace('chunk_id=%s', chunk_id)
         self.start_changes()
         self.tree.remove_range(*self.key_range(checksum, chunk_id))
 
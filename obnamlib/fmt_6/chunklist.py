@@ -15,11 +15,13 @@
 
 
 import struct
-import tracing
 
 import obnamlib
 
 
+tracer = obnamlib.Tracer(__file__)
+
+
 class ChunkList(obnamlib.RepositoryTree):
 
     '''Repository's list of chunks.
@@ -32,7 +34,7 @@ class ChunkList(obnamlib.RepositoryTree):
     '''
 
     def __init__(self, fs, node_size, upload_queue_size, lru_size, hooks):
-        tracing.trace('new ChunkList')
+        tracer.trace('new ChunkList')
         self.fmt = '!Q'
         self.key_bytes = struct.calcsize(self.fmt)
         obnamlib.RepositoryTree.__init__(
@@ -44,8 +46,8 @@ class ChunkList(obnamlib.RepositoryTree):
         return struct.pack(self.fmt, chunk_id)
 
     def add(self, chunk_id, checksum):
-        tracing.trace('chunk_id=%s', chunk_id)
-        tracing.trace('checksum=%s', repr(checksum))
+        tracer.trace('chunk_id=%s', chunk_id)
+        tracer.trace('checksum=%r', checksum)
         self.start_changes()
         self.tree.insert(self.key(chunk_id), checksum)
 
@@ -56,7 +58,7 @@ class ChunkList(obnamlib.RepositoryTree):
         raise KeyError(chunk_id)
 
     def remove(self, chunk_id):
-        tracing.trace('chunk_id=%s', chunk_id)
+        tracer.trace('chunk_id=%s', chunk_id)
         self.start_changes()
         key = self.key(chunk_id)
         self.tree.remove_range(key, key)
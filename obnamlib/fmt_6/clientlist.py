@@ -18,11 +18,13 @@ import hashlib
 import logging
 import struct
 import random
-import tracing
 
 import obnamlib
 
 
+tracer = obnamlib.Tracer(__file__)
+
+
 class ClientList(obnamlib.RepositoryTree):
 
     '''Repository's list of clients.
@@ -46,7 +48,7 @@ class ClientList(obnamlib.RepositoryTree):
     SUBKEY_MAX = 255
 
     def __init__(self, fs, node_size, upload_queue_size, lru_size, hooks):
-        tracing.trace('new ClientList')
+        tracer.trace('new ClientList')
         self.hash_len = len(self.hashfunc(''))
         self.fmt = '!%dsQB' % self.hash_len
         self.key_bytes = struct.calcsize(self.fmt)
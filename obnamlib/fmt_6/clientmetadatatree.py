@@ -18,11 +18,13 @@ import hashlib
 import os
 import random
 import struct
-import tracing
 
 import obnamlib
 
 
+tracer = obnamlib.Tracer(__file__)
+
+
 class ClientMetadataTree(obnamlib.RepositoryTree):
 
     '''Store per-client metadata about files.
@@ -70,7 +72,7 @@ class ClientMetadataTree(obnamlib.RepositoryTree):
 
     def __init__(self, fs, client_dir, node_size, upload_queue_size, lru_size,
                  repo):
-        tracing.trace('new ClientMetadataTree, client_dir=%s' % client_dir)
+        tracer.trace('new ClientMetadataTree, client_dir=%s', client_dir)
         key_bytes = len(self.hashkey(0, self.default_file_id(''), 0, 0))
         obnamlib.RepositoryTree.__init__(self, fs, client_dir, key_bytes,
                                          node_size, upload_queue_size,
@@ -86,7 +88,7 @@ class ClientMetadataTree(obnamlib.RepositoryTree):
 
     def default_file_id(self, filename):
         '''Return hash of filename suitable for use as main key.'''
-        tracing.trace(repr(filename))
+        tracer.trace('%r', filename)
 
         def shorthash(s):
             return hashlib.md5(s).digest()[:4]
@@ -214,7 +216,7 @@ class ClientMetadataTree(obnamlib.RepositoryTree):
         return tree.insert(key, struct.pack('!Q', value))
 
     def commit(self):
-        tracing.trace('committing ClientMetadataTree')
+        tracer.trace('committing ClientMetadataTree')
         obnamlib.RepositoryTree.commit(self)
 
     def init_forest(self, *args, **kwargs):
@@ -255,13 +257,13 @@ class ClientMetadataTree(obnamlib.RepositoryTree):
             return []
 
     def start_generation(self):
-        tracing.trace('start new generation')
+        tracer.trace('start new generation')
         self.start_changes()
         gen_id = self.forest.new_id()
         self._insert_int(self.tree, self.genkey(self.GEN_ID), gen_id)
 
     def set_current_generation_is_checkpoint(self, is_checkpoint):
-        tracing.trace('is_checkpoint=%s', is_checkpoint)
+        tracer.trace('is_checkpoint=%s', is_checkpoint)
         value = 1 if is_checkpoint else 0
         key = self.genkey(self.GEN_IS_CHECKPOINT)
         self._insert_int(self.tree, key, value)
@@ -272,7 +274,7 @@ class ClientMetadataTree(obnamlib.RepositoryTree):
         return self._lookup_int(tree, key) or 0
 
     def remove_generation(self, genid):
-        tracing.trace('genid=%s', genid)
+        tracer.trace('genid=%s', genid)
         tree = self.find_generation(genid)
         if tree == self.tree:
             self.tree = None
@@ -349,7 +351,7 @@ class ClientMetadataTree(obnamlib.RepositoryTree):
         self._insert_count(gen_id, self.GEN_TOTAL_DATA, count)
 
     def create(self, filename, encoded_metadata):
-        tracing.trace('filename=%s', filename)
+        tracer.trace('filename=%s', filename)
         file_id = self.set_file_id(filename)
         gen_id = self.get_generation_id(self.tree)
         try:
@@ -358,12 +360,12 @@ class ClientMetadataTree(obnamlib.RepositoryTree):
             old_metadata = None
 
         if encoded_metadata != old_metadata:
-            tracing.trace('new or changed metadata')
+            tracer.trace('new or changed metadata')
             self.set_metadata(filename, encoded_metadata)
 
         # Add to parent's contents, unless already there.
         parent = os.path.dirname(filename)
-        tracing.trace('parent=%s', parent)
+        tracer.trace('parent=%s', parent)
         if parent != filename:  # root dir is its own parent
             basename = os.path.basename(filename)
             parent_id = self.set_file_id(parent)
@@ -372,10 +374,10 @@ class ClientMetadataTree(obnamlib.RepositoryTree):
             # churn in the tree if nothing changes.
             try:
                 self.tree.lookup(key)
-                tracing.trace('was already in parent')  # pragma: no cover
+                tracer.trace('was already in parent')  # pragma: no cover
             except KeyError:
                 self.tree.insert(key, basename)
-                tracing.trace('added to parent')
+                tracer.trace('added to parent')
 
     def get_metadata(self, genid, filename):
         tree = self.find_generation(genid)
@@ -385,7 +387,7 @@ class ClientMetadataTree(obnamlib.RepositoryTree):
         return tree.lookup(key)
 
     def set_metadata(self, filename, encoded_metadata):
-        tracing.trace('filename=%s', filename)
+        tracer.trace('filename=%s', filename)
 
         file_id = self.set_file_id(filename)
         key1 = self.fskey(file_id, self.FILE_NAME, file_id)
@@ -396,7 +398,7 @@ class ClientMetadataTree(obnamlib.RepositoryTree):
         self.tree.insert(key2, encoded_metadata)
 
     def remove(self, filename):
-        tracing.trace('filename=%s', filename)
+        tracer.trace('filename=%s', filename)
 
         file_id = self.get_file_id(self.tree, filename)
         genid = self.get_generation_id(self.tree)
@@ -473,8 +475,8 @@ class ClientMetadataTree(obnamlib.RepositoryTree):
         tree.insert(key, encoded)
 
     def set_file_chunks(self, filename, chunkids):
-        tracing.trace('filename=%s', filename)
-        tracing.trace('chunkids=%s', repr(chunkids))
+        tracer.trace('filename=%s', filename)
+        tracer.trace('chunkids=%r', chunkids)
 
         file_id = self.set_file_id(filename)
         minkey = self.fskey(file_id, self.FILE_CHUNKS, 0)
@@ -490,8 +492,8 @@ class ClientMetadataTree(obnamlib.RepositoryTree):
         self.append_file_chunks(filename, chunkids)
 
     def append_file_chunks(self, filename, chunkids):
-        tracing.trace('filename=%s', filename)
-        tracing.trace('chunkids=%s', repr(chunkids))
+        tracer.trace('filename=%s', filename)
+        tracer.trace('chunkids=%r', chunkids)
 
         file_id = self.set_file_id(filename)
 
@@ -531,8 +533,8 @@ class ClientMetadataTree(obnamlib.RepositoryTree):
         B-tree leaf.
 
         '''
-        tracing.trace('filename=%s' % filename)
-        tracing.trace('contents=%s' % repr(contents))
+        tracer.trace('filename=%s', filename)
+        tracer.trace('contents=%r', contents)
 
         file_id = self.set_file_id(filename)
         key = self.fskey(file_id, self.FILE_DATA, 0)
@@ -24,11 +24,13 @@ import stat
 import time
 
 import larch
-import tracing
 
 import obnamlib
 
 
+tracer = obnamlib.Tracer(__file__)
+
+
 class _OpenClientInfo(object):
 
     def __init__(self, client):
@@ -52,6 +54,8 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
                  idpath_skip=obnamlib.IDPATH_SKIP,
                  hooks=None,
                  current_time=None,
+                 phase_stats=None,
+                 vfs_latency=None,
                  **kwargs):
 
         self._real_fs = None
@@ -64,6 +68,8 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
         self._idpath_skip = idpath_skip
         self._current_time = current_time or time.time
         self.hooks = hooks
+        self._phase_stats = phase_stats or obnamlib.PhaseStats()
+        self._vfs_latency = vfs_latency
 
         self._setup_chunks()
         self._reset_unused_chunks()
@@ -78,7 +84,10 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
 
     def set_fs(self, fs):
         self._real_fs = fs
-        self._fs = obnamlib.RepositoryFS(self, fs, self.hooks)
+        self._fs = obnamlib.RepositoryFS(
+            self, fs, self.hooks, phase_stats=self._phase_stats)
+        if self._vfs_latency is not None:
+            self._vfs_latency.instrument('repository-filtered', self._fs)
         self._lockmgr = obnamlib.LockManager(self._fs, self._lock_timeout, '')
         self._setup_client_list()
         self._setup_client()
@@ -120,27 +129,28 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
             raise obnamlib.RepositoryClientListNotLocked()
 
     def lock_client_list(self):
-        tracing.trace('locking client list')
+        tracer.trace('locking client list')
         self._raw_lock_client_list()
 
     def unlock_client_list(self):
-        tracing.trace('unlocking client list')
+        tracer.trace('unlocking client list')
         self._raw_unlock_client_list()
 
     def commit_client_list(self):
-        tracing.trace('committing client list')
+        tracer.trace('committing client list')
         self._require_client_list_lock()
         for client_name in self._added_clients:
             self.hooks.call(
                 'repository-add-client', self, client_name)
         self._added_clients = []
         self._client_list.commit()
+        self._fs.sync()
 
     def got_client_list_lock(self):
         return self._lockmgr.got_lock('.')
 
     def force_client_list_lock(self):
-        tracing.trace('forcing client list lock')
+        tracer.trace('forcing client list lock')
         self._lockmgr.force(['.'])
         self._setup_client_list()
 
@@ -216,7 +226,7 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
 
     def _get_open_client_info(self, client_name):
         if client_name not in self._open_client_infos:
-            tracing.trace('client_name=%s', client_name)
+            tracer.trace('client_name=%s', client_name)
             client_id = self._get_client_id(client_name)
             if client_id is None:  # pragma: no cover
                 raise obnamlib.RepositoryClientDoesNotExist(
@@ -250,7 +260,7 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
             raise obnamlib.RepositoryClientNotLocked(client_name=client_name)
 
     def _raw_lock_client(self, client_name):
-        tracing.trace('client_name=%s', client_name)
+        tracer.trace('client_name=%s', client_name)
 
         if self.got_client_lock(client_name):
             raise obnamlib.RepositoryClientLockingFailed(
@@ -271,7 +281,7 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
         self._lockmgr.lock([client_dir])
 
     def _raw_unlock_client(self, client_name):
-        tracing.trace('client_name=%s', client_name)
+        tracer.trace('client_name=%s', client_name)
         client_id = self._get_client_id(client_name)
         client_dir = self._get_client_dir(client_id)
         self._lockmgr.unlock([client_dir])
@@ -298,7 +308,7 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
         self._setup_file_key_cache()
 
     def got_client_lock(self, client_name):
-        tracing.trace('client_name=%s', client_name)
+        tracer.trace('client_name=%s', client_name)
         client_id = self._get_client_id(client_name)
         client_dir = self._get_client_dir(client_id)
         return self._lockmgr.got_lock(client_dir)
@@ -315,7 +325,7 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
         self._setup_file_key_cache()
 
     def commit_client(self, client_name):
-        tracing.trace('client_name=%s', client_name)
+        tracer.trace('client_name=%s', client_name)
         self._require_existing_client(client_name)
         self._require_client_lock(client_name)
 
@@ -331,7 +341,15 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
             open_client_info.current_generation_number or
             open_client_info.generations_removed)
         if need_to_commit:
-            open_client_info.client.commit()
+            with self._phase_stats.timer('commit-client'):
+                open_client_info.client.commit()
+                self._fs.sync()
+
+        # The generation is now finished. The client stays open, so
+        # that a new generation can be started from the committed
+        # one without re-opening the B-trees.
+        open_client_info.current_generation_number = None
+        open_client_info.generations_removed = False
 
     def _remove_chunks_from_removed_generations(
             self, client_name, remove_gen_nos):
@@ -419,7 +437,7 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
                 ids.remove(gen_id)
 
     def create_generation(self, client_name):
-        tracing.trace('client_name=%s', client_name)
+        tracer.trace('client_name=%s', client_name)
         self._require_existing_client(client_name)
         self._require_client_lock(client_name)
 
@@ -446,7 +464,7 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
             client_name, open_client_info.current_generation_number)
 
     def get_client_extra_data_directory(self, client_name):
-        tracing.trace('client_name=%s', client_name)
+        tracer.trace('client_name=%s', client_name)
         self._require_existing_client(client_name)
         return str(self._get_client_id(client_name))
 
@@ -545,7 +563,7 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
         return str(gen_number)
 
     def remove_generation(self, gen_id):
-        tracing.trace('gen_id=%s' % repr(gen_id))
+        tracer.trace('gen_id=%r', gen_id)
         client_name, gen_number = self._unpack_gen_id(gen_id)
         self._require_client_lock(client_name)
         self._require_existing_generation(gen_id)
@@ -630,7 +648,7 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
                     continue
                 raise
             else:
-                tracing.trace('chunkid=%s', chunk_id)
+                tracer.trace('chunkid=%s', chunk_id)
                 break
 
         self._prev_chunk_id = chunk_id
@@ -673,7 +691,7 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
         self._reset_unused_chunks()
 
     def _remove_chunk(self, chunk_id):  # pragma: no cover
-        tracing.trace('chunk_id=%s', chunk_id)
+        tracer.trace('chunk_id=%s', chunk_id)
 
         # Note: we ignore in-tree data, on the assumption that if
         # it gets removed, the whole file gets removed from the
@@ -730,7 +748,7 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
 
         self._lockmgr.lock(self._chunk_index_dirs_to_lock())
 
-        tracing.trace('starting changes in chunksums and chunklist')
+        tracer.trace('starting changes in chunksums and chunklist')
         self._chunksums.start_changes()
         self._chunklist.start_changes()
 
@@ -746,12 +764,13 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
         self._lockmgr.unlock(self._chunk_index_dirs_to_lock())
         self._setup_chunk_indexes()
 
-    def lock_chunk_indexes(self):
-        tracing.trace('locking chunk indexes')
+    def lock_chunk_indexes(self, tokens=None):
+        # The chunk indexes are locked as a whole, whatever the tokens.
+        tracer.trace('locking chunk indexes')
         self._raw_lock_chunk_indexes()
 
     def unlock_chunk_indexes(self):
-        tracing.trace('unlocking chunk indexes')
+        tracer.trace('unlocking chunk indexes')
         self._raw_unlock_chunk_indexes()
         self._reset_unused_chunks()
 
@@ -761,37 +780,39 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
             for x in self._chunk_index_dirs_to_lock())
 
     def force_chunk_indexes_lock(self):
-        tracing.trace('forcing chunk indexes lock')
+        tracer.trace('forcing chunk indexes lock')
         self._lockmgr.force(self._chunk_index_dirs_to_lock())
         self._setup_chunk_indexes()
 
     def commit_chunk_indexes(self):
-        tracing.trace('committing chunk indexes')
+        tracer.trace('committing chunk indexes')
         self._require_chunk_indexes_lock()
-        self._chunklist.commit()
-        self._chunksums.commit()
+        with self._phase_stats.timer('commit-chunk-indexes'):
+            self._chunklist.commit()
+            self._chunksums.commit()
+            self._fs.sync()
 
     def prepare_chunk_for_indexes(self, data):
         return self._checksum(data)
 
     def put_chunk_into_indexes(self, chunk_id, token, client_name):
-        tracing.trace('chunk_id=%s', chunk_id)
-        tracing.trace('token=%s', token)
-        tracing.trace('client_name=%s', client_name)
+        tracer.trace('chunk_id=%s', chunk_id)
+        tracer.trace('token=%s', token)
+        tracer.trace('client_name=%s', client_name)
         assert not self._is_in_tree_chunk_id(chunk_id)
         client_id = self._get_client_id(client_name)
-        tracing.trace('client_id=%s', client_id)
+        tracer.trace('client_id=%s', client_id)
 
         self._require_chunk_indexes_lock()
         self._chunklist.add(chunk_id, token)
         self._chunksums.add(token, chunk_id, client_id)
 
     def remove_chunk_from_indexes(self, chunk_id, client_name):
-        tracing.trace('chunk_id=%s', chunk_id)
-        tracing.trace('client_name=%s', client_name)
+        tracer.trace('chunk_id=%s', chunk_id)
+        tracer.trace('client_name=%s', client_name)
         assert not self._is_in_tree_chunk_id(chunk_id)
         client_id = self._get_client_id(client_name)
-        tracing.trace('client_id=%s', client_id)
+        tracer.trace('client_id=%s', client_id)
 
         self._require_chunk_indexes_lock()
         checksum = self._chunklist.get_checksum(chunk_id)
@@ -799,14 +820,14 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
         self._chunklist.remove(chunk_id)
 
     def remove_chunk_from_indexes_for_all_clients(self, chunk_id):
-        tracing.trace('chunk_id=%s', chunk_id)
+        tracer.trace('chunk_id=%s', chunk_id)
         assert not self._is_in_tree_chunk_id(chunk_id)
 
         self._require_chunk_indexes_lock()
         try:
             checksum = self._chunklist.get_checksum(chunk_id)
         except KeyError:  # pragma: no cover
-            tracing.trace('chunk does not exist in chunklist tree')
+            tracer.trace('chunk does not exist in chunklist tree')
             # Because commit_chunk_indexes commits _chunklist before
             # _chunksums, at this point we know the chunk isn't going
             # to be in _chunksums either.
@@ -1044,6 +1065,7 @@ class RepositoryFormat6(obnamlib.RepositoryInterface):
 class CheckBTree(obnamlib.WorkItem):  # pragma: no cover
 
     settings = None
+    resumable = True
 
     def __init__(self, fs, dirname, skip_setting):
         self.fs = fs
@@ -15,7 +15,11 @@
 
 
 import larch
-import tracing
+
+import obnamlib
+
+
+tracer = obnamlib.Tracer(__file__)
 
 
 class RepositoryTree(object):
@@ -49,10 +53,10 @@ class RepositoryTree(object):
 
     def init_forest(self, allow_writes=False):
         if self.forest is None:
-            tracing.trace('initializing forest dirname=%s', self.dirname)
+            tracer.trace('initializing forest dirname=%s', self.dirname)
             assert self.tree is None
             if not self.fs.exists(self.dirname):
-                tracing.trace('%s does not exist', self.dirname)
+                tracer.trace('%s does not exist', self.dirname)
                 return False
             self.forest = larch.open_forest(key_size=self.key_bytes,
                                             node_size=self.node_size,
@@ -65,7 +69,7 @@ class RepositoryTree(object):
         return True
 
     def start_changes(self, create_tree=True):
-        tracing.trace('start changes for %s', self.dirname)
+        tracer.trace('start changes for %s', self.dirname)
 
         if self.forest is None or not self.forest_allows_writes:
             if not self.fs.exists(self.dirname):
@@ -76,7 +80,7 @@ class RepositoryTree(object):
 
             if need_init:
                 if not self.fs.exists(self.dirname):
-                    tracing.trace('create %s', self.dirname)
+                    tracer.trace('create %s', self.dirname)
                     self.fs.mkdir(self.dirname)
                 self.repo.hooks.call('repository-toplevel-init', self.repo,
                                      self.dirname)
@@ -90,21 +94,21 @@ class RepositoryTree(object):
         if self.tree is None and create_tree:
             if self.forest.trees:
                 self.tree = self.forest.new_tree(self.forest.trees[-1])
-                tracing.trace(
+                tracer.trace(
                     'use newest tree %s (of %d)',
                     self.tree.root.id,
                     len(self.forest.trees))
             else:
                 self.tree = self.forest.new_tree()
-                tracing.trace('new tree root id %s', self.tree.root.id)
+                tracer.trace('new tree root id %s', self.tree.root.id)
 
     def commit(self):
-        tracing.trace('committing')
+        tracer.trace('committing')
         if self.forest:
             if self.keep_just_one_tree:
                 while len(self.forest.trees) > 1:
-                    tracing.trace('not keeping tree with root id %s',
-                                  self.forest.trees[0].root.id)
+                    tracer.trace('not keeping tree with root id %s',
+                                 self.forest.trees[0].root.id)
                     self.forest.remove_tree(self.forest.trees[0])
             self.forest.commit()
             self.tree = None
@@ -24,4 +24,10 @@ from .indexes import GAChunkIndexes
 from .dirobj import GADirectory, GAImmutableError, create_gadirectory_from_dict
 from .tree import GATree
 from .client import GAClient
+from .fsck import (
+    CheckGABags,
+    CheckGAChunkStore,
+    CheckGAChunkIndexes,
+    CheckGAClientDirectories,
+)
 from .format import RepositoryFormatGA, GREEN_ALBATROSS_VERSION
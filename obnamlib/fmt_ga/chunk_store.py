@@ -40,6 +40,9 @@ class GAChunkStore(object):
         if self._max_chunk_size is not None:
             self._blob_store.set_max_bag_size(self._max_chunk_size)
 
+    def get_dirname(self):
+        return self._dirname
+
     def set_max_chunk_size(self, max_chunk_size):
         self._max_chunk_size = max_chunk_size
         if self._blob_store:
@@ -56,6 +59,11 @@ class GAChunkStore(object):
 
     def flush_chunks(self):
         self._blob_store.flush()
+        self.release_unused_bag_ids()
+
+    def release_unused_bag_ids(self):
+        if self._bag_store is not None:
+            self._bag_store.release_unused_bag_ids()
 
     def get_chunk_content(self, chunk_id):
         content = self._blob_store.get_blob(chunk_id)
@@ -65,6 +73,14 @@ class GAChunkStore(object):
                 filename=None)
         return content
 
+    def get_chunk_contents(self, chunk_ids):
+        for chunk_id, content in self._blob_store.get_blobs(chunk_ids):
+            if content is None:
+                raise obnamlib.RepositoryChunkDoesNotExist(
+                    chunk_id=chunk_id,
+                    filename=None)
+            yield chunk_id, content
+
     def has_chunk(self, chunk_id):
         # This is ugly, 'cause it requires reading in the whole bag.
         # We could easily check if the bag exists, but not whether it
@@ -33,9 +33,12 @@ class GAClient(object):
         self._client_name = client_name
         self._current_time = None
         self._default_checksum_algorithm = None
+        self._blob_store = None
         self.clear()
 
     def clear(self):
+        if self._blob_store is not None:
+            self._blob_store.release_unused_bag_ids()
         self._blob_store = None
         self._client_keys = GAKeys()
         self._generations = GAGenerationList()
@@ -154,6 +157,20 @@ class GAClient(object):
             metadata.set_blob_store(blob_store)
             metadata.set_root_object_id(gen.get_root_object_id())
 
+    def get_generation_root_object_ids(self):
+        '''Return (gen_number, root directory object id) for generations.'''
+        self._load_data()
+        return [
+            (gen.get_number(), gen.get_root_object_id())
+            for gen in self._generations]
+
+    def get_directory_object_dict(self, obj_id):
+        '''Return a stored directory object as a dict, or None.'''
+        blob = self._get_blob_store().get_blob(obj_id)
+        if blob is None:
+            return None
+        return obnamlib.deserialise_object(blob, lazy=True)
+
     def get_client_generation_ids(self):
         self._load_data()
         return [
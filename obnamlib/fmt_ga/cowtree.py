@@ -85,6 +85,26 @@ class CowTree(object):
         new_id = self._store.put_leaf(new)
         self._leaf_list.insert_leaf(sorted_keys[0], sorted_keys[-1], new_id)
 
+    def items(self):
+        '''Generate all (key, value) pairs in the tree, sorted by key.'''
+        for leaf_info in self._leaf_list.as_dict():
+            leaf = self._store.get_leaf(leaf_info['id'])
+            for key in sorted(leaf.keys()):
+                yield key, leaf.lookup(key)
+
+    def get_leaf_list(self):
+        '''Return a list of dicts describing the leaves of the tree.
+
+        Each dict has the keys "first_key", "last_key", and "id". The
+        list is sorted by first key. This is meant for fsck.
+
+        '''
+
+        return self._leaf_list.as_dict()
+
+    def get_leaf(self, leaf_id):
+        return self._store.get_leaf(leaf_id)
+
     def commit(self):
         fake_leaf = obnamlib.CowLeaf()
         fake_leaf.insert('leaf_list', self._leaf_list.as_dict())
@@ -64,3 +64,26 @@ class CowTreeTests(unittest.TestCase):
         cow2.set_leaf_store(self.ls)
         cow2.set_list_node(list_id)
         self.assertEqual(cow2.lookup(key), value)
+
+    def test_lists_items_in_key_order(self):
+        self.cow.set_max_leaf_size(2)
+        keyvalues = [
+            ('key-{}'.format(i), 'value-{}'.format(i))
+            for i in range(5)
+        ]
+        for key, value in reversed(keyvalues):
+            self.cow.insert(key, value)
+        self.assertEqual(list(self.cow.items()), keyvalues)
+
+    def test_leaf_list_covers_all_leaves_in_order(self):
+        self.cow.set_max_leaf_size(2)
+        for i in range(5):
+            self.cow.insert('key-{}'.format(i), 'value')
+        leaf_list = self.cow.get_leaf_list()
+        self.assertTrue(len(leaf_list) > 1)
+        first_keys = [leaf_info['first_key'] for leaf_info in leaf_list]
+        self.assertEqual(first_keys, sorted(first_keys))
+        for leaf_info in leaf_list:
+            leaf = self.cow.get_leaf(leaf_info['id'])
+            self.assertEqual(min(leaf.keys()), leaf_info['first_key'])
+            self.assertEqual(max(leaf.keys()), leaf_info['last_key'])
@@ -42,6 +42,8 @@ _short_key_names = {
     obnamlib.REPO_FILE_SHA256: '256',
     obnamlib.REPO_FILE_SHA384: '384',
     obnamlib.REPO_FILE_SHA512: '512',
+    obnamlib.REPO_FILE_BLAKE2B: 'b2b',
+    obnamlib.REPO_FILE_BLAKE2S: 'b2s',
 }
 
 # Let's make sure we have no duplicate values.
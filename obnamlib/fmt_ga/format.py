@@ -19,7 +19,7 @@
 import obnamlib
 
 
-GREEN_ALBATROSS_VERSION = 'green-albatross-20160813'
+GREEN_ALBATROSS_VERSION = 'green-albatross-20261018'
 
 
 class RepositoryFormatGA(obnamlib.RepositoryDelegator):
@@ -44,6 +44,10 @@ class RepositoryFormatGA(obnamlib.RepositoryDelegator):
             chunk_store.set_chunk_cache_size(kwargs['chunk_cache_size'])
         self.set_chunk_store_object(chunk_store)
 
+        # Results of checking the chunk store during fsck. See
+        # get_fsck_work_items.
+        self._checked_chunks = None
+
     def _client_factory(self, client_name):
         client = obnamlib.GAClient(client_name)
         client.set_default_checksum_algorithm(self._checksum_algorithm)
@@ -53,10 +57,58 @@ class RepositoryFormatGA(obnamlib.RepositoryDelegator):
         pass
 
     def close(self):
-        pass
+        if self._fs is not None:
+            self._chunk_store.release_unused_bag_ids()
+            self.get_fs().close()
 
     def get_fsck_work_items(self):
-        return []
+        self._checked_chunks = None
+
+        yield obnamlib.CheckGABags(
+            self._fs, self._client_list.get_dirname(),
+            'fsck-skip-shared-b-trees')
+        for client_name in self.get_client_names():
+            client = self._lookup_client(client_name)
+            yield obnamlib.CheckGABags(
+                self._fs, client.get_dirname(),
+                'fsck-skip-per-client-b-trees')
+            yield obnamlib.CheckGAClientDirectories(client_name, client)
+        yield obnamlib.CheckGAChunkStore(
+            self._fs, self._chunk_store.get_dirname(),
+            self._chunk_indexes, self._set_checked_chunks)
+        for shard in self._chunk_indexes.get_shards():
+            yield obnamlib.CheckGABags(
+                self._fs, shard.get_dirname(), 'fsck-skip-shared-b-trees')
+        yield obnamlib.CheckGAChunkIndexes(
+            self._chunk_indexes, self.get_client_names(),
+            self._get_checked_chunks)
+
+    # Once fsck has read the whole chunk store, it knows which chunks
+    # exist and whether they're intact. Answer the per-chunk questions
+    # fsck asks later from that, rather than reading every bag again.
+    # The repository is locked during fsck, so the results stay valid.
+
+    def _set_checked_chunks(self, checked):
+        self._checked_chunks = checked
+
+    def _get_checked_chunks(self):
+        return self._checked_chunks
+
+    def has_chunk(self, chunk_id):
+        if self._checked_chunks is not None:
+            return chunk_id in self._checked_chunks
+        return obnamlib.RepositoryDelegator.has_chunk(self, chunk_id)
+
+    def validate_chunk_content(self, chunk_id):
+        if self._checked_chunks is not None:
+            return self._checked_chunks.get(chunk_id)
+        return obnamlib.RepositoryDelegator.validate_chunk_content(
+            self, chunk_id)
+
+    def get_chunk_ids(self):
+        if self._checked_chunks is not None:
+            return list(self._checked_chunks)
+        return obnamlib.RepositoryDelegator.get_chunk_ids(self)
 
     def get_shared_directories(self):
         return ['client-list', 'chunk-store', 'chunk-indexes']
@@ -119,6 +171,8 @@ class RepositoryFormatGA(obnamlib.RepositoryDelegator):
             obnamlib.REPO_FILE_SHA256,
             obnamlib.REPO_FILE_SHA384,
             obnamlib.REPO_FILE_SHA512,
+            obnamlib.REPO_FILE_BLAKE2B,
+            obnamlib.REPO_FILE_BLAKE2S,
         ]
 
     def interpret_generation_spec(self, client_name, genspec):
@@ -43,3 +43,10 @@ class RepositoryFormatGATests(obnamlib.RepositoryInterfaceTests):
 
     def tearDown(self):
         shutil.rmtree(self.tempdir)
+
+    def test_close_closes_filesystem(self):
+        closed = []
+        fs = self.repo.get_fs()
+        fs.close = lambda: closed.append(fs)
+        self.repo.close()
+        self.assertEqual(closed, [fs])
@@ -0,0 +1,319 @@
+# Copyright 2016  Lars Wirzenius
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =*= License: GPL-3+ =*=
+
+
+import collections
+import logging
+import os
+
+import obnamlib
+
+
+def _bag_name(bag_id):
+    if isinstance(bag_id, str):
+        return bag_id
+    return '%016x' % bag_id
+
+
+class CheckGABags(obnamlib.WorkItem):
+
+    '''Check that every bag in a directory can be read.
+
+    Each bag is read once. If check_blob is given, it is called with
+    the object id and content of each blob in each numbered bag,
+    while the bag is in memory.
+
+    Checked bags are recorded in the fsck journal, if there is one,
+    and bags checked by an earlier, interrupted run are skipped.
+
+    '''
+
+    resumable = True
+
+    def __init__(self, fs, dirname, skip_setting, check_blob=None):
+        self.fs = fs
+        self.dirname = dirname
+        self.skip_setting = skip_setting
+        self.check_blob = check_blob
+        self.skipped_bags = 0
+        self.name = 'bags in %s' % dirname
+
+    def do(self):
+        if self.settings[self.skip_setting]:
+            return
+
+        if not self.fs.exists(self.dirname):
+            logging.debug('%s does not exist, skipping', self.dirname)
+            return
+
+        logging.debug('Checking bags in %s', self.dirname)
+        bag_store = obnamlib.BagStore()
+        bag_store.set_location(self.fs, self.dirname)
+        for bag_id in bag_store.get_bag_ids():
+            key = '%s: bag %s' % (self.dirname, _bag_name(bag_id))
+            if self.journal is not None and self.journal.is_done(key):
+                self.skipped_bags += 1
+                continue
+            if self.time_is_up is not None and self.time_is_up():
+                self.interrupted = True
+                return
+            self.check_bag(bag_store, bag_id)
+            if self.journal is not None:
+                self.journal.mark_done(key)
+
+    def check_bag(self, bag_store, bag_id):
+        name = '%s: bag %s' % (self.dirname, _bag_name(bag_id))
+
+        if not bag_store.has_bag(bag_id):
+            # Older versions reserved a bag id by creating an empty
+            # file. If Obnam crashed before the bag was written, the
+            # file stayed empty. That wastes nothing but an inode.
+            self.warning('%s is empty' % name)
+            return
+
+        try:
+            bag = bag_store.get_bag(bag_id)
+        except Exception as e:  # pylint: disable=broad-except
+            self.error('%s cannot be read: %s' % (name, str(e)))
+            return
+
+        if bag.get_id() != bag_id:
+            self.error(
+                '%s has wrong id %s' % (name, _bag_name(bag.get_id())))
+            return
+
+        if isinstance(bag_id, str):
+            if len(bag) != 1:
+                self.error('%s has %d blobs, not one' % (name, len(bag)))
+        elif self.check_blob is not None:
+            for i in range(len(bag)):
+                self.check_blob(obnamlib.make_object_id(bag_id, i), bag[i])
+
+
+class CheckGAChunkStore(CheckGABags):
+
+    '''Check the chunks in the chunk store against the chunk indexes.
+
+    Each bag is read once, and each chunk in it is checked against
+    the token recorded for it in the chunk indexes. The results are
+    given to set_checked_chunks as a dict from chunk id to True
+    (valid), False (corrupted), or None (not known), so that later
+    checks need not read the chunks again. The results are only
+    complete if every bag was checked in this run, so they're not
+    given at all if the check was interrupted, or resumed.
+
+    '''
+
+    def __init__(self, fs, dirname, chunk_indexes, set_checked_chunks):
+        CheckGABags.__init__(
+            self, fs, dirname, 'fsck-ignore-chunks',
+            check_blob=self.check_chunk)
+        self.chunk_indexes = chunk_indexes
+        self.set_checked_chunks = set_checked_chunks
+        self.checked = {}
+        self.name = 'chunk store'
+
+    def do(self):
+        CheckGABags.do(self)
+        if self.settings[self.skip_setting]:
+            return
+        if not self.interrupted and self.skipped_bags == 0:
+            self.set_checked_chunks(self.checked)
+
+    def check_chunk(self, chunk_id, content):
+        if self.settings['fsck-skip-checksums']:
+            self.checked[chunk_id] = None
+            return
+
+        # Look in the shard for the chunk's actual token first. Only
+        # if it isn't there, do we need to search all shards.
+        actual = self.chunk_indexes.prepare_chunk_for_indexes(content)
+        if self.chunk_indexes.chunk_has_token(chunk_id, actual):
+            self.checked[chunk_id] = True
+        elif self.chunk_indexes.get_chunk_token(chunk_id) is None:
+            self.warning('chunk %s is not in the chunk indexes' % chunk_id)
+            self.checked[chunk_id] = None
+        else:
+            self.error('chunk %s is corrupted' % chunk_id)
+            self.checked[chunk_id] = False
+
+
+class CheckGAChunkIndexes(obnamlib.WorkItem):
+
+    '''Check the chunk index trees, and that they agree with each other.
+
+    Each shard of the chunk indexes is checked separately. If the chunk
+    store has been checked, also check that every indexed chunk exists
+    in it.
+
+    '''
+
+    resumable = True
+
+    def __init__(self, chunk_indexes, client_names, get_checked_chunks):
+        self.chunk_indexes = chunk_indexes
+        self.client_names = client_names
+        self.get_checked_chunks = get_checked_chunks
+        self.name = 'chunk indexes'
+
+    def do(self):
+        if self.settings['fsck-skip-shared-b-trees']:
+            return
+
+        logging.debug('Checking chunk indexes')
+        checked = self.get_checked_chunks()
+        for shard in self.chunk_indexes.get_shards():
+            self.check_shard(shard, checked)
+
+    def check_shard(self, shard, checked):
+        trees = dict(shard.get_fsck_trees())
+        for tree_name in sorted(trees):
+            name = '%s %s' % (shard.get_dirname(), tree_name)
+            if not self.check_cowtree(name, trees[tree_name]):
+                return
+
+        by_checksum = dict(trees['by_checksum'].items())
+        used_by = dict(trees['used_by'].items())
+
+        tokens = {}
+        for chunk_id, token in trees['by_chunk_id'].items():
+            if token is None:
+                # The chunk has been removed from the indexes.
+                continue
+            tokens[chunk_id] = token
+            if not token.startswith(shard.get_prefix()):
+                self.error(
+                    'chunk %s is in the wrong chunk index shard %s' %
+                    (chunk_id, shard.get_dirname()))
+            if chunk_id not in (by_checksum.get(token) or []):
+                self.error(
+                    'chunk %s is missing from the by_checksum index' %
+                    chunk_id)
+            if checked is not None and chunk_id not in checked:
+                self.error(
+                    'chunk %s is in the chunk indexes, '
+                    'but not in the chunk store' % chunk_id)
+            for client_name in used_by.get(chunk_id) or []:
+                if client_name not in self.client_names:
+                    self.warning(
+                        'chunk %s is used by unknown client %s' %
+                        (chunk_id, client_name))
+
+        for token, chunk_ids in by_checksum.items():
+            for chunk_id in chunk_ids or []:
+                if tokens.get(chunk_id) != token:
+                    self.error(
+                        'chunk %s is in the by_checksum index '
+                        'under the wrong checksum' % chunk_id)
+
+    def check_cowtree(self, tree_name, tree):
+        ok = True
+        prev_last = None
+        for leaf_info in tree.get_leaf_list():
+            first = leaf_info['first_key']
+            last = leaf_info['last_key']
+            name = 'chunk index %s: leaf %s' % (tree_name, leaf_info['id'])
+
+            if first > last or (prev_last is not None and first <= prev_last):
+                self.error('%s is out of order' % name)
+                ok = False
+            prev_last = last
+
+            try:
+                keys = tree.get_leaf(leaf_info['id']).keys()
+            except Exception as e:  # pylint: disable=broad-except
+                self.error('%s cannot be read: %s' % (name, str(e)))
+                ok = False
+                continue
+
+            if not keys:
+                self.warning('%s is empty' % name)
+            elif min(keys) < first or max(keys) > last:
+                self.error('%s has keys outside its range' % name)
+                ok = False
+
+        return ok
+
+
+class CheckGAClientDirectories(obnamlib.WorkItem):
+
+    '''Check that all directory objects of a client can be reached.
+
+    Start from the root directory object of each generation and
+    follow the references to subdirectory objects. Generations share
+    unchanged directory objects, so each object is checked only once.
+
+    '''
+
+    resumable = True
+
+    def __init__(self, client_name, client):
+        self.client_name = client_name
+        self.client = client
+        self.name = 'directories of client %s' % client_name
+
+    def do(self):
+        if self.settings['fsck-skip-per-client-b-trees']:
+            return
+
+        logging.debug('Checking directory objects for %s', self.client_name)
+        seen = set()
+        roots = self.client.get_generation_root_object_ids()
+        for gen_number, root_id in roots:
+            if root_id is not None:
+                self.check_directories(gen_number, root_id, seen)
+
+    def check_directories(self, gen_number, root_id, seen):
+        stack = [('/', root_id)]
+        while stack:
+            pathname, obj_id = stack.pop()
+            where = '%s:%s:%s' % (self.client_name, gen_number, pathname)
+            if obj_id is None:
+                self.error('%s: no directory object' % where)
+                continue
+            if obj_id in seen:
+                continue
+            seen.add(obj_id)
+
+            try:
+                obj = self.client.get_directory_object_dict(obj_id)
+            except Exception as e:  # pylint: disable=broad-except
+                self.error(
+                    '%s: directory object %s cannot be read: %s' %
+                    (where, obj_id, str(e)))
+                continue
+
+            if obj is None:
+                self.error(
+                    '%s: directory object %s does not exist' %
+                    (where, obj_id))
+                continue
+
+            if not (isinstance(obj, collections.Mapping) and
+                    isinstance(obj.get('metadata'), collections.Mapping) and
+                    isinstance(obj.get('subdirs'), collections.Mapping)):
+                self.error(
+                    '%s: directory object %s is malformed' % (where, obj_id))
+                continue
+
+            for basename, file_dict in obj['metadata'].items():
+                if 'chunk-ids' not in file_dict:
+                    self.error(
+                        '%s: %s has no chunk id list' % (where, basename))
+
+            for basename, subdir_id in obj['subdirs'].items():
+                stack.append((os.path.join(pathname, basename), subdir_id))
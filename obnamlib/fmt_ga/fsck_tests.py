@@ -0,0 +1,331 @@
+# Copyright 2016  Lars Wirzenius
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =*= License: GPL-3+ =*=
+
+
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+
+import obnamlib
+
+
+class FakeJournal(object):
+
+    def __init__(self):
+        self.done = set()
+
+    def is_done(self, key):
+        return key in self.done
+
+    def mark_done(self, key):
+        self.done.add(key)
+
+
+class GAFsckTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.settings = {
+            'fsck-skip-shared-b-trees': False,
+            'fsck-skip-per-client-b-trees': False,
+            'fsck-ignore-chunks': False,
+            'fsck-skip-checksums': False,
+        }
+        self.journal = None
+        self.time_is_up = None
+
+        repo = self.open_repo()
+        repo.lock_client_list()
+        repo.add_client('fooclient')
+        repo.commit_client_list()
+        repo.unlock_client_list()
+
+        repo.lock_client('fooclient')
+        gen_id = repo.create_generation('fooclient')
+        for filename, mode in [('/', stat.S_IFDIR), ('/foo', stat.S_IFREG)]:
+            repo.add_file(gen_id, filename)
+            repo.set_file_key(
+                gen_id, filename, obnamlib.REPO_FILE_MODE, mode)
+
+        self.chunk_id = repo.put_chunk_content('foo')
+        token = repo.prepare_chunk_for_indexes('foo')
+        repo.append_file_chunk_id(gen_id, '/foo', self.chunk_id)
+        repo.lock_chunk_indexes()
+        repo.put_chunk_into_indexes(self.chunk_id, token, 'fooclient')
+        repo.commit_chunk_indexes()
+        repo.unlock_chunk_indexes()
+
+        repo.commit_client('fooclient')
+        repo.unlock_client('fooclient')
+        repo.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def open_repo(self):
+        self.hooks = obnamlib.HookManager()
+        repo_factory = obnamlib.RepositoryFactory()
+        repo_factory.setup_hooks(self.hooks)
+
+        repo = obnamlib.RepositoryFormatGA(
+            hooks=self.hooks,
+            current_time=time.time,
+            dir_bag_size=1,
+            dir_cache_size=0,
+            checksum_algorithm='sha512')
+        repo.set_fs(obnamlib.LocalFS(self.tempdir))
+        return repo
+
+    def fsck(self, repo=None):
+        if repo is None:
+            repo = self.open_repo()
+        self.errors = []
+        self.warnings = []
+        self.items = []
+        for work in repo.get_fsck_work_items():
+            work.error = self.errors.append
+            work.warning = self.warnings.append
+            work.repo = repo
+            work.settings = self.settings
+            work.journal = self.journal
+            work.time_is_up = self.time_is_up
+            work.do()
+            self.items.append(work)
+        return repo
+
+    def find_bag_files(self, dirname, numbered=True):
+        result = []
+        for dirpath, _, basenames in os.walk(self.pathname(dirname)):
+            for basename in basenames:
+                if basename.endswith('.bag') and \
+                   numbered != basename.startswith('root'):
+                    result.append(os.path.join(dirpath, basename))
+        self.assertNotEqual(result, [])
+        return result
+
+    def find_client_dirname(self):
+        names = [x for x in os.listdir(self.tempdir)
+                 if x.startswith('clientdir-')]
+        self.assertEqual(len(names), 1)
+        return names[0]
+
+    def pathname(self, dirname):
+        return os.path.join(self.tempdir, dirname)
+
+    def chunk_bag_filename(self):
+        bag_id, _ = obnamlib.parse_object_id(self.chunk_id)
+        filenames = [
+            x for x in self.find_bag_files('chunk-store')
+            if os.path.basename(x) == '%016x.bag' % bag_id]
+        self.assertEqual(len(filenames), 1)
+        return filenames[0]
+
+    def put_bag(self, dirname, bag_id, blobs):
+        # Write the bag the way the repository does, so that it can be
+        # read, but doesn't have what the repository expects.
+        repo = self.open_repo()
+        fs = obnamlib.RepositoryFS(
+            repo, obnamlib.LocalFS(self.tempdir), self.hooks)
+        bag_store = obnamlib.BagStore()
+        bag_store.set_location(fs, dirname)
+        bag = obnamlib.Bag()
+        bag.set_id(bag_id)
+        for blob in blobs:
+            bag.append(blob)
+        bag_store.put_bag(bag)
+
+    def corrupt_chunk(self):
+        bag_id, _ = obnamlib.parse_object_id(self.chunk_id)
+        self.put_bag('chunk-store', bag_id, ['bar'])
+
+    def assertReported(self, messages, text):
+        self.assertTrue(
+            any(text in msg for msg in messages),
+            '%r not in %r' % (text, messages))
+
+
+class GAFsckTests(GAFsckTestCase):
+
+    def test_reports_nothing_for_intact_repository(self):
+        self.fsck()
+        self.assertEqual(self.errors, [])
+        self.assertEqual(self.warnings, [])
+
+    def test_reports_corrupt_bag(self):
+        filename = self.find_bag_files(self.find_client_dirname())[0]
+        with open(filename, 'w') as f:
+            f.write('this is not a bag')
+        self.fsck()
+        self.assertReported(self.errors, 'cannot be read')
+
+    def test_reports_truncated_bag(self):
+        filename = self.chunk_bag_filename()
+        with open(filename) as f:
+            data = f.read()
+        with open(filename, 'w') as f:
+            f.write(data[:len(data) / 2])
+        self.fsck()
+        self.assertReported(self.errors, 'cannot be read')
+
+    def test_warns_about_empty_bag(self):
+        filename = self.chunk_bag_filename()
+        with open(filename, 'w'):
+            pass
+        self.fsck()
+        self.assertReported(self.warnings, 'is empty')
+
+    def test_reports_bag_with_wrong_id(self):
+        self.put_bag('chunk-store', 1, ['foo'])
+        shutil.move(
+            self.pathname('chunk-store/00/00/00/%016x.bag' % 1),
+            self.chunk_bag_filename())
+        self.fsck()
+        self.assertReported(self.errors, 'has wrong id')
+
+    def test_reports_corrupted_chunk(self):
+        self.corrupt_chunk()
+        self.fsck()
+        self.assertEqual(
+            self.errors, ['chunk %s is corrupted' % self.chunk_id])
+
+    def test_does_not_checksum_chunks_if_told_not_to(self):
+        self.settings['fsck-skip-checksums'] = True
+        self.corrupt_chunk()
+        repo = self.fsck()
+        self.assertEqual(self.errors, [])
+        self.assertEqual(repo.validate_chunk_content(self.chunk_id), None)
+
+    def test_warns_about_chunk_missing_from_indexes(self):
+        repo = self.open_repo()
+        chunk_id = repo.put_chunk_content('bar')
+        repo.flush_chunks()
+        repo.close()
+
+        self.fsck()
+        self.assertEqual(
+            self.warnings,
+            ['chunk %s is not in the chunk indexes' % chunk_id])
+
+    def test_reports_indexed_chunk_missing_from_chunk_store(self):
+        os.remove(self.chunk_bag_filename())
+        self.fsck()
+        self.assertEqual(
+            self.errors,
+            ['chunk %s is in the chunk indexes, but not in the chunk store' %
+             self.chunk_id])
+
+    def test_reports_missing_directory_object(self):
+        for filename in self.find_bag_files(self.find_client_dirname()):
+            os.remove(filename)
+        self.fsck()
+        self.assertReported(self.errors, 'fooclient:1:/: directory object')
+
+    def test_reports_missing_directory_object_blob(self):
+        dirname = self.find_client_dirname()
+        for filename in self.find_bag_files(dirname):
+            bag_id = int(os.path.basename(filename)[:-len('.bag')], 16)
+            self.put_bag(dirname, bag_id, [])
+        self.fsck()
+        self.assertReported(self.errors, 'fooclient:1:/: directory object')
+
+    def test_reports_chunks_if_chunk_store_is_missing(self):
+        shutil.rmtree(self.pathname('chunk-store'))
+        self.fsck()
+        self.assertEqual(
+            self.errors,
+            ['chunk %s is in the chunk indexes, but not in the chunk store' %
+             self.chunk_id])
+
+    def test_warns_about_chunk_used_by_unknown_client(self):
+        repo = self.open_repo()
+        repo.lock_client_list()
+        repo.remove_client('fooclient')
+        repo.commit_client_list()
+        repo.unlock_client_list()
+        repo.close()
+
+        self.fsck()
+        self.assertEqual(
+            self.warnings,
+            ['chunk %s is used by unknown client fooclient' %
+             self.chunk_id])
+
+    def test_skips_checks_if_told_to(self):
+        for key in self.settings:
+            self.settings[key] = True
+        os.remove(self.chunk_bag_filename())
+        for filename in self.find_bag_files(self.find_client_dirname()):
+            os.remove(filename)
+        self.fsck()
+        self.assertEqual(self.errors, [])
+        self.assertEqual(self.warnings, [])
+
+    def test_skips_bags_checked_by_earlier_run(self):
+        self.journal = FakeJournal()
+        self.fsck()
+        self.assertNotEqual(self.journal.done, set())
+
+        self.corrupt_chunk()
+        self.fsck()
+        self.assertEqual(self.errors, [])
+
+    def test_stops_when_time_is_up(self):
+        self.time_is_up = lambda: True
+        self.corrupt_chunk()
+        self.fsck()
+        self.assertEqual(self.errors, [])
+        self.assertTrue(
+            any(work.interrupted for work in self.items
+                if isinstance(work, obnamlib.CheckGAChunkStore)))
+
+
+class GAFsckCheckedChunksTests(GAFsckTestCase):
+
+    def test_answers_chunk_questions_from_checked_chunks(self):
+        repo = self.fsck()
+        self.corrupt_chunk()
+        self.assertTrue(repo.has_chunk(self.chunk_id))
+        self.assertFalse(repo.has_chunk('123.0'))
+        self.assertTrue(repo.validate_chunk_content(self.chunk_id))
+        self.assertEqual(repo.get_chunk_ids(), [self.chunk_id])
+
+    def test_remembers_corrupted_chunk(self):
+        self.corrupt_chunk()
+        repo = self.fsck()
+        self.assertFalse(repo.validate_chunk_content(self.chunk_id))
+
+    def test_reads_chunk_store_if_chunks_have_not_been_checked(self):
+        repo = self.open_repo()
+        self.corrupt_chunk()
+        self.assertFalse(repo.validate_chunk_content(self.chunk_id))
+
+    def test_reads_chunk_store_if_fsck_was_interrupted(self):
+        self.time_is_up = lambda: True
+        repo = self.fsck()
+        os.remove(self.chunk_bag_filename())
+        self.assertFalse(repo.has_chunk(self.chunk_id))
+        self.assertEqual(repo.get_chunk_ids(), [])
+
+    def test_reads_chunk_store_if_fsck_was_resumed(self):
+        self.journal = FakeJournal()
+        self.fsck()
+        repo = self.fsck()
+        os.remove(self.chunk_bag_filename())
+        self.assertFalse(repo.has_chunk(self.chunk_id))
@@ -21,43 +21,193 @@ import os
 import obnamlib
 
 
-class GAChunkIndexes(object):
+# The chunk indexes are split into shards by the first hex digit of
+# the chunk token. Each shard is in its own directory, with its own
+# lock, so that clients that add chunks to different shards don't
+# need to wait for each other.
+SHARD_PREFIXES = '0123456789abcdef'
 
-    _well_known_blob = 'root'
+
+class GAChunkIndexes(object):
 
     def __init__(self):
         self._fs = None
         self._checksum_name = None
         self.set_dirname('chunk-indexes')
-        self.clear()
 
     def set_fs(self, fs):
         self._fs = fs
+        for shard in self._shards:
+            shard.set_fs(fs)
 
         # Load the data so that we can get the in-use checksum
         # algorithm at once, before we use the default, just in case
-        # they're different.
-        self._load_data()
+        # they're different. Any shard with data will tell us.
+        for shard in self._shards:
+            name = shard.get_stored_checksum_name()
+            if name is not None:
+                self._set_checksum_name(name)
+                break
 
     def set_default_checksum_algorithm(self, name):
         if self._checksum_name is None:
-            self._checksum_name = name
+            self._set_checksum_name(name)
+
+    def _set_checksum_name(self, name):
+        self._checksum_name = name
+        for shard in self._shards:
+            shard.set_checksum_name(name)
 
     def set_dirname(self, dirname):
         self._dirname = dirname
+        self._shards = [
+            GAChunkIndexShard(
+                os.path.join(dirname, 'shard-%s' % prefix), prefix)
+            for prefix in SHARD_PREFIXES]
+        self._shards_by_prefix = dict(
+            (shard.get_prefix(), shard) for shard in self._shards)
+        if self._fs is not None:  # pragma: no cover
+            self.set_fs(self._fs)
 
     def get_dirname(self):
         return self._dirname
 
+    def get_shards(self):
+        return self._shards
+
+    def _get_shard(self, token):
+        return self._shards_by_prefix[token[0]]
+
+    def get_lock_dirnames(self, tokens=None):
+        '''Return the directories to lock to add chunks with tokens.
+
+        If tokens is None, return the directories of all shards.
+
+        '''
+
+        if tokens is None:
+            shards = self._shards
+        else:
+            shards = set(self._get_shard(token) for token in tokens)
+        return sorted(shard.get_dirname() for shard in shards)
+
+    def get_lock_groups(self, tokens):
+        '''Group tokens by shard, in the order shards are locked.'''
+        groups = {}
+        for token in tokens:
+            groups.setdefault(token[0], []).append(token)
+        return [groups[prefix] for prefix in sorted(groups)]
+
     def clear(self):
+        for shard in self._shards:
+            shard.clear()
+
+    def commit(self):
+        # Only shards that have been changed are written. They're
+        # also the only ones we're sure to have locked.
+        for shard in self._shards:
+            shard.commit()
+
+    def prepare_chunk_for_indexes(self, chunk_content):
+        summer = obnamlib.get_checksum_algorithm(self._checksum_name)
+        summer.update(chunk_content)
+        return summer.hexdigest()
+
+    def put_chunk_into_indexes(self, chunk_id, token, client_id):
+        self._get_shard(token).put_chunk_into_indexes(
+            chunk_id, token, client_id)
+
+    def get_chunk_token(self, chunk_id):
+        '''Return the token for a chunk, or None if it is not indexed.'''
+        for shard in self._shards:
+            token = shard.get_chunk_token(chunk_id)
+            if token is not None:
+                return token
+        return None
+
+    def chunk_has_token(self, chunk_id, token):
+        '''Is the chunk in the indexes with the given token?'''
+        return self._get_shard(token).get_chunk_token(chunk_id) == token
+
+    def find_chunk_ids_by_token(self, token):
+        return self._get_shard(token).find_chunk_ids_by_token(token)
+
+    def _find_shard_for_chunk_id(self, chunk_id):
+        # A removed chunk may still be listed in the used_by index of
+        # its shard, even if it no longer has a token.
+        for shard in self._shards:
+            if shard.has_chunk_id(chunk_id):
+                return shard
+        return None
+
+    def remove_chunk_from_indexes(self, chunk_id, client_id):
+        shard = self._find_shard_for_chunk_id(chunk_id)
+        if shard is not None:
+            shard.remove_chunk_from_indexes(chunk_id, client_id)
+
+    def remove_chunk_from_indexes_for_all_clients(self, chunk_id):
+        shard = self._find_shard_for_chunk_id(chunk_id)
+        if shard is not None:
+            shard.remove_chunk_from_indexes_for_all_clients(chunk_id)
+
+    def remove_unused_chunks(self, chunk_store):
+        # FIXME: This requires having a way to list keys in a CowTree.
+        pass
+
+    def validate_chunk_content(self, chunk_id):
+        return None
+
+
+class GAChunkIndexShard(object):
+
+    '''One shard of the chunk indexes.
+
+    A shard holds the chunks whose tokens start with its prefix, and
+    has the three index trees for them.
+
+    '''
+
+    _well_known_blob = 'root'
+
+    def __init__(self, dirname, prefix):
+        self._fs = None
+        self._dirname = dirname
+        self._prefix = prefix
+        self._checksum_name = None
+        self._bag_store = None
+        self.clear()
+
+    def set_fs(self, fs):
+        self._fs = fs
+
+    def set_checksum_name(self, name):
+        self._checksum_name = name
+
+    def get_stored_checksum_name(self):
+        self._load_data()
+        return self._stored_checksum_name
+
+    def get_dirname(self):
+        return self._dirname
+
+    def get_prefix(self):
+        return self._prefix
+
+    def clear(self):
+        if self._bag_store is not None:
+            self._bag_store.release_unused_bag_ids()
+            self._bag_store = None
         self._data_is_loaded = False
+        self._is_dirty = False
+        self._stored_checksum_name = None
         self._by_chunk_id_tree = None
         self._by_checksum_tree = None
         self._used_by_tree = None
 
     def commit(self):
-        self._load_data()
-        self._save_data()
+        if self._is_dirty:
+            self._save_data()
+            self._is_dirty = False
 
     def _save_data(self):
         root = {
@@ -75,11 +225,13 @@ class GAChunkIndexes(object):
         blob_store = obnamlib.BlobStore()
         blob_store.set_bag_store(bag_store)
         blob_store.put_well_known_blob(self._well_known_blob, blob)
+        self._stored_checksum_name = self._checksum_name
 
     def _load_data(self):
         if not self._data_is_loaded:
             bag_store = obnamlib.BagStore()
             bag_store.set_location(self._fs, self.get_dirname())
+            self._bag_store = bag_store
 
             blob_store = obnamlib.BlobStore()
             blob_store.set_bag_store(bag_store)
@@ -94,7 +246,7 @@ class GAChunkIndexes(object):
                 self._used_by_tree = self._empty_cowtree(leaf_store)
             else:
                 data = obnamlib.deserialise_object(blob)
-                self._checksum_name = data['checksum_algorithm']
+                self._stored_checksum_name = data['checksum_algorithm']
 
                 self._by_chunk_id_tree = self._load_cowtree(
                     leaf_store, data['by_chunk_id'])
@@ -115,16 +267,9 @@ class GAChunkIndexes(object):
         cow.set_list_node(list_id)
         return cow
 
-    def _get_filename(self):
-        return os.path.join(self.get_dirname(), 'data.dat')
-
-    def prepare_chunk_for_indexes(self, chunk_content):
-        summer = obnamlib.get_checksum_algorithm(self._checksum_name)
-        summer.update(chunk_content)
-        return summer.hexdigest()
-
     def put_chunk_into_indexes(self, chunk_id, token, client_id):
         self._load_data()
+        self._is_dirty = True
 
         self._by_chunk_id_tree.insert(chunk_id, token)
 
@@ -142,6 +287,24 @@ class GAChunkIndexes(object):
             client_ids.append(client_id)
         self._used_by_tree.insert(chunk_id, client_ids)
 
+    def get_chunk_token(self, chunk_id):
+        self._load_data()
+        return self._by_chunk_id_tree.lookup(chunk_id)
+
+    def has_chunk_id(self, chunk_id):
+        self._load_data()
+        return (self._by_chunk_id_tree.lookup(chunk_id) is not None or
+                self._used_by_tree.lookup(chunk_id) is not None)
+
+    def get_fsck_trees(self):
+        '''Return (name, CowTree) pairs for the index trees, for fsck.'''
+        self._load_data()
+        return [
+            ('by_chunk_id', self._by_chunk_id_tree),
+            ('by_checksum', self._by_checksum_tree),
+            ('used_by', self._used_by_tree),
+        ]
+
     def find_chunk_ids_by_token(self, token):
         self._load_data()
         result = self._by_checksum_tree.lookup(token)
@@ -151,12 +314,14 @@ class GAChunkIndexes(object):
 
     def remove_chunk_from_indexes(self, chunk_id, client_id):
         self._load_data()
+        self._is_dirty = True
         if not self._remove_used_by(chunk_id, client_id):
             token = self._remove_chunk_by_id(chunk_id)
             self._remove_chunk_by_checksum(chunk_id, token)
 
     def remove_chunk_from_indexes_for_all_clients(self, chunk_id):
         self._load_data()
+        self._is_dirty = True
         token = self._remove_chunk_by_id(chunk_id)
         self._remove_chunk_by_checksum(chunk_id, token)
         self._remove_all_used_by(chunk_id)
@@ -190,10 +355,3 @@ class GAChunkIndexes(object):
 
     def _remove_all_used_by(self, chunk_id):
         self._used_by_tree.insert(chunk_id, None)
-
-    def remove_unused_chunks(self, chunk_store):
-        # FIXME: This requires having a way to list keys in a CowTree.
-        pass
-
-    def validate_chunk_content(self, chunk_id):
-        return None
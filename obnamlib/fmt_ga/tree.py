@@ -77,7 +77,7 @@ class GATree(object):
         blob = self._blob_store.get_blob(dir_id)
         if blob is None:  # pragma: no cover
             return None
-        as_dict = obnamlib.deserialise_object(blob)
+        as_dict = obnamlib.deserialise_object(blob, lazy=True)
         dir_obj = obnamlib.create_gadirectory_from_dict(as_dict)
         dir_obj.set_immutable()
         return dir_obj
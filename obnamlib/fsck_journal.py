@@ -0,0 +1,169 @@
+# Copyright (C) 2016  Lars Wirzenius
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import ast
+import logging
+import os
+import re
+
+import obnamlib
+
+
+class FsckBudgetSyntaxError(obnamlib.ObnamError):
+
+    msg = ('Cannot parse --fsck-budget value {budget!r}: '
+           'use a number with an optional unit of s, m, h, or d')
+
+
+def parse_fsck_budget(budget):
+    '''Return the number of seconds in an fsck time budget.
+
+    A budget is a number with an optional unit (s, m, h, or d). The
+    default unit is seconds.
+
+    '''
+
+    m = re.match(r'^([0-9]+)([smhd])?$', budget.strip())
+    if m is None:
+        raise FsckBudgetSyntaxError(budget=budget)
+    units = {
+        's': 1,
+        'm': 60,
+        'h': 60 * 60,
+        'd': 24 * 60 * 60,
+    }
+    return int(m.group(1)) * units[m.group(2) or 's']
+
+
+class FsckJournal(object):
+
+    '''Record fsck progress in a local file, so that it can be resumed.
+
+    The journal remembers which work items are done, and which chunks
+    have been found to be in use. Each is appended to the file as one
+    line, so a run that is killed loses only what it hadn't flushed
+    yet. Everything written before a done item is flushed with it.
+
+    '''
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._done = set()
+        self._seen = set()
+        self._file = None
+        self._needs_newline = False
+        self._made_progress = False
+
+    def load(self):
+        if not os.path.exists(self._filename):
+            return
+        with open(self._filename) as f:
+            for line in f:
+                self._needs_newline = not line.endswith('\n')
+                kind, _, value = line.rstrip('\n').partition(' ')
+                try:
+                    value = ast.literal_eval(value)
+                except (SyntaxError, ValueError):
+                    # The last line is incomplete, if the previous
+                    # run was killed while writing it.
+                    logging.warning(
+                        'Ignoring broken fsck journal line: %r', line)
+                    continue
+                if kind == 'done':
+                    self._done.add(value)
+                elif kind == 'seen':
+                    self._seen.add(value)
+        logging.info(
+            'Loaded fsck journal %s: %d items done, %d chunks seen',
+            self._filename, len(self._done), len(self._seen))
+
+    def open(self, resume):
+        dirname = os.path.dirname(self._filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self._file = open(self._filename, 'a' if resume else 'w')
+        if resume and self._needs_newline:
+            self._file.write('\n')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self._filename):
+            os.remove(self._filename)
+
+    def is_done(self, key):
+        return key in self._done
+
+    def mark_done(self, key):
+        self._done.add(key)
+        self._file.write('done %r\n' % (key,))
+        self._file.flush()
+        self._made_progress = True
+
+    def made_progress(self):
+        '''Has anything been marked done since the journal was opened?'''
+        return self._made_progress
+
+    def is_item_done(self, work):
+        return getattr(work, 'resumable', False) and self.is_done(work.name)
+
+    def finish_item(self, work, record=True):
+        '''Record that a work item, and all the items it produced, are done.
+
+        The fsck plugin sets fsck_parent on each item to the item that
+        produced it, and fsck_pending to the number of items it
+        produced that aren't finished yet. When the last of them is
+        finished, so is the parent. Only resumable items are recorded.
+        If record is False, the item was done in an earlier run, and
+        is recorded already.
+
+        '''
+
+        while work is not None:
+            if record and getattr(work, 'resumable', False):
+                self.mark_done(work.name)
+            parent = getattr(work, 'fsck_parent', None)
+            if parent is None:
+                break
+            parent.fsck_pending -= 1
+            if parent.fsck_pending > 0:
+                break
+            work = parent
+            record = True
+
+    def get_chunkids_seen(self):
+        return self._seen
+
+    def add_seen(self, chunkid):
+        self._file.write('seen %r\n' % (chunkid,))
+
+
+class JournalledChunkIds(set):
+
+    '''A set of chunk ids that records new ones in the fsck journal.'''
+
+    def __init__(self, journal):
+        set.__init__(self, journal.get_chunkids_seen())
+        self._journal = journal
+
+    def add(self, chunkid):
+        if chunkid not in self:
+            set.add(self, chunkid)
+            self._journal.add_seen(chunkid)
@@ -0,0 +1,265 @@
+# Copyright (C) 2016  Lars Wirzenius
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import obnamlib
+
+
+class ParseFsckBudgetTests(unittest.TestCase):
+
+    def test_parses_unadorned_number_as_seconds(self):
+        self.assertEqual(obnamlib.parse_fsck_budget('123'), 123)
+
+    def test_parses_seconds(self):
+        self.assertEqual(obnamlib.parse_fsck_budget('10s'), 10)
+
+    def test_parses_minutes(self):
+        self.assertEqual(obnamlib.parse_fsck_budget('10m'), 600)
+
+    def test_parses_hours(self):
+        self.assertEqual(obnamlib.parse_fsck_budget('2h'), 7200)
+
+    def test_parses_days(self):
+        self.assertEqual(obnamlib.parse_fsck_budget('1d'), 86400)
+
+    def test_ignores_surrounding_whitespace(self):
+        self.assertEqual(obnamlib.parse_fsck_budget(' 5m\n'), 300)
+
+    def test_rejects_empty_string(self):
+        self.assertRaises(
+            obnamlib.FsckBudgetSyntaxError, obnamlib.parse_fsck_budget, '')
+
+    def test_rejects_unknown_unit(self):
+        self.assertRaises(
+            obnamlib.FsckBudgetSyntaxError, obnamlib.parse_fsck_budget, '5w')
+
+    def test_rejects_fractions(self):
+        self.assertRaises(
+            obnamlib.FsckBudgetSyntaxError, obnamlib.parse_fsck_budget,
+            '1.5h')
+
+    def test_rejects_negative_number(self):
+        self.assertRaises(
+            obnamlib.FsckBudgetSyntaxError, obnamlib.parse_fsck_budget, '-5')
+
+    def test_rejects_unit_without_number(self):
+        self.assertRaises(
+            obnamlib.FsckBudgetSyntaxError, obnamlib.parse_fsck_budget, 'h')
+
+
+class FakeWorkItem(object):
+
+    def __init__(self, name, resumable=True, parent=None, pending=0):
+        self.name = name
+        self.resumable = resumable
+        self.fsck_parent = parent
+        self.fsck_pending = pending
+
+
+class FsckJournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'cache', 'journal')
+        self.journal = self.new_journal(resume=False)
+
+        # Loading a broken journal logs a warning. Keep it out of the
+        # test output.
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.journal.close()
+        shutil.rmtree(self.tempdir)
+
+    def new_journal(self, resume=True):
+        journal = obnamlib.FsckJournal(self.filename)
+        if resume:
+            journal.load()
+        journal.open(resume)
+        return journal
+
+    def reopen(self):
+        self.journal.close()
+        self.journal = self.new_journal()
+
+    def test_creates_missing_directory(self):
+        self.assertTrue(os.path.exists(self.filename))
+
+    def test_has_nothing_done_initially(self):
+        self.assertFalse(self.journal.is_done('foo'))
+        self.assertEqual(self.journal.get_chunkids_seen(), set())
+
+    def test_loading_missing_file_gives_empty_journal(self):
+        journal = obnamlib.FsckJournal(os.path.join(self.tempdir, 'nope'))
+        journal.load()
+        self.assertFalse(journal.is_done('foo'))
+
+    def test_has_made_no_progress_initially(self):
+        self.assertFalse(self.journal.made_progress())
+
+    def test_has_made_progress_after_marking_item_done(self):
+        self.journal.mark_done('foo')
+        self.assertTrue(self.journal.made_progress())
+
+    def test_progress_is_not_carried_over_to_resumed_run(self):
+        self.journal.mark_done('foo')
+        self.reopen()
+        self.assertFalse(self.journal.made_progress())
+
+    def test_remembers_done_items_over_resume(self):
+        self.journal.mark_done('foo')
+        self.journal.mark_done(('bar', 1))
+        self.reopen()
+        self.assertTrue(self.journal.is_done('foo'))
+        self.assertTrue(self.journal.is_done(('bar', 1)))
+        self.assertFalse(self.journal.is_done('foobar'))
+
+    def test_remembers_seen_chunks_over_resume(self):
+        self.journal.add_seen(123)
+        self.journal.add_seen('456.7')
+        self.reopen()
+        self.assertEqual(self.journal.get_chunkids_seen(), set([123, '456.7']))
+
+    def test_starting_without_resume_forgets_earlier_run(self):
+        self.journal.mark_done('foo')
+        self.journal.close()
+        self.journal = self.new_journal(resume=False)
+        self.journal.close()
+        self.journal = self.new_journal()
+        self.assertFalse(self.journal.is_done('foo'))
+
+    def test_ignores_broken_lines(self):
+        self.journal.mark_done('foo')
+        self.journal.close()
+        with open(self.filename, 'a') as f:
+            f.write('done \'bar\n')
+            f.write('done this is not python\n')
+        self.journal = self.new_journal()
+        self.assertTrue(self.journal.is_done('foo'))
+        self.assertFalse(self.journal.is_done('bar'))
+
+    def test_continues_after_truncated_last_line(self):
+        self.journal.mark_done('foo')
+        self.journal.close()
+        with open(self.filename, 'a') as f:
+            f.write('done \'ba')
+        self.journal = self.new_journal()
+        self.journal.mark_done('bar')
+        self.reopen()
+        self.assertTrue(self.journal.is_done('foo'))
+        self.assertTrue(self.journal.is_done('bar'))
+
+    def test_remove_deletes_file(self):
+        self.journal.remove()
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_says_resumable_item_is_done(self):
+        self.journal.mark_done('foo')
+        self.assertTrue(self.journal.is_item_done(FakeWorkItem('foo')))
+        self.assertFalse(self.journal.is_item_done(FakeWorkItem('bar')))
+
+    def test_never_says_non_resumable_item_is_done(self):
+        self.journal.mark_done('foo')
+        work = FakeWorkItem('foo', resumable=False)
+        self.assertFalse(self.journal.is_item_done(work))
+
+    def test_finishing_item_marks_it_done(self):
+        self.journal.finish_item(FakeWorkItem('foo'))
+        self.reopen()
+        self.assertTrue(self.journal.is_done('foo'))
+
+    def test_finishing_non_resumable_item_does_not_mark_it_done(self):
+        self.journal.finish_item(FakeWorkItem('foo', resumable=False))
+        self.assertFalse(self.journal.is_done('foo'))
+
+    def test_finishing_item_without_recording_does_not_mark_it_done(self):
+        self.journal.finish_item(FakeWorkItem('foo'), record=False)
+        self.assertFalse(self.journal.is_done('foo'))
+
+    def test_parent_is_done_when_all_its_items_are(self):
+        parent = FakeWorkItem('parent', pending=2)
+        first = FakeWorkItem('first', parent=parent)
+        second = FakeWorkItem('second', parent=parent)
+
+        self.journal.finish_item(first)
+        self.assertTrue(self.journal.is_done('first'))
+        self.assertFalse(self.journal.is_done('parent'))
+
+        self.journal.finish_item(second)
+        self.assertTrue(self.journal.is_done('parent'))
+
+    def test_completion_propagates_through_non_resumable_items(self):
+        grandparent = FakeWorkItem('grandparent', pending=1)
+        parent = FakeWorkItem(
+            'parent', resumable=False, parent=grandparent, pending=1)
+        child = FakeWorkItem('child', parent=parent)
+
+        self.journal.finish_item(child)
+        self.assertFalse(self.journal.is_done('parent'))
+        self.assertTrue(self.journal.is_done('grandparent'))
+
+    def test_parent_of_item_done_earlier_is_recorded(self):
+        parent = FakeWorkItem('parent', pending=1)
+        child = FakeWorkItem('child', parent=parent)
+
+        self.journal.finish_item(child, record=False)
+        self.assertFalse(self.journal.is_done('child'))
+        self.assertTrue(self.journal.is_done('parent'))
+
+
+class JournalledChunkIdsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'journal')
+        self.journal = obnamlib.FsckJournal(self.filename)
+        self.journal.open(False)
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.tempdir)
+
+    def reload(self):
+        self.journal.close()
+        self.journal = obnamlib.FsckJournal(self.filename)
+        self.journal.load()
+        self.journal.open(True)
+
+    def test_records_added_chunk_ids(self):
+        chunkids = obnamlib.JournalledChunkIds(self.journal)
+        chunkids.add(123)
+        self.assertIn(123, chunkids)
+        self.reload()
+        self.assertEqual(self.journal.get_chunkids_seen(), set([123]))
+
+    def test_starts_with_chunk_ids_seen_in_earlier_run(self):
+        obnamlib.JournalledChunkIds(self.journal).add(123)
+        self.reload()
+        self.assertEqual(obnamlib.JournalledChunkIds(self.journal), set([123]))
+
+    def test_records_each_chunk_id_once(self):
+        chunkids = obnamlib.JournalledChunkIds(self.journal)
+        chunkids.add(123)
+        chunkids.add(123)
+        self.journal.close()
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), 'seen 123\n')
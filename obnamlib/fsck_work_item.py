@@ -32,3 +32,17 @@ class WorkItem(larch.fsck.WorkItem):
     repo = None
     chunkids_seen = None
     settings = None
+
+    # Set resumable to True for items whose name is unique in the
+    # repository. The fsck plugin records in its journal when such an
+    # item, and all the work it produced, is done, and skips the item
+    # when an interrupted run is resumed.
+    resumable = False
+
+    # Set by the fsck plugin. An item that does a lot of work by itself
+    # may use the journal for its own progress, and should check
+    # time_is_up() now and then. If time is up, the item sets
+    # interrupted to True and returns early.
+    journal = None
+    time_is_up = None
+    interrupted = False
@@ -26,11 +26,12 @@ application) will register callbacks.
 '''
 
 
-import tracing
-
 import obnamlib
 
 
+tracer = obnamlib.Tracer(__file__)
+
+
 class Hook(object):
 
     '''A hook.'''
@@ -131,17 +132,19 @@ class FilterHook(Hook):
         return data
 
     def run_filter_write(self, data, *args, **kwargs):
-        tracing.trace('called')
+        tracer.trace('called')
         data = "\0" + data
         for filt in self.callbacks:
-            tracing.trace('calling %s' % filt)
+            if tracer.enabled:
+                tracer.trace('calling %s', filt)
             new_data = filt.filter_write(data, *args, **kwargs)
             assert new_data is not None, \
                 filt.tag + ": Returned None from filter_write()"
             if data != new_data:
-                tracing.trace('filt.tag=%s' % filt.tag)
+                if tracer.enabled:
+                    tracer.trace('filt.tag=%s', filt.tag)
                 data = filt.tag + "\0" + new_data
-        tracing.trace('done')
+        tracer.trace('done')
         return data
 
 
@@ -14,7 +14,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import logging
 import os
+import random
 import time
 
 import obnamlib
@@ -22,18 +24,33 @@ import obnamlib
 
 class LockManager(object):
 
-    '''Lock and unlock sets of directories at once.'''
+    '''Lock and unlock sets of directories at once.
+
+    If a lock is held by someone else, wait for it with exponential
+    backoff, from min_delay to max_delay seconds between attempts.
+    The delays are randomised, so that clients waiting for the same
+    lock don't all try again at the same moment. The VFS may end a
+    wait early, when the lock file is removed.
+
+    The time spent waiting for locks is logged, and kept in
+    wait_time.
+
+    '''
+
+    min_delay = 0.05
+    max_delay = 2.0
 
     def __init__(self, fs, timeout, client):
         self._fs = fs
         self.timeout = timeout
         self._got_locks = []
+        self.wait_time = 0.0
 
     def _time(self):  # pragma: no cover
         return time.time()
 
-    def _sleep(self):  # pragma: no cover
-        time.sleep(1)
+    def _sleep(self, lock_name, delay):  # pragma: no cover
+        self._fs.wait_for_removal(lock_name, delay)
 
     def sort(self, dirnames):
         def bytelist(s):
@@ -44,20 +61,36 @@ class LockManager(object):
         return os.path.join(dirname, 'lock')
 
     def _lock_one(self, dirname):
+        lock_name = self.get_lock_name(dirname)
         started = self._time()
+        delay = self.min_delay
+        attempts = 0
         while True:
-            lock_name = self.get_lock_name(dirname)
+            attempts += 1
             try:
                 self._fs.lock(lock_name)
             except obnamlib.LockFail:
-                if self._time() - started >= self.timeout:
+                waited = self._time() - started
+                if waited >= self.timeout:
+                    self._log_wait(lock_name, waited, attempts, 'timed out')
                     raise obnamlib.LockFail(
                         lock_name=lock_name,
                         reason='timeout')
             else:
                 self._got_locks.append(dirname)
+                if attempts > 1:
+                    waited = self._time() - started
+                    self._log_wait(lock_name, waited, attempts, 'got lock')
                 return
-            self._sleep()
+            jittered = random.uniform(delay / 2, delay)
+            self._sleep(lock_name, min(jittered, self.timeout - waited))
+            delay = min(delay * 2, self.max_delay)
+
+    def _log_wait(self, lock_name, waited, attempts, outcome):
+        self.wait_time += waited
+        logging.info(
+            'Lock wait: %s: %s after %.3f s and %d attempts',
+            lock_name, outcome, waited, attempts)
 
     def _unlock_one(self, dirname):
         self._fs.unlock(self.get_lock_name(dirname))
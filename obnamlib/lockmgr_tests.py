@@ -40,7 +40,7 @@ class LockManagerTests(unittest.TestCase):
         self.now = 0
         self.lm = obnamlib.LockManager(self.fs, self.timeout, '')
         self.lm._time = self.fake_time
-        self.lm._sleep = lambda: None
+        self.lm._sleep = lambda lock_name, delay: None
 
     def tearDown(self):
         shutil.rmtree(self.tempdir)
@@ -72,11 +72,28 @@ class LockManagerTests(unittest.TestCase):
 
     def test_notices_when_preexisting_lock_goes_away(self):
         self.lm.lock([self.dirnames[0]])
-        self.lm._sleep = lambda: os.remove(
-            self.lm.get_lock_name(self.dirnames[0]))
+        self.lm._sleep = lambda lock_name, delay: os.remove(lock_name)
         self.lm.lock([self.dirnames[0]])
         self.assertTrue(self.lm.is_locked(self.dirnames[0]))
 
+    def test_backs_off_between_attempts(self):
+        delays = []
+        self.lm._sleep = lambda lock_name, delay: delays.append(delay)
+        self.lm.lock([self.dirnames[0]])
+        self.assertRaises(obnamlib.LockFail,
+                          self.lm.lock, [self.dirnames[0]])
+        self.assertTrue(delays)
+        self.assertTrue(delays[0] <= self.lm.min_delay)
+        self.assertTrue(max(delays) <= self.lm.max_delay)
+        self.assertTrue(delays[-1] > delays[0])
+
+    def test_records_time_spent_waiting(self):
+        self.lm.lock([self.dirnames[0]])
+        self.assertEqual(self.lm.wait_time, 0)
+        self.assertRaises(obnamlib.LockFail,
+                          self.lm.lock, [self.dirnames[0]])
+        self.assertTrue(self.lm.wait_time >= self.timeout)
+
     def test_locks_all_directories(self):
         self.lm.lock(self.dirnames)
         for dirname in self.dirnames:
@@ -22,11 +22,13 @@ import pwd
 import stat
 import struct
 import sys
-import tracing
 
 import obnamlib
 
 
+tracer = obnamlib.Tracer(__file__)
+
+
 metadata_verify_fields = (
     'st_mode', 'st_mtime_sec', 'st_mtime_nsec',
     'st_nlink', 'st_size', 'st_uid', 'groupname', 'username', 'target',
@@ -35,6 +37,7 @@ metadata_verify_fields = (
 metadata_fields = metadata_verify_fields + (
     'st_blocks', 'st_dev', 'st_gid', 'st_ino', 'st_atime_sec',
     'st_atime_nsec', 'md5', 'sha224', 'sha256', 'sha384', 'sha512', 'test',
+    'blake2b', 'blake2s',
 )
 
 
@@ -141,7 +144,7 @@ def _cached_getgrgid(gid):  # pragma: no cover
 
 
 def get_xattrs_as_blob(fs, filename):  # pragma: no cover
-    tracing.trace('filename=%s' % filename)
+    tracer.trace('filename=%s', filename)
 
     try:
         names = fs.llistxattr(filename)
@@ -149,13 +152,13 @@ def get_xattrs_as_blob(fs, filename):  # pragma: no cover
         if e.errno in (errno.EOPNOTSUPP, errno.EACCES):
             return None
         raise
-    tracing.trace('names=%s' % repr(names))
+    tracer.trace('names=%r', names)
     if not names:
         return None
 
     values = []
     for name in names[:]:
-        tracing.trace('trying name %s' % repr(name))
+        tracer.trace('trying name %r', name)
         try:
             value = fs.lgetxattr(filename, name)
         except OSError, e:
@@ -174,7 +177,7 @@ def get_xattrs_as_blob(fs, filename):  # pragma: no cover
             else:
                 raise
         else:
-            tracing.trace('lgetxattr(%s)=%s' % (name, value))
+            tracer.trace('lgetxattr(%s)=%s', name, value)
             values.append(value)
     assert len(names) == len(values)
 
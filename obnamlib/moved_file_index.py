@@ -0,0 +1,60 @@
+# Copyright (C) 2016  Lars Wirzenius
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+class MovedFileIndex(object):
+
+    '''Find files whose data has been backed up under another name.
+
+    Files are identified by device and inode numbers, size, and
+    modification time. If a file has the same identity as a file
+    already in the index, it has been renamed, moved, or hard linked,
+    and its chunk ids can be copied from the other file, without
+    reading the data again.
+
+    The index maps the identity to the generation and pathname of the
+    other file, rather than its chunk ids, to keep memory use small.
+
+    '''
+
+    def __init__(self):
+        self._files = {}
+
+    def __len__(self):
+        return len(self._files)
+
+    def get_identity(self, metadata):
+        return (
+            metadata.st_dev,
+            metadata.st_ino,
+            metadata.st_size,
+            metadata.st_mtime_sec,
+            metadata.st_mtime_nsec,
+        )
+
+    def add(self, metadata, gen_id, pathname):
+        self._files[self.get_identity(metadata)] = (gen_id, pathname)
+
+    def get(self, metadata):
+        '''Return (gen_id, pathname) of a file with the same identity.
+
+        Return None if there isn't one.
+
+        '''
+
+        return self._files.get(self.get_identity(metadata))
+
+    def remove(self, metadata):
+        self._files.pop(self.get_identity(metadata), None)
@@ -0,0 +1,72 @@
+# Copyright (C) 2016  Lars Wirzenius
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import obnamlib
+
+
+class MovedFileIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = obnamlib.MovedFileIndex()
+        self.metadata = self.make_metadata()
+
+    def make_metadata(self, **kwargs):
+        values = {
+            'st_dev': 1,
+            'st_ino': 2,
+            'st_size': 3,
+            'st_mtime_sec': 4,
+            'st_mtime_nsec': 5,
+        }
+        values.update(kwargs)
+        return obnamlib.Metadata(**values)
+
+    def test_is_empty_initially(self):
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(self.index.get(self.metadata), None)
+
+    def test_finds_added_file(self):
+        self.index.add(self.metadata, 'gen', '/foo')
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.get(self.metadata), ('gen', '/foo'))
+
+    def test_finds_file_by_identity_only(self):
+        self.index.add(self.metadata, 'gen', '/foo')
+        other = self.make_metadata(st_mode=0644, st_nlink=2, st_uid=0)
+        self.assertEqual(self.index.get(other), ('gen', '/foo'))
+
+    def test_does_not_find_file_with_other_identity(self):
+        self.index.add(self.metadata, 'gen', '/foo')
+        for field in ('st_dev', 'st_ino', 'st_size',
+                      'st_mtime_sec', 'st_mtime_nsec'):
+            other = self.make_metadata(**{field: 42})
+            self.assertEqual(self.index.get(other), None)
+
+    def test_later_file_replaces_earlier_one(self):
+        self.index.add(self.metadata, 'gen', '/foo')
+        self.index.add(self.metadata, None, '/bar')
+        self.assertEqual(self.index.get(self.metadata), (None, '/bar'))
+
+    def test_removes_file(self):
+        self.index.add(self.metadata, 'gen', '/foo')
+        self.index.remove(self.metadata)
+        self.assertEqual(self.index.get(self.metadata), None)
+
+    def test_removing_missing_file_is_ok(self):
+        self.index.remove(self.metadata)
+        self.assertEqual(len(self.index), 0)
@@ -16,9 +16,23 @@
 # =*= License: GPL-3+ =*=
 
 
+import collections
 import struct
 
 
+# Use the C implementation in the _obnam extension, if it's there.
+# The Python one is used otherwise, and for lazy deserialisation. The
+# two produce identical encodings.
+
+try:
+    from obnamlib._obnam import (
+        serialise_object as c_serialise_object,
+        deserialise_object as c_deserialise_object)
+except ImportError:  # pragma: no cover
+    c_serialise_object = None
+    c_deserialise_object = None
+
+
 # Constants for encoding the type of a value.
 
 _NONE = 'n'
@@ -37,35 +51,58 @@ _length_size = struct.calcsize(_length_fmt)
 
 
 def serialise_object(obj):
+    if c_serialise_object is not None:
+        # The C code calls us back for types it doesn't handle.
+        return c_serialise_object(obj, serialise_object_in_python)
+    return serialise_object_in_python(obj)
+
+
+def deserialise_object(serialised, lazy=False):
+    # If lazy is true, dicts are decoded as LazyDict, which decodes
+    # values only when they're used. That's only done in Python.
+    if c_deserialise_object is not None and not lazy:
+        return c_deserialise_object(serialised)
+    return deserialise_object_in_python(serialised, lazy=lazy)
+
+
+def serialise_object_in_python(obj):
     func = _serialisers[type(obj)]
     return func(obj)
 
 
-def deserialise_object(serialised):
-    type_byte = serialised[0]
+def deserialise_object_in_python(serialised, lazy=False):
+    value, _ = _decode(serialised, 0, lazy)
+    return value
+
+
+# Decoding works on positions in the serialised string, rather than
+# slicing out each nested value first. Only strings in the result are
+# copied out of it.
 
-    # We skip decoding of the value length, since we can assume all of
-    # the rest of the value is to be decoded.
-    value = serialised[1 + _length_size:]
+def _decode(serialised, pos, lazy):
+    type_byte = serialised[pos]
+    start = pos + 1 + _length_size
+    end = start + _length_struct.unpack_from(serialised, pos + 1)[0]
+    func = _decoders[type_byte]
+    return func(serialised, start, end, lazy), end
 
-    func = _deserialisers[type_byte]
-    return func(value)
+
+def _skip(serialised, pos):
+    return (pos + 1 + _length_size +
+            _length_struct.unpack_from(serialised, pos + 1)[0])
 
 
 # The length of a value.
 
 _length_fmt = '!Q'
 _length_size = struct.calcsize(_length_fmt)
+_length_struct = struct.Struct(_length_fmt)
 
 
 def _serialise_length(num_bytes):
     return struct.pack(_length_fmt, num_bytes)
 
 
-def _deserialise_length(serialised):
-    return struct.unpack(_length_fmt, serialised)[0]
-
-
 # None.
 
 _none_size_encoded = _serialise_length(0)
@@ -75,7 +112,7 @@ def _serialise_none(obj):
     return _NONE + _none_size_encoded
 
 
-def _deserialise_none(serialised):
+def _decode_none(serialised, start, end, lazy):
     return None
 
 
@@ -86,8 +123,8 @@ def _serialise_integer(obj):
     return _INT + _serialise_length(len(s)) + s
 
 
-def _deserialise_integer(serialised):
-    return int(serialised)
+def _decode_integer(serialised, start, end, lazy):
+    return int(serialised[start:end])
 
 
 # Booleans.
@@ -101,8 +138,8 @@ def _serialise_bool(obj):
             struct.pack(_bool_fmt, chr(int(obj))))
 
 
-def _deserialise_bool(obj):
-    return bool(ord(struct.unpack(_bool_fmt, obj)[0]))
+def _decode_bool(serialised, start, end, lazy):
+    return serialised[start] != '\0'
 
 
 # Strings (byte strings).
@@ -111,38 +148,26 @@ def _serialise_str(obj):
     return _STR + _serialise_length(len(obj)) + obj
 
 
-def _deserialise_str(obj):
-    return obj
+def _decode_str(serialised, start, end, lazy):
+    return serialised[start:end]
 
 
 # Lists.
 
 def _serialise_list(obj):
-    items = ''.join(serialise_object(item) for item in obj)
+    items = ''.join(serialise_object_in_python(item) for item in obj)
     return _LIST + _serialise_length(len(items)) + items
 
 
-def _deserialise_list(serialised):
+def _decode_list(serialised, start, end, lazy):
     items = []
-    pos = 0
-    while pos < len(serialised):
-        length = _extract_length(serialised, pos)
-        end = _next_object(pos, length)
-        items.append(deserialise_object(serialised[pos:end]))
-        pos = end
+    pos = start
+    while pos < end:
+        item, pos = _decode(serialised, pos, lazy)
+        items.append(item)
     return items
 
 
-def _extract_length(serialised, pos):
-    start = pos + 1
-    end = start + _length_size
-    return _deserialise_length(serialised[start:end])
-
-
-def _next_object(pos, length):
-    return pos + 1 + _length_size + length
-
-
 # Dicts.
 
 def _serialise_dict(obj):
@@ -159,32 +184,121 @@ def _serialise_dict(obj):
     parts.append(_serialise_str_list([obj[key] for key in str_keys]))
     parts.append(_serialise_str_list(other_keys))
     for key in other_keys:
-        parts.append(serialise_object(obj[key]))
+        parts.append(serialise_object_in_python(obj[key]))
 
     encoded = ''.join(parts)
     return _DICT + _serialise_length(len(encoded)) + encoded
 
 
-def _deserialise_dict(serialised):
+def _decode_dict(serialised, start, end, lazy):
+    if lazy:
+        return LazyDict(serialised, start, end)
+
     result = {}
-    pos = 0
 
-    int_keys, pos = _deserialise_str_list(serialised, pos)
-    int_values, pos = _deserialise_int_list(serialised, pos)
-    result.update(zip(int_keys, int_values))
+    int_keys, pos = _decode_str_list(serialised, start)
+    int_values, pos = _decode_str_list(serialised, pos)
+    result.update(zip(int_keys, [int(s) for s in int_values]))
 
-    str_keys, pos = _deserialise_str_list(serialised, pos)
-    str_values, pos = _deserialise_str_list(serialised, pos)
+    str_keys, pos = _decode_str_list(serialised, pos)
+    str_values, pos = _decode_str_list(serialised, pos)
     result.update(zip(str_keys, str_values))
 
-    other_keys, pos = _deserialise_str_list(serialised, pos)
+    other_keys, pos = _decode_str_list(serialised, pos)
     for key in other_keys:
-        value, pos = _deserialise_prefix(serialised, pos)
-        result[key] = value
+        result[key], pos = _decode(serialised, pos, lazy)
 
     return result
 
 
+class LazyDict(collections.MutableMapping):
+
+    '''A deserialised dict that decodes values only when they're used.
+
+    Integer and string values are decoded at once, since that's
+    cheap. Other values (lists, dicts, etc) are decoded the first time
+    they're looked up; nested dicts are lazy as well. If nothing has
+    been changed, serialising the dict re-uses its original encoding.
+
+    '''
+
+    def __init__(self, serialised, start, end):
+        self._serialised = serialised
+        self._start = start
+        self._end = end
+        self._changed = False
+        self._values = {}
+        self._positions = {}
+
+        int_keys, pos = _decode_str_list(serialised, start)
+        int_values, pos = _decode_str_list(serialised, pos)
+        self._values.update(zip(int_keys, [int(s) for s in int_values]))
+
+        str_keys, pos = _decode_str_list(serialised, pos)
+        str_values, pos = _decode_str_list(serialised, pos)
+        self._values.update(zip(str_keys, str_values))
+
+        other_keys, pos = _decode_str_list(serialised, pos)
+        for key in other_keys:
+            self._positions[key] = pos
+            pos = _skip(serialised, pos)
+
+    def __getitem__(self, key):
+        if key in self._positions:
+            value, _ = _decode(self._serialised, self._positions[key], True)
+            del self._positions[key]
+            self._values[key] = value
+            if type(value) is list:
+                # The caller may change the list without us knowing.
+                self._changed = True
+        return self._values[key]
+
+    def __setitem__(self, key, value):
+        self._positions.pop(key, None)
+        self._values[key] = value
+        self._changed = True
+
+    def __delitem__(self, key):
+        if key in self._positions:
+            del self._positions[key]
+        else:
+            del self._values[key]
+        self._changed = True
+
+    def __contains__(self, key):
+        return key in self._values or key in self._positions
+
+    def __iter__(self):
+        # Looking up values moves keys from self._positions to
+        # self._values, so iterate over a copy of the keys.
+        return iter(self._values.keys() + self._positions.keys())
+
+    def __len__(self):
+        return len(self._values) + len(self._positions)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def get_unchanged_encoding(self):
+        '''Return the original encoding, or None if it's out of date.'''
+        if self._changed:
+            return None
+        for value in self._values.values():
+            if (type(value) is LazyDict and
+                    value.get_unchanged_encoding() is None):
+                return None
+        return self._serialised[self._start:self._end]
+
+
+def _serialise_lazy_dict(obj):
+    encoded = obj.get_unchanged_encoding()
+    if encoded is None:
+        # Via serialise_object, so that the values get serialised by
+        # the C implementation, if it's there.
+        return serialise_object(dict(obj.items()))
+    return _DICT + _serialise_length(len(encoded)) + encoded
+
+
 def _serialise_str_list(strings):
     n = len(strings)
     encoded_n = struct.pack('!Q', n)
@@ -192,17 +306,16 @@ def _serialise_str_list(strings):
     return encoded_n + encoded_lengths + ''.join(strings)
 
 
-def _deserialise_str_list(serialised, pos):
-    int_size = struct.calcsize('!Q')
-    n = struct.unpack('!Q', serialised[pos:pos+int_size])[0]
-    pos += int_size
+def _decode_str_list(serialised, pos):
+    n = _length_struct.unpack_from(serialised, pos)[0]
+    pos += _length_size
 
-    lengths = struct.unpack('!' + 'Q' * n, serialised[pos:pos + n*int_size])
-    pos += n * int_size
+    lengths = struct.unpack_from('!' + 'Q' * n, serialised, pos)
+    pos += n * _length_size
     strings = []
-    for i in range(n):
-        strings.append(serialised[pos:pos+lengths[i]])
-        pos += lengths[i]
+    for length in lengths:
+        strings.append(serialised[pos:pos+length])
+        pos += length
     return strings, pos
 
 
@@ -210,18 +323,6 @@ def _serialise_int_list(ints):
     return _serialise_str_list([str(i) for i in ints])
 
 
-def _deserialise_int_list(serialised, pos):
-    strings, pos = _deserialise_str_list(serialised, pos)
-    ints = [int(s) for s in strings]
-    return ints, pos
-
-
-def _deserialise_prefix(serialised, pos):
-    length = _extract_length(serialised, pos)
-    end = _next_object(pos, length)
-    return deserialise_object(serialised[pos:end]), end
-
-
 # A lookup table for serialisation functions for each type.
 
 _serialisers = {
@@ -232,16 +333,17 @@ _serialisers = {
     str: _serialise_str,
     list: _serialise_list,
     dict: _serialise_dict,
+    LazyDict: _serialise_lazy_dict,
 }
 
 
-# A lookup table for de-serialisation functions for each type.
+# A lookup table for decoding functions for each type.
 
-_deserialisers = {
-    _NONE: _deserialise_none,
-    _INT: _deserialise_integer,
-    _BOOL: _deserialise_bool,
-    _STR: _deserialise_str,
-    _LIST: _deserialise_list,
-    _DICT: _deserialise_dict,
+_decoders = {
+    _NONE: _decode_none,
+    _INT: _decode_integer,
+    _BOOL: _decode_bool,
+    _STR: _decode_str,
+    _LIST: _decode_list,
+    _DICT: _decode_dict,
 }
@@ -75,3 +75,151 @@ class ObjectSerialisationRoundtripTests(unittest.TestCase):
         }
         blob = obnamlib.serialise_object(obj)
         self.assertEqual(obnamlib.deserialise_object(blob), obj)
+
+
+class LazyDeserialisationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.obj = {
+            'zero': 0,
+            'string': 'abc\0def',
+            'list': ['foo', 1],
+            'dict': {
+                'one': 1,
+                'list': [None, True],
+            },
+        }
+        self.blob = obnamlib.serialise_object(self.obj)
+
+    def test_returns_equal_dict(self):
+        lazy = obnamlib.deserialise_object(self.blob, lazy=True)
+        self.assertEqual(dict(lazy.items()), self.obj)
+
+    def test_has_all_keys(self):
+        lazy = obnamlib.deserialise_object(self.blob, lazy=True)
+        self.assertEqual(sorted(lazy.keys()), sorted(self.obj.keys()))
+        self.assertEqual(len(lazy), len(self.obj))
+        self.assertTrue('list' in lazy)
+        self.assertFalse('nothere' in lazy)
+
+    def test_nested_dict_is_lazy_too(self):
+        lazy = obnamlib.deserialise_object(self.blob, lazy=True)
+        self.assertEqual(lazy['dict']['list'], [None, True])
+
+    def test_reserialises_unchanged_dict_identically(self):
+        lazy = obnamlib.deserialise_object(self.blob, lazy=True)
+        lazy['dict']['one']
+        self.assertEqual(obnamlib.serialise_object(lazy), self.blob)
+
+    def test_reserialises_changed_dict(self):
+        lazy = obnamlib.deserialise_object(self.blob, lazy=True)
+        lazy['new'] = 'value'
+        del lazy['zero']
+        lazy['dict']['one'] = 2
+        self.obj['new'] = 'value'
+        del self.obj['zero']
+        self.obj['dict']['one'] = 2
+        blob = obnamlib.serialise_object(lazy)
+        self.assertEqual(obnamlib.deserialise_object(blob), self.obj)
+
+    def test_deletes_value_not_yet_decoded(self):
+        lazy = obnamlib.deserialise_object(self.blob, lazy=True)
+        del lazy['list']
+        del self.obj['list']
+        self.assertEqual(dict(lazy.items()), self.obj)
+        blob = obnamlib.serialise_object(lazy)
+        self.assertEqual(obnamlib.deserialise_object(blob), self.obj)
+
+    def test_repr_is_that_of_equal_dict(self):
+        lazy = obnamlib.deserialise_object(self.blob, lazy=True)
+        self.assertEqual(eval(repr(lazy)), self.obj)
+
+    def test_has_no_unchanged_encoding_after_nested_dict_changes(self):
+        lazy = obnamlib.deserialise_object(self.blob, lazy=True)
+        lazy['dict']['one'] = 2
+        self.assertEqual(lazy.get_unchanged_encoding(), None)
+
+    def test_reserialises_dict_with_changed_list(self):
+        lazy = obnamlib.deserialise_object(self.blob, lazy=True)
+        lazy['list'].append('bar')
+        self.obj['list'].append('bar')
+        blob = obnamlib.serialise_object(lazy)
+        self.assertEqual(obnamlib.deserialise_object(blob), self.obj)
+
+
+class ImplementationComparisonTests(unittest.TestCase):
+
+    # serialise_object and deserialise_object use the C implementation
+    # from the _obnam extension, if it's there. Its results must be the
+    # same as those of the Python implementation.
+
+    def setUp(self):
+        self.objects = [
+            None,
+            True,
+            False,
+            0,
+            -42,
+            2**100,
+            '',
+            'abc\0def',
+            [],
+            [None, [1, [2, 'three']], {}],
+            {},
+            {
+                'int': 1,
+                'long': 2**64,
+                'str': 'foo',
+                'bool': True,
+                'none': None,
+                'list': ['foo', 1],
+                'dict': {'one': 1, 'two': {'list': []}},
+            },
+        ]
+
+    def test_encodings_are_identical(self):
+        for obj in self.objects:
+            self.assertEqual(
+                obnamlib.serialise_object(obj),
+                obnamlib.obj_serialiser.serialise_object_in_python(obj))
+
+    def test_decodes_python_encodings(self):
+        for obj in self.objects:
+            blob = obnamlib.obj_serialiser.serialise_object_in_python(obj)
+            self.assertEqual(obnamlib.deserialise_object(blob), obj)
+
+    def test_serialises_unchanged_lazy_dict_inside_plain_dict(self):
+        blob = obnamlib.serialise_object(self.objects[-1])
+        lazy = obnamlib.deserialise_object(blob, lazy=True)
+        self.assertEqual(
+            obnamlib.serialise_object({'inner': lazy}),
+            obnamlib.serialise_object({'inner': self.objects[-1]}))
+
+    def test_rejects_truncated_encoding(self):
+        blob = obnamlib.serialise_object(self.objects[-1])
+        self.assertRaises(
+            Exception, obnamlib.deserialise_object, blob[:-1])
+
+
+class PythonImplementationTests(ImplementationComparisonTests):
+
+    # Run the comparison tests again, with the C implementation
+    # turned off, to test the Python one on its own.
+
+    def setUp(self):
+        ImplementationComparisonTests.setUp(self)
+        module = obnamlib.obj_serialiser
+        self.c_functions = (
+            module.c_serialise_object, module.c_deserialise_object)
+        module.c_serialise_object = None
+        module.c_deserialise_object = None
+
+    def tearDown(self):
+        module = obnamlib.obj_serialiser
+        module.c_serialise_object, module.c_deserialise_object = (
+            self.c_functions)
+
+    def test_roundtrips_in_python(self):
+        for obj in self.objects:
+            blob = obnamlib.serialise_object(obj)
+            self.assertEqual(obnamlib.deserialise_object(blob), obj)
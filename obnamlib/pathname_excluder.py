@@ -22,28 +22,193 @@ class PathnameExcluder(object):
     '''Decide which pathnames to exclude from a backup. '''
 
     def __init__(self):
-        self._exclude_patterns = []
-        self._include_patterns = []
+        self._exclude_patterns = _PatternSet()
+        self._include_patterns = _PatternSet()
 
     def exclude_regexp(self, regexp):
-        self._exclude_patterns.append((regexp, re.compile(regexp)))
+        self._exclude_patterns.add(regexp)
 
     def allow_regexp(self, regexp):
-        self._include_patterns.append((regexp, re.compile(regexp)))
+        self._include_patterns.add(regexp)
 
     def exclude(self, pathname):
-        included_regexp = self._match(pathname, self._include_patterns)
+        included_regexp = self._include_patterns.find(pathname)
         if included_regexp:
             return False, included_regexp
 
-        excluded_regexp = self._match(pathname, self._exclude_patterns)
+        excluded_regexp = self._exclude_patterns.find(pathname)
         if excluded_regexp:
             return True, excluded_regexp
 
         return False, None
 
-    def _match(self, pathname, patterns):
-        for regexp, pattern in patterns:
-            if pattern.search(pathname):
-                return regexp
+
+class _PatternSet(object):
+
+    '''A list of regular expressions, matched as a whole.
+
+    Trying every regular expression in turn is slow, when there are
+    many of them, and most pathnames match none. Instead, literal
+    prefixes, suffixes, and whole pathnames are checked with string
+    operations, other literals with one regular expression, and the
+    remaining regular expressions are combined into one alternation.
+    Only if one of those matches, are the regular expressions tried
+    in turn, to find the first one that matches.
+
+    '''
+
+    def __init__(self):
+        self._patterns = []
+        self._checks = None
+
+    def add(self, regexp):
+        self._patterns.append((regexp, re.compile(regexp)))
+        self._checks = None
+
+    def find(self, pathname):
+        '''Return first regular expression that matches, or None.'''
+
+        if self._checks is None:
+            self._checks = self._compile_checks()
+
+        # The checks are exact: a pathname passes one only if one of
+        # the regular expressions matches it.
+        for check in self._checks:
+            if check(pathname):
+                for regexp, pattern in self._patterns:
+                    if pattern.search(pathname):
+                        return regexp
         return None
+
+    def _compile_checks(self):
+        prefixes = []
+        suffixes = []
+        wholes = set()
+        literals = []
+        others = []
+
+        for regexp, pattern in self._patterns:
+            parsed = _parse_literal(regexp)
+            if parsed is None:
+                others.append((regexp, pattern))
+                continue
+
+            # In a regular expression, $ also matches before a newline
+            # at the end of the string.
+            literal, at_start, at_end = parsed
+            if at_start and at_end:
+                wholes.update([literal, literal + '\n'])
+            elif at_start:
+                prefixes.append(literal)
+            elif at_end:
+                suffixes.extend([literal, literal + '\n'])
+            else:
+                literals.append(literal)
+
+        checks = []
+        if wholes:
+            checks.append(wholes.__contains__)
+        if prefixes:
+            checks.append(lambda pathname, t=tuple(prefixes):
+                          pathname.startswith(t))
+        if suffixes:
+            checks.append(lambda pathname, t=tuple(suffixes):
+                          pathname.endswith(t))
+        if literals:
+            checks.append(re.compile(_make_literal_regexp(literals)).search)
+        checks.extend(_combine_patterns(others))
+        return checks
+
+
+_METACHARS = '.^$*+?{}[]|()'
+
+
+def _parse_literal(regexp):
+    '''Parse a regular expression that only matches a literal string.
+
+    Return (literal, at_start, at_end), where at_start and at_end tell
+    if the regular expression is anchored with ^ or $, or None if the
+    regular expression is not of that form.
+
+    '''
+
+    at_start = regexp.startswith('^')
+    at_end = False
+    chars = []
+    i = 1 if at_start else 0
+    while i < len(regexp):
+        c = regexp[i]
+        if c == '\\':
+            # A backslash makes punctuation literal, but letters and
+            # digits after it mean special things.
+            if i + 1 == len(regexp) or regexp[i + 1].isalnum():
+                return None
+            chars.append(regexp[i + 1])
+            i += 2
+        elif c == '$' and i + 1 == len(regexp):
+            at_end = True
+            i += 1
+        elif c in _METACHARS:
+            return None
+        else:
+            chars.append(c)
+            i += 1
+
+    if not chars:
+        return None
+    return ''.join(chars), at_start, at_end
+
+
+def _make_literal_regexp(literals):
+    '''Make a regular expression that finds any of some literal strings.
+
+    The alternatives are arranged as a trie, so that the regular
+    expression engine doesn't need to backtrack over common prefixes.
+
+    '''
+
+    trie = {}
+    for literal in literals:
+        node = trie
+        for c in literal:
+            node = node.setdefault(c, {})
+        node[''] = {}
+
+    def build(node):
+        alternatives = [
+            re.escape(c) + build(node[c]) for c in sorted(node) if c]
+        if not alternatives:
+            return ''
+        if len(alternatives) == 1 and '' not in node:
+            return alternatives[0]
+        group = '(?:%s)' % '|'.join(alternatives)
+        if '' in node:
+            group += '?'
+        return group
+
+    return build(trie)
+
+
+# Regular expressions with these can't be combined with others:
+# backreferences by number refer to a different group, and inline
+# flags apply to the whole combination.
+_UNCOMBINABLE = re.compile(r'\\[1-9]|\(\?[iLmsux]')
+
+
+def _combine_patterns(patterns):
+    separate = []
+    combinable = []
+    for regexp, pattern in patterns:
+        if _UNCOMBINABLE.search(regexp):
+            separate.append(pattern.search)
+        else:
+            combinable.append((regexp, pattern))
+
+    if len(combinable) > 1:
+        combined = '|'.join('(?:%s)' % regexp for regexp, _ in combinable)
+        try:
+            return [re.compile(combined).search] + separate
+        except (re.error, AssertionError):
+            # Too many groups, or the same group name is used twice.
+            pass
+    return [pattern.search for _, pattern in combinable] + separate
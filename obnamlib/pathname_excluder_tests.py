@@ -37,3 +37,88 @@ class PathnameExcluderTest(unittest.TestCase):
         excluder.exclude_regexp('foo')
         excluder.allow_regexp('oo')
         self.assertTrue(excluder.exclude('/foo'), (False, 'oo'))
+
+
+class PathnameExcluderPatternTests(unittest.TestCase):
+
+    def setUp(self):
+        self.excluder = obnamlib.PathnameExcluder()
+
+    def excluded_by(self, pathname):
+        excluded, regexp = self.excluder.exclude(pathname)
+        if excluded:
+            return regexp
+        return None
+
+    def test_matches_literal_prefix(self):
+        self.excluder.exclude_regexp(r'^/proc')
+        self.assertEqual(self.excluded_by('/proc/1'), r'^/proc')
+        self.assertEqual(self.excluded_by('/home/proc'), None)
+
+    def test_matches_literal_suffix(self):
+        self.excluder.exclude_regexp(r'\.o$')
+        self.assertEqual(self.excluded_by('/src/foo.o'), r'\.o$')
+        self.assertEqual(self.excluded_by('/src/foo.c'), None)
+        self.assertEqual(self.excluded_by('/src/foo.o/bar'), None)
+
+    def test_matches_literal_suffix_before_newline(self):
+        self.excluder.exclude_regexp(r'\.o$')
+        self.assertEqual(self.excluded_by('/src/foo.o\n'), r'\.o$')
+
+    def test_matches_whole_literal_pathname(self):
+        self.excluder.exclude_regexp(r'^/tmp$')
+        self.assertEqual(self.excluded_by('/tmp'), r'^/tmp$')
+        self.assertEqual(self.excluded_by('/tmp/foo'), None)
+
+    def test_matches_literal_anywhere(self):
+        self.excluder.exclude_regexp('cache')
+        self.excluder.exclude_regexp('cached')
+        self.excluder.exclude_regexp('/tmp/')
+        self.assertEqual(self.excluded_by('/home/.cache/x'), 'cache')
+        self.assertEqual(self.excluded_by('/var/tmp/x'), '/tmp/')
+        self.assertEqual(self.excluded_by('/home/cach'), None)
+
+    def test_matches_regexp_with_escaped_letter(self):
+        self.excluder.exclude_regexp(r'\d$')
+        self.assertEqual(self.excluded_by('/var/log/syslog.1'), r'\d$')
+        self.assertEqual(self.excluded_by('/var/log/d'), None)
+
+    def test_matches_empty_pathname_only_with_empty_regexp(self):
+        self.excluder.exclude_regexp(r'^$')
+        self.assertEqual(self.excluded_by(''), r'^$')
+        self.assertEqual(self.excluded_by('/'), None)
+
+    def test_matches_regexp(self):
+        self.excluder.exclude_regexp(r'/\.[^/]*rc$')
+        self.excluder.exclude_regexp(r'~$')
+        self.assertEqual(self.excluded_by('/home/.bashrc'), r'/\.[^/]*rc$')
+        self.assertEqual(self.excluded_by('/home/foo~'), r'~$')
+        self.assertEqual(self.excluded_by('/home/foo'), None)
+
+    def test_returns_first_matching_regexp(self):
+        for regexp in ['foo', r'^/foo', r'o$', 'f.o', r'^/foo$']:
+            self.excluder.exclude_regexp(regexp)
+        self.assertEqual(self.excluded_by('/foo'), 'foo')
+
+    def test_matches_regexp_with_backreference(self):
+        self.excluder.exclude_regexp(r'(a)b')
+        self.excluder.exclude_regexp(r'(x)\1')
+        self.assertEqual(self.excluded_by('/xx'), r'(x)\1')
+
+    def test_matches_regexp_with_inline_flags(self):
+        self.excluder.exclude_regexp(r'a b')
+        self.excluder.exclude_regexp(r'(?x) c d')
+        self.assertEqual(self.excluded_by('/a b'), r'a b')
+        self.assertEqual(self.excluded_by('/cd'), r'(?x) c d')
+
+    def test_matches_many_regexps_with_groups(self):
+        for i in range(200):
+            self.excluder.exclude_regexp(r'(x)+%d$' % i)
+        self.assertEqual(self.excluded_by('/x199'), r'(x)+199$')
+        self.assertEqual(self.excluded_by('/y199'), None)
+
+    def test_matches_after_more_patterns_are_added(self):
+        self.excluder.exclude_regexp('foo')
+        self.assertEqual(self.excluded_by('/bar'), None)
+        self.excluder.exclude_regexp('bar')
+        self.assertEqual(self.excluded_by('/bar'), 'bar')
@@ -0,0 +1,110 @@
+# Copyright (C) 2016  Lars Wirzenius
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+import time
+
+
+class PhaseStats(object):
+
+    '''Time spent in the phases of a run, and counters of things done.
+
+    A phase is timed by using a timer as a context manager:
+
+        with stats.timer('checksum'):
+            ...
+
+    Phases may nest, or happen in several threads at once, so the
+    times of different phases may add up to more than the duration of
+    the run. Each phase also counts how many times it was entered.
+
+    '''
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._seconds = {}
+        self._calls = {}
+        self._counters = {}
+
+    def timer(self, phase):
+        return _PhaseTimer(self, phase)
+
+    def timed_iter(self, phase, iterable):
+        '''Iterate over iterable, timing how long getting items takes.'''
+        iterator = iter(iterable)
+        while True:
+            with self.timer(phase):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def add_time(self, phase, seconds):
+        with self._lock:
+            self._seconds[phase] = self._seconds.get(phase, 0.0) + seconds
+            self._calls[phase] = self._calls.get(phase, 0) + 1
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set_counter(self, name, value):
+        with self._lock:
+            self._counters[name] = value
+
+    def get_phases(self):
+        return sorted(self._seconds)
+
+    def get_time(self, phase):
+        return self._seconds.get(phase, 0.0)
+
+    def get_calls(self, phase):
+        return self._calls.get(phase, 0)
+
+    def get_counter(self, name):
+        return self._counters.get(name, 0)
+
+    def get_counters(self):
+        return sorted(self._counters)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'phases': dict(
+                    (phase, {
+                        'seconds': self._seconds[phase],
+                        'calls': self._calls[phase],
+                    })
+                    for phase in self._seconds),
+                'counters': dict(self._counters),
+            }
+
+
+class _PhaseTimer(object):
+
+    def __init__(self, stats, phase):
+        self._stats = stats
+        self._phase = phase
+        self._started = None
+
+    def __enter__(self):
+        self._started = self._stats._clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self._stats.add_time(self._phase, self._stats._clock() - self._started)
@@ -0,0 +1,111 @@
+# Copyright (C) 2016  Lars Wirzenius
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import obnamlib
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class PhaseStatsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.stats = obnamlib.PhaseStats(clock=self.clock)
+
+    def test_has_no_phases_initially(self):
+        self.assertEqual(self.stats.get_phases(), [])
+
+    def test_unknown_phase_has_taken_no_time(self):
+        self.assertEqual(self.stats.get_time('foo'), 0.0)
+        self.assertEqual(self.stats.get_calls('foo'), 0)
+
+    def test_times_phase(self):
+        with self.stats.timer('foo'):
+            self.clock.now += 2
+        self.assertEqual(self.stats.get_phases(), ['foo'])
+        self.assertEqual(self.stats.get_time('foo'), 2.0)
+        self.assertEqual(self.stats.get_calls('foo'), 1)
+
+    def test_adds_up_repeated_phases(self):
+        for i in range(3):
+            with self.stats.timer('foo'):
+                self.clock.now += 1
+        self.assertEqual(self.stats.get_time('foo'), 3.0)
+        self.assertEqual(self.stats.get_calls('foo'), 3)
+
+    def test_times_phase_ending_in_exception(self):
+        try:
+            with self.stats.timer('foo'):
+                self.clock.now += 1
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        self.assertEqual(self.stats.get_time('foo'), 1.0)
+
+    def test_times_nested_phases_separately(self):
+        with self.stats.timer('outer'):
+            self.clock.now += 1
+            with self.stats.timer('inner'):
+                self.clock.now += 2
+        self.assertEqual(self.stats.get_time('outer'), 3.0)
+        self.assertEqual(self.stats.get_time('inner'), 2.0)
+
+    def test_times_getting_items_from_iterable(self):
+        def items():
+            for i in range(2):
+                self.clock.now += 1
+                yield i
+
+        result = []
+        for item in self.stats.timed_iter('iter', items()):
+            self.clock.now += 10
+            result.append(item)
+        self.assertEqual(result, [0, 1])
+        self.assertEqual(self.stats.get_time('iter'), 2.0)
+        self.assertEqual(self.stats.get_calls('iter'), 3)
+
+    def test_counts(self):
+        self.stats.count('files')
+        self.stats.count('bytes', 100)
+        self.stats.count('bytes', 20)
+        self.assertEqual(self.stats.get_counters(), ['bytes', 'files'])
+        self.assertEqual(self.stats.get_counter('files'), 1)
+        self.assertEqual(self.stats.get_counter('bytes'), 120)
+
+    def test_sets_counter(self):
+        self.stats.count('files', 5)
+        self.stats.set_counter('files', 2)
+        self.assertEqual(self.stats.get_counter('files'), 2)
+
+    def test_returns_dict(self):
+        with self.stats.timer('foo'):
+            self.clock.now += 1
+        self.stats.count('files')
+        self.assertEqual(
+            self.stats.as_dict(),
+            {
+                'phases': {'foo': {'seconds': 1.0, 'calls': 1}},
+                'counters': {'files': 1},
+            })
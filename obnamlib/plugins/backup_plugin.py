@@ -15,6 +15,7 @@
 
 
 import errno
+import json
 import logging
 import os
 import re
@@ -23,11 +24,13 @@ import traceback
 import urlparse
 
 import larch
-import tracing
 
 import obnamlib
 
 
+tracer = obnamlib.Tracer(__file__)
+
+
 class RepositorySettingMissingError(obnamlib.ObnamError):
 
     msg = ('No --repository setting. '
@@ -79,6 +82,7 @@ class BackupPlugin(obnamlib.ObnamPlugin):
         self.add_backup_settings()
         self.app.hooks.new('backup-finished')
         self.app.hooks.new('backup-exclude')
+        self.app.hooks.new('backup-exclude-directory')
 
     def add_backup_settings(self):
 
@@ -134,6 +138,22 @@ class BackupPlugin(obnamlib.ObnamPlugin):
             default=obnamlib.DEFAULT_CHUNKIDS_PER_GROUP,
             group=perf_group)
 
+        self.app.settings.bytesize(
+            ['moved-file-min-size'],
+            'reuse the backed up data of renamed, moved, or hard linked '
+            'files of at least SIZE bytes, instead of reading the files '
+            'again; 0 turns this off',
+            metavar='SIZE',
+            default=obnamlib.DEFAULT_MOVED_FILE_MIN_SIZE,
+            group=perf_group)
+
+        self.app.settings.string(
+            ['stats-file'],
+            'write statistics of the backup run, including the time '
+            'spent in each phase of it, as JSON to FILE',
+            metavar='FILE',
+            group=perf_group)
+
         # Development related settings.
 
         devel_group = obnamlib.option_group['devel']
@@ -172,6 +192,7 @@ class BackupPlugin(obnamlib.ObnamPlugin):
         except BaseException, e:
             logging.debug('Handling exception %s', str(e))
             logging.debug(traceback.format_exc())
+            self.progress.stop()
             self.unlock_when_error()
             raise
 
@@ -193,7 +214,13 @@ class BackupPlugin(obnamlib.ObnamPlugin):
         self.progress.what('setting up')
 
         self.memory_dump_counter = 0
+        self.phase_stats = self.app.phase_stats
         self.chunkid_token_map = obnamlib.ChunkIdTokenMap()
+        self.zero_chunk = ''
+        self.zero_chunk_id = None
+        self.moved_files = obnamlib.MovedFileIndex()
+        self.moved_files_seeded = False
+        self.previous_generation = None
 
         self.progress.what('connecting to repository')
         self.repo = self.open_repository()
@@ -205,7 +232,8 @@ class BackupPlugin(obnamlib.ObnamPlugin):
             self.app.settings['checkpoint'])
 
     def configure_progress_reporting(self):
-        self.progress = obnamlib.BackupProgress(self.app.ts)
+        self.progress = obnamlib.BackupProgress(
+            self.app.ts, quiet=self.app.settings['quiet'])
 
     def open_repository(self):
         if self.pretend:
@@ -238,16 +266,17 @@ class BackupPlugin(obnamlib.ObnamPlugin):
 
     def start_generation(self):
         self.progress.what('starting new generation')
+        gen_ids = self.repo.get_client_generation_ids(self.client_name)
+        if gen_ids:
+            self.previous_generation = gen_ids[-1]
         self.new_generation = self.repo.create_generation(self.client_name)
 
     def finish_generation(self):
         prefix = 'committing changes to repository: '
 
-        self.progress.what(prefix + 'locking shared chunk indexes')
-        self.repo.lock_chunk_indexes()
-
-        self.progress.what(prefix + 'adding chunks to shared chunk indexes')
-        self.add_chunks_to_shared()
+        self.progress.what(prefix + 'flushing chunks')
+        self.repo.flush_chunks()
+        self.add_chunks_to_shared(prefix)
 
         self.progress.what(prefix + 'updating generation metadata')
         self.repo.set_generation_key(
@@ -264,14 +293,9 @@ class BackupPlugin(obnamlib.ObnamPlugin):
             False)
 
         self.progress.what(prefix + 'committing client')
-        self.repo.flush_chunks()
         self.repo.commit_client(self.client_name)
         self.repo.unlock_client(self.client_name)
 
-        self.progress.what(prefix + 'committing shared chunk indexes')
-        self.repo.commit_chunk_indexes()
-        self.repo.unlock_chunk_indexes()
-
     def should_remove_checkpoints(self):
         return (not self.progress.errors and
                 not self.app.settings['leave-checkpoints'])
@@ -305,12 +329,23 @@ class BackupPlugin(obnamlib.ObnamPlugin):
         self.progress.clear()
         self.progress.finish()
         self.progress.report_stats(
-            self.app.output, self.repo.get_fs(), self.app.settings['quiet'])
+            self.app.output, self.repo.get_fs(), self.app.settings['quiet'],
+            phase_stats=self.phase_stats,
+            verbose=self.app.settings['verbose'])
+        if self.app.settings['stats-file']:
+            self.write_stats_file(self.app.settings['stats-file'])
 
         logging.info('Backup finished.')
         self.app.hooks.call('backup-finished', args, self.progress)
         self.app.dump_memory_profile('at end of backup run')
 
+    def write_stats_file(self, filename):
+        stats = self.progress.get_stats(self.repo.get_fs(), self.phase_stats)
+        stats['vfs-latency'] = self.app.vfs_latency.as_dict()
+        with open(filename, 'w') as f:
+            json.dump(stats, f, indent=4, sort_keys=True)
+            f.write('\n')
+
     def parse_checkpoint_size(self, value):
         p = obnamlib.ByteSizeParser()
         p.set_default_unit('MiB')
@@ -335,9 +370,25 @@ class BackupPlugin(obnamlib.ObnamPlugin):
         else:
             logging.info('Successfully unlocked')
 
-    def add_chunks_to_shared(self):
-        for chunkid, token in self.chunkid_token_map:
-            self.repo.put_chunk_into_indexes(chunkid, token, self.client_name)
+    def add_chunks_to_shared(self, prefix):
+        # The repository may split the chunk indexes into parts with
+        # their own locks. Lock, update, and commit one part at a time,
+        # so that other clients can update other parts meanwhile. The
+        # chunk indexes are committed before the client, so that a
+        # chunk is never in use without the indexes knowing it.
+        groups = self.repo.get_chunk_index_lock_groups(
+            self.chunkid_token_map.get_tokens())
+        for i, tokens in enumerate(groups):
+            self.progress.what(
+                '%sadding chunks to shared chunk indexes (%d/%d)' %
+                (prefix, i + 1, len(groups)))
+            self.repo.lock_chunk_indexes(tokens=tokens)
+            for token in tokens:
+                for chunkid in self.chunkid_token_map.get(token):
+                    self.repo.put_chunk_into_indexes(
+                        chunkid, token, self.client_name)
+            self.repo.commit_chunk_indexes()
+            self.repo.unlock_chunk_indexes()
         self.chunkid_token_map.clear()
 
     def add_client(self, client_name):
@@ -348,12 +399,12 @@ class BackupPlugin(obnamlib.ObnamPlugin):
             raise
 
         if client_name not in self.repo.get_client_names():
-            tracing.trace('adding new client %s' % client_name)
-            tracing.trace('client list before adding: %s' %
-                          self.repo.get_client_names())
+            tracer.trace('adding new client %s', client_name)
+            tracer.trace(
+                'client list before adding: %s', self.repo.get_client_names())
             self.repo.add_client(client_name)
-            tracing.trace('client list after adding: %s' %
-                          self.repo.get_client_names())
+            tracer.trace(
+                'client list after adding: %s', self.repo.get_client_names())
         self.repo.commit_client_list()
         self.repo.unlock_client_list()
         self.repo = self.app.get_repository_object(repofs=self.repo.get_fs())
@@ -464,6 +515,7 @@ class BackupPlugin(obnamlib.ObnamPlugin):
         def func(url):
             self.fs = self.app.fsf.new(url)
             self.fs.connect()
+            self.app.vfs_latency.instrument('live-data', self.fs)
         self.open_or_reopen_fs(func, root_url)
 
     def reopen_fs(self, root_url):
@@ -521,6 +573,10 @@ class BackupPlugin(obnamlib.ObnamPlugin):
                 raise IOError(e, os.strerror(e), pathname)
 
     def make_checkpoint(self):
+        with self.phase_stats.timer('checkpoint'):
+            self._make_checkpoint()
+
+    def _make_checkpoint(self):
         logging.info('Making checkpoint')
         self.progress.what('making checkpoint')
         if not self.pretend:
@@ -529,35 +585,22 @@ class BackupPlugin(obnamlib.ObnamPlugin):
             self.progress.what('making checkpoint: backing up parents')
             self.backup_parents('.')
 
-            self.progress.what(
-                'making checkpoint: locking shared chunk indexes')
-            self.repo.lock_chunk_indexes()
-
-            self.progress.what(
-                'making checkpoint: adding chunks to shared chunk indexes')
-            self.add_chunks_to_shared()
+            self.progress.what('making checkpoint: flushing chunks')
+            self.repo.flush_chunks()
+            self.add_chunks_to_shared('making checkpoint: ')
 
             self.progress.what(
                 'making checkpoint: committing per-client data')
             self.repo.set_generation_key(
                 self.new_generation,
                 obnamlib.REPO_GENERATION_IS_CHECKPOINT, 1)
-            self.repo.flush_chunks()
             self.repo.commit_client(self.client_name)
-            self.repo.unlock_client(self.client_name)
-
-            self.progress.what(
-                'making checkpoint: committing shared chunk indexes')
-            self.repo.commit_chunk_indexes()
-            self.repo.unlock_chunk_indexes()
             self.last_checkpoint = self.repo.get_fs().bytes_written
 
-            self.progress.what('making checkpoint: re-opening repository')
-            self.repo = self.app.get_repository_object(
-                repofs=self.repo.get_fs())
-
+            # Continue with the same repository object, and keep the
+            # client locked, so that caches stay warm. The new
+            # generation starts from the checkpoint generation.
             self.progress.what('making checkpoint: starting a new generation')
-            self.repo.lock_client(self.client_name)
             self.new_generation = self.repo.create_generation(
                 self.client_name)
             self.app.dump_memory_profile('at end of checkpoint')
@@ -574,12 +617,23 @@ class BackupPlugin(obnamlib.ObnamPlugin):
 
         '''
 
-        for pathname, st in self.fs.scan_tree(root, ok=self.can_be_backed_up):
-            tracing.trace('considering %s' % pathname)
+        found = self.phase_stats.timed_iter(
+            'scan',
+            self.fs.scan_tree(
+                root, ok=self.can_be_backed_up,
+                dir_ok=self.directory_can_be_backed_up))
+        for pathname, st in found:
+            tracer.trace('considering %s', pathname)
+            self.phase_stats.count('files-scanned')
             try:
-                metadata = obnamlib.read_metadata(self.fs, pathname, st=st)
+                with self.phase_stats.timer('read-metadata'):
+                    metadata = obnamlib.read_metadata(
+                        self.fs, pathname, st=st)
                 self.progress.update_progress_with_file(pathname, metadata)
-                if self.needs_backup(pathname, metadata):
+                with self.phase_stats.timer('compare-metadata'):
+                    changed = self.needs_backup(pathname, metadata)
+                if changed:
+                    self.phase_stats.count('files-changed')
                     yield pathname, metadata
                 else:
                     self.progress.update_progress_with_scanned(
@@ -611,17 +665,35 @@ class BackupPlugin(obnamlib.ObnamPlugin):
 
         return True
 
+    def directory_can_be_backed_up(self, pathname, st, basenames):
+        # This is called after the directory has been listed, so
+        # that what's in the directory can be checked without
+        # further system calls.
+        if self.just_one_file:
+            return True
+
+        exclude = [False]
+        self.app.hooks.call(
+            'backup-exclude-directory',
+            progress=self.progress,
+            fs=self.fs,
+            pathname=pathname,
+            stat_result=st,
+            basenames=basenames,
+            exclude=exclude)
+        return not exclude[0]
+
     def needs_backup(self, pathname, current):
         '''Does a given file need to be backed up?'''
 
         # Directories always require backing up so that backup_dir_contents
         # can remove stuff that no longer exists from them.
         if current.isdir():
-            tracing.trace('%s is directory, so needs backup' % pathname)
+            tracer.trace('%s is directory, so needs backup', pathname)
             return True
 
         gen = self.get_current_generation()
-        tracing.trace('gen=%s' % repr(gen))
+        tracer.trace('gen=%r', gen)
         return self.metadata_has_changed(gen, pathname, current)
 
     def get_current_generation(self):
@@ -690,7 +762,7 @@ class BackupPlugin(obnamlib.ObnamPlugin):
     def backup_parents(self, root):
         '''Back up parents of root, non-recursively.'''
         root = self.fs.abspath(root)
-        tracing.trace('backing up parents of %s', root)
+        tracer.trace('backing up parents of %s', root)
 
         dummy_metadata = obnamlib.Metadata(st_mode=0777 | stat.S_IFDIR)
 
@@ -714,9 +786,10 @@ class BackupPlugin(obnamlib.ObnamPlugin):
     def backup_metadata(self, pathname, metadata):
         '''Back up metadata for a filesystem object'''
 
-        tracing.trace('backup_metadata: %s', pathname)
+        tracer.trace('backup_metadata: %s', pathname)
         if not self.pretend:
-            self.add_file_to_generation(pathname, metadata)
+            with self.phase_stats.timer('store-metadata'):
+                self.add_file_to_generation(pathname, metadata)
 
     def backup_file_contents(self, filename, metadata):
         '''Back up contents of a regular file.
@@ -725,40 +798,45 @@ class BackupPlugin(obnamlib.ObnamPlugin):
 
         '''
 
-        tracing.trace('backup_file_contents: %s', filename)
+        tracer.trace('backup_file_contents: %s', filename)
         if self.pretend:
-            tracing.trace('pretending to upload the whole file')
+            tracer.trace('pretending to upload the whole file')
             self.progress.update_progress_with_upload(metadata.st_size)
             return
 
-        tracing.trace('setting file chunks to empty')
+        tracer.trace('setting file chunks to empty')
         if not self.pretend:
             if self.repo.file_exists(self.new_generation, filename):
                 self.repo.clear_file_chunk_ids(self.new_generation, filename)
             else:
                 self.repo.add_file(self.new_generation, filename)
 
-        tracing.trace('opening file for reading')
+        checksum_key = self.repo.get_client_checksum_key(self.client_name)
+        if self.reuse_moved_file(filename, metadata, checksum_key):
+            return
+
+        tracer.trace('opening file for reading')
         f = self.fs.open(filename, 'r')
 
-        checksum_key = self.repo.get_client_checksum_key(self.client_name)
         whole_file_summer = obnamlib.WholeFileCheckSummer(checksum_key)
 
         chunk_size = int(self.app.settings['chunk-size'])
-        while True:
-            tracing.trace('reading some data')
-            self.progress.update_progress()
-            data = f.read(chunk_size)
-            if not data:
-                tracing.trace('end of data')
-                break
-            tracing.trace('got %d bytes of data' % len(data))
+        for data, is_hole in self.read_file_chunks(f, metadata, chunk_size):
+            if tracer.enabled:
+                tracer.trace('got %d bytes of data', len(data))
             self.progress.update_progress_with_scanned(len(data))
             if not self.pretend:
-                chunk_id = self.backup_file_chunk(data)
-                self.repo.append_file_chunk_id(
-                    self.new_generation, filename, chunk_id)
-                whole_file_summer.append_chunk(data, chunk_id)
+                if is_hole:
+                    chunk_id = self.backup_zero_chunk(data)
+                else:
+                    with self.phase_stats.timer('checksum'):
+                        token = self.repo.prepare_chunk_for_indexes(data)
+                    chunk_id = self.backup_file_chunk(data, token=token)
+                with self.phase_stats.timer('store-metadata'):
+                    self.repo.append_file_chunk_id(
+                        self.new_generation, filename, chunk_id)
+                with self.phase_stats.timer('checksum'):
+                    whole_file_summer.append_chunk(data, chunk_id)
             else:
                 self.progress.update_progress_with_upload(len(data))
 
@@ -768,20 +846,190 @@ class BackupPlugin(obnamlib.ObnamPlugin):
                     self.make_checkpoint()
                     self.progress.what(filename)
 
-        tracing.trace('closing file')
+        tracer.trace('closing file')
         f.close()
         self.app.dump_memory_profile('at end of file content backup for %s' %
                                      filename)
-        tracing.trace('done backing up file contents')
+        tracer.trace('done backing up file contents')
 
         for key, name in obnamlib.metadata_file_key_mapping:
             if key == checksum_key:
                 setattr(metadata, name, whole_file_summer.get_checksum())
 
-    def backup_file_chunk(self, data):
-        '''Back up a chunk of data by putting it into the repository.'''
+        if self.is_moved_file_candidate(metadata):
+            self.moved_files.add(metadata, None, filename)
+
+    def is_moved_file_candidate(self, metadata):
+        min_size = self.app.settings['moved-file-min-size']
+        return min_size > 0 and metadata.st_size >= min_size
+
+    def reuse_moved_file(self, filename, metadata, checksum_key):
+        '''Copy chunk ids from another file with the same data.
+
+        If the file has been renamed, moved, or hard linked since the
+        previous generation, or during this backup run, its data is
+        already in the repository. Copy the chunk ids and the whole
+        file checksum from the other file, instead of reading the
+        data. Return True if this was done.
+
+        '''
+
+        if not self.is_moved_file_candidate(metadata):
+            return False
+        if not self.moved_files_seeded:
+            self.seed_moved_files()
+            self.progress.what(filename)
+
+        found = self.moved_files.get(metadata)
+        if found is None:
+            return False
+        gen, other = found
+        if gen is None:
+            # Backed up during this run. The file may have been
+            # carried over into a new generation by a checkpoint.
+            gen = self.new_generation
+
+        # Make sure the other file is still there, and is the same
+        # as when it was added to the index.
+        identity = self.moved_files.get_identity(metadata)
+        chunk_ids = None
+        try:
+            other_metadata = self.get_metadata_from_generation(gen, other)
+            if self.moved_files.get_identity(other_metadata) == identity:
+                chunk_ids = self.repo.get_file_chunk_ids(gen, other)
+        except obnamlib.ObnamError:
+            pass
+        if not chunk_ids:
+            # The file has changed, or gone away, or its chunk ids were
+            # just cleared, because it is the very same file.
+            self.moved_files.remove(metadata)
+            return False
+
+        logging.debug('reusing data of %s for %s', other, filename)
+        with self.phase_stats.timer('store-metadata'):
+            for chunk_id in chunk_ids:
+                self.repo.append_file_chunk_id(
+                    self.new_generation, filename, chunk_id)
+        for key, name in obnamlib.metadata_file_key_mapping:
+            if key == checksum_key:
+                setattr(metadata, name, getattr(other_metadata, name))
+
+        self.phase_stats.count('files-reused')
+        self.progress.update_progress_with_scanned(metadata.st_size)
+        return True
+
+    def seed_moved_files(self):
+        '''Add large enough files from the previous generation.'''
+
+        self.moved_files_seeded = True
+        gen = self.previous_generation
+        if gen is None:
+            return
+
+        self.progress.what('finding files that may have been moved')
+        with self.phase_stats.timer('seed-moved-files'):
+            dirnames = ['/']
+            while dirnames:
+                dirname = dirnames.pop()
+                try:
+                    children = self.repo.get_file_children(gen, dirname)
+                    for pathname in children:
+                        metadata = self.get_metadata_from_generation(
+                            gen, pathname)
+                        if metadata.isdir():
+                            dirnames.append(pathname)
+                        elif (stat.S_ISREG(metadata.st_mode) and
+                              self.is_moved_file_candidate(metadata)):
+                            self.moved_files.add(metadata, gen, pathname)
+                except obnamlib.ObnamError as e:
+                    logging.warning(
+                        'Could not look for moved files in %s: %s',
+                        dirname, e)
+        logging.debug(
+            'found %d files in previous generation that may have moved',
+            len(self.moved_files))
+
+    def read_file_chunks(self, f, metadata, chunk_size):
+        '''Generate the chunks of a file, as (data, is_hole) pairs.
+
+        Chunks that are entirely within a hole in a sparse file are
+        not read, since they're known to contain only zeroes. Such
+        chunks are generated with is_hole set to True.
+
+        '''
+
+        # Only look for holes if the file seems to have some. Most
+        # files don't, and then we don't need the extra system calls.
+        find_data = None
+        if metadata.st_blocks * 512 < metadata.st_size:
+            find_data = getattr(f, 'find_data', None)
+
+        offset = 0
+        extent = (0, 0)
+        seek_needed = False
+        while True:
+            if find_data is not None:
+                if offset >= extent[1]:
+                    extent = find_data(offset)
+                    if extent is None:
+                        extent = (metadata.st_size, metadata.st_size)
+                if offset + chunk_size <= extent[0]:
+                    offset += chunk_size
+                    seek_needed = True
+                    yield self.get_zero_chunk(chunk_size), True
+                    continue
+                if seek_needed:
+                    f.seek(offset)
+                    seek_needed = False
+
+            with self.phase_stats.timer('read-file-data'):
+                data = f.read(chunk_size)
+            if not data:
+                tracer.trace('end of data')
+                break
+            offset += len(data)
+            yield data, False
+
+    def get_zero_chunk(self, size):
+        if len(self.zero_chunk) != size:
+            self.zero_chunk = '\0' * size
+        return self.zero_chunk
+
+    def backup_zero_chunk(self, data):
+        '''Back up a chunk that is in a hole in a sparse file.
+
+        All such chunks have the same content, so the chunk is put
+        into the repository, or found there, only once per backup run.
+        Later ones are just references to the same chunk, and need
+        neither checksumming nor deduplication lookups. Nor do they
+        need to be added to the chunk indexes again: backup_file_chunk
+        has already arranged for the first one to be added.
+
+        '''
+
+        self.phase_stats.count('chunks-in-holes')
+        if self.zero_chunk_id is None:
+            with self.phase_stats.timer('checksum'):
+                token = self.repo.prepare_chunk_for_indexes(data)
+            chunk_id = self.backup_file_chunk(data, token=token)
+            if self.app.settings['deduplicate'] == 'never':
+                return chunk_id
+            self.zero_chunk_id = chunk_id
+        return self.zero_chunk_id
+
+    def backup_file_chunk(self, data, token=None):
+        '''Back up a chunk of data by putting it into the repository.
+
+        The token is the one returned by prepare_chunk_for_indexes for
+        the data. It is computed here, if not given.
+
+        '''
 
         def find():
+            with self.phase_stats.timer('dedup-lookup'):
+                return find_in_repo() + self.chunkid_token_map.get(token)
+
+        def find_in_repo():
             # We ignore lookup errors here intentionally. We're reading
             # the checksum trees without a lock, so another Obnam may be
             # modifying them, which can lead to spurious NodeMissing
@@ -793,19 +1041,29 @@ class BackupPlugin(obnamlib.ObnamPlugin):
                 in_tree = []
             except obnamlib.RepositoryChunkContentNotInIndexes:
                 in_tree = []
-            return in_tree + self.chunkid_token_map.get(token)
+            return in_tree
 
         def get(chunkid):
-            return self.repo.get_chunk_content(chunkid)
+            with self.phase_stats.timer('dedup-lookup'):
+                return self.repo.get_chunk_content(chunkid)
 
         def put():
             self.progress.update_progress_with_upload(len(data))
-            return self.repo.put_chunk_content(data)
+            self.phase_stats.count('chunks-new')
+            with self.phase_stats.timer('put-chunk'):
+                return self.repo.put_chunk_content(data)
 
         def share(chunkid):
             self.chunkid_token_map.add(chunkid, token)
 
-        token = self.repo.prepare_chunk_for_indexes(data)
+        def reuse(chunkid):
+            self.phase_stats.count('chunks-deduplicated')
+            share(chunkid)
+            return chunkid
+
+        if token is None:
+            with self.phase_stats.timer('checksum'):
+                token = self.repo.prepare_chunk_for_indexes(data)
 
         mode = self.app.settings['deduplicate']
         if mode == 'never':
@@ -814,17 +1072,15 @@ class BackupPlugin(obnamlib.ObnamPlugin):
             for chunkid in find():
                 data2 = get(chunkid)
                 if data == data2:
-                    share(chunkid)
-                    return chunkid
+                    return reuse(chunkid)
             chunkid = put()
             share(chunkid)
             return chunkid
         elif mode == 'fatalist':
             existing = find()
             if existing:
-                chunkid = existing[0]
-            else:
-                chunkid = put()
+                return reuse(existing[0])
+            chunkid = put()
             share(chunkid)
             return chunkid
         else:
@@ -843,7 +1099,7 @@ class BackupPlugin(obnamlib.ObnamPlugin):
         processed separately.
         '''
 
-        tracing.trace('backup_dir: %s', root)
+        tracer.trace('backup_dir: %s', root)
         if self.pretend:
             return
 
@@ -896,9 +1152,9 @@ class BackupPlugin(obnamlib.ObnamPlugin):
 
         def helper(dirname):
             if dirname in new_roots:
-                tracing.trace('is a new root: %s' % dirname)
+                tracer.trace('is a new root: %s', dirname)
             elif is_parent(dirname):
-                tracing.trace('is parent of a new root: %s' % dirname)
+                tracer.trace('is parent of a new root: %s', dirname)
                 if self.repo.file_exists(gen_id, dirname):
                     pathnames = [
                         os.path.join(dirname, x)
@@ -906,7 +1162,7 @@ class BackupPlugin(obnamlib.ObnamPlugin):
                     for pathname in pathnames:
                         helper(pathname)
             else:
-                tracing.trace('is extra and removed: %s' % dirname)
+                tracer.trace('is extra and removed: %s', dirname)
                 self.progress.what(
                     'removing %s from new generation' % dirname)
                 self.repo.remove_file(self.new_generation, dirname)
@@ -915,6 +1171,6 @@ class BackupPlugin(obnamlib.ObnamPlugin):
         assert not self.pretend
         msg = 'removing old backup roots from new generation'
         self.progress.what(msg)
-        tracing.trace('new_roots: %s' % repr(new_roots))
+        tracer.trace('new_roots: %r', new_roots)
         gen_id = self.new_generation
         helper('/')
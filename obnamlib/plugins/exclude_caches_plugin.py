@@ -16,7 +16,6 @@
 
 import logging
 import os
-import stat
 
 import obnamlib
 
@@ -39,19 +38,21 @@ class ExcludeCachesPlugin(obnamlib.ObnamPlugin):
 
     def config_loaded(self):
         if self.app.settings['exclude-caches']:
-            self.app.hooks.add_callback('backup-exclude', self.exclude)
+            self.app.hooks.add_callback(
+                'backup-exclude-directory', self.exclude)
 
-    def exclude(self, fs=None, pathname=None, stat_result=None, exclude=None,
+    def exclude(self, fs=None, pathname=None, basenames=None, exclude=None,
                 **kwargs):
-        if stat.S_ISDIR(stat_result.st_mode):
-            tag_filename = 'CACHEDIR.TAG'
-            tag_contents = 'Signature: 8a477f597d28d172789f06886806bc55'
+        # The directory has already been listed, so we only need to
+        # look at the tag file, if there is one.
+        tag_filename = 'CACHEDIR.TAG'
+        tag_contents = 'Signature: 8a477f597d28d172789f06886806bc55'
+        if tag_filename in basenames:
             tag_path = os.path.join(pathname, tag_filename)
-            if fs.exists(tag_path):
-                # Can't use with, because Paramiko's SFTPFile does not work.
-                f = fs.open(tag_path, 'rb')
-                data = f.read(len(tag_contents))
-                f.close()
-                if data == tag_contents:
-                    logging.debug('Excluding (cache dir): %s', pathname)
-                    exclude[0] = True
+            # Can't use with, because Paramiko's SFTPFile does not work.
+            f = fs.open(tag_path, 'rb')
+            data = f.read(len(tag_contents))
+            f.close()
+            if data == tag_contents:
+                logging.debug('Excluding (cache dir): %s', pathname)
+                exclude[0] = True
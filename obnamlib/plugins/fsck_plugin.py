@@ -14,17 +14,132 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import collections
 import hashlib
+import itertools
 import logging
+import os
+import Queue
 import stat
 import sys
+import threading
+import time
 
 import obnamlib
 from obnamlib import WorkItem
 
 
+def check_chunk(repo, chunkid, want_content, want_valid):
+    '''Return (exists, content, valid) for a chunk.
+
+    Content and validity are None, if the chunk does not exist or
+    they are not wanted.
+
+    '''
+
+    if not repo.has_chunk(chunkid):
+        return False, None, None
+    data = None
+    valid = None
+    if want_content:
+        data = repo.get_chunk_content(chunkid)
+    if want_valid:
+        valid = repo.validate_chunk_content(chunkid)
+    return True, data, valid
+
+
+class ChunkFuture(object):
+
+    '''The result of checking a chunk in a worker thread.'''
+
+    def __init__(self, chunkid, want_content, want_valid):
+        self.chunkid = chunkid
+        self.want_content = want_content
+        self.want_valid = want_valid
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    def set_result(self, result):
+        self._result = result
+        self._done.set()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._done.set()
+
+    def get(self):
+        self._done.wait()
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+class ChunkFetcher(object):
+
+    '''Check chunks in a pool of worker threads.
+
+    Repository objects are not safe to share between threads, so each
+    worker opens its own. Workers only read chunks. Everything else,
+    including updating whole-file checksums and the set of chunks
+    seen, happens in the main thread, in the order the work items
+    are done.
+
+    '''
+
+    def __init__(self, open_repository, num_workers):
+        self._open_repository = open_repository
+        self._num_workers = num_workers
+        self._queue = Queue.Queue()
+        self._threads = []
+
+    def submit(self, chunkid, want_content, want_valid):
+        if not self._threads:
+            self._start()
+        future = ChunkFuture(chunkid, want_content, want_valid)
+        self._queue.put(future)
+        return future
+
+    def _start(self):
+        for i in range(self._num_workers):
+            thread = threading.Thread(
+                target=self._work, name='fsck-worker-%d' % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        repo = None
+        while True:
+            future = self._queue.get()
+            if future is None:
+                break
+            try:
+                if repo is None:
+                    repo = self._open_repository()
+                future.set_result(
+                    check_chunk(
+                        repo, future.chunkid, future.want_content,
+                        future.want_valid))
+            except BaseException:
+                future.set_exception(sys.exc_info())
+        if repo is not None:
+            repo.close()
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
 class CheckChunk(WorkItem):
 
+    # Set by the fsck plugin if the chunk is being checked by a
+    # worker thread.
+    future = None
+
     def __init__(self, chunkid, checksummer):
         self.chunkid = chunkid
         self.checksummer = checksummer
@@ -32,13 +147,25 @@ class CheckChunk(WorkItem):
 
     def do(self):
         logging.debug('Checking chunk %s', self.chunkid)
-        if not self.repo.has_chunk(self.chunkid):
-            self.error('chunk %s does not exist' % self.chunkid)
-        elif not self.settings['fsck-skip-checksums']:
-            data = self.repo.get_chunk_content(self.chunkid)
-            self.checksummer.update(data)
+        want_content = self.checksummer is not None
+        if not want_content and self.chunkid in self.chunkids_seen:
+            # Already checked for another file, and we don't need
+            # the content for a whole-file checksum.
+            return
+
+        want_valid = not self.settings['fsck-skip-checksums']
+        if self.future is None:
+            exists, data, valid = check_chunk(
+                self.repo, self.chunkid, want_content, want_valid)
+        else:
+            exists, data, valid = self.future.get()
+            self.future = None
 
-            valid = self.repo.validate_chunk_content(self.chunkid)
+        if not exists:
+            self.error('chunk %s does not exist' % self.chunkid)
+        else:
+            if want_content:
+                self.checksummer.update(data)
             if valid is False:
                 self.error('chunk %s is corrupted' % self.chunkid)
 
@@ -76,19 +203,23 @@ class CheckFile(WorkItem):
             self.genid, self.filename, obnamlib.REPO_FILE_MODE)
         if stat.S_ISREG(mode) and not self.settings['fsck-ignore-chunks']:
             chunkids = self.repo.get_file_chunk_ids(self.genid, self.filename)
-            checksummer = hashlib.md5()
-            for chunkid in chunkids:
-                yield CheckChunk(chunkid, checksummer)
+            checksummer = None
             if not self.settings['fsck-skip-checksums']:
                 if obnamlib.REPO_FILE_MD5 in self.repo.get_allowed_file_keys():
-                    md5 = self.repo.get_file_key(
-                        self.genid, self.filename, obnamlib.REPO_FILE_MD5)
-                    yield CheckFileChecksum(
-                        self.name, md5, chunkids, checksummer)
+                    checksummer = hashlib.md5()
+            for chunkid in chunkids:
+                yield CheckChunk(chunkid, checksummer)
+            if checksummer is not None:
+                md5 = self.repo.get_file_key(
+                    self.genid, self.filename, obnamlib.REPO_FILE_MD5)
+                yield CheckFileChecksum(
+                    self.name, md5, chunkids, checksummer)
 
 
 class CheckDirectory(WorkItem):
 
+    resumable = True
+
     def __init__(self, client_name, genid, dirname):
         self.client_name = client_name
         self.genid = genid
@@ -110,6 +241,8 @@ class CheckDirectory(WorkItem):
 
 class CheckGeneration(WorkItem):
 
+    resumable = True
+
     def __init__(self, client_name, genid):
         self.client_name = client_name
         self.genid = genid
@@ -168,6 +301,8 @@ class CheckGenerationIdsAreDifferent(WorkItem):
 
 class CheckClient(WorkItem):
 
+    resumable = True
+
     def __init__(self, client_name):
         self.client_name = client_name
         self.name = 'client %s' % client_name
@@ -298,6 +433,37 @@ class FsckPlugin(obnamlib.ObnamPlugin):
             'do not check checksums of files',
             group=group)
 
+        self.app.settings.integer(
+            ['fsck-workers'],
+            'use N threads to read and check chunks in parallel; '
+            '0 means read them in the main thread',
+            metavar='N',
+            default=obnamlib.DEFAULT_FSCK_WORKERS,
+            group=group)
+
+        self.app.settings.string(
+            ['fsck-budget'],
+            'stop fsck after it has run for TIME (a number with an '
+            'optional unit of s, m, h, or d), and has finished some '
+            'work, so that it can be continued later with '
+            '--fsck-resume; default is to run until done',
+            metavar='TIME',
+            group=group)
+
+        self.app.settings.boolean(
+            ['fsck-resume'],
+            'continue an interrupted or time-limited fsck run, '
+            'skipping the work its journal says is done',
+            group=group)
+
+        self.app.settings.string(
+            ['fsck-journal'],
+            'keep track of fsck progress in FILE; the default is '
+            'a file named after the repository in '
+            '$XDG_CACHE_HOME/obnam (or ~/.cache/obnam)',
+            metavar='FILE',
+            group=group)
+
     def configure_ttystatus(self):
         self.app.ts.clear()
         self.app.ts['this_item'] = 0
@@ -320,10 +486,18 @@ class FsckPlugin(obnamlib.ObnamPlugin):
         self.repo.lock_everything()
 
         self.errors = 0
-        self.chunkids_seen = set()
-        self.work_items = []
+        self.setup_journal()
+        self.work_items = collections.deque()
         self.add_item(CheckRepository(), append=True)
 
+        num_workers = self.app.settings['fsck-workers']
+        if num_workers > 0:
+            self.fetcher = ChunkFetcher(
+                self.app.get_repository_object, num_workers)
+            self.prefetch_window = 2 * num_workers
+        else:
+            self.fetcher = None
+
         final_items = []
         if not any(self.app.settings['fsck-' + s] for s in
                    ('ignore-chunks', 'skip-files', 'skip-dirs',
@@ -331,19 +505,36 @@ class FsckPlugin(obnamlib.ObnamPlugin):
                     'ignore-client')):
             final_items.append(CheckForExtraChunks(rm_unused_chunks))
 
+        stopped = False
         while self.work_items:
-            work = self.work_items.pop(0)
+            if self.time_is_up():
+                stopped = True
+                break
+            work = self.work_items.popleft()
+            if self.is_done_already(work):
+                logging.debug('done in earlier run: %s', str(work))
+                self.finish_item(work, record=False)
+                continue
             logging.debug('doing: %s', str(work))
             self.app.ts['item'] = work
             self.app.ts.increase('this_item', 1)
-            pos = 0
-            for more in work.do() or []:
-                self.add_item(more, pos=pos)
-                pos += 1
+            more = list(work.do() or [])
+            if getattr(work, 'interrupted', False):
+                stopped = True
+                break
+            work.fsck_pending = len(more)
+            for new in reversed(more):
+                self.add_item(new, parent=work)
+            if not more:
+                self.finish_item(work)
             if not self.work_items:
                 for work in final_items:
                     self.add_item(work, append=True)
                 final_items = []
+            self.prefetch_chunks()
+
+        if self.fetcher is not None:
+            self.fetcher.close()
 
         if rm_unused_chunks:
             self.repo.commit_chunk_indexes()
@@ -352,22 +543,93 @@ class FsckPlugin(obnamlib.ObnamPlugin):
         self.repo.close()
         self.app.ts.finish()
 
+        if self.journal is not None:
+            if stopped:
+                self.journal.close()
+                self.app.ts.notify(
+                    'fsck stopped before it was done; '
+                    'use --fsck-resume to continue')
+            else:
+                self.journal.remove()
+
         if self.errors:
             sys.exit(1)
 
-    def add_item(self, work, append=False, pos=0):
+    def setup_journal(self):
+        budget = self.app.settings['fsck-budget']
+        if budget:
+            self.deadline = time.time() + obnamlib.parse_fsck_budget(budget)
+        else:
+            self.deadline = None
+
+        resume = self.app.settings['fsck-resume']
+        if resume or self.deadline is not None:
+            self.journal = obnamlib.FsckJournal(self.get_journal_filename())
+            if resume:
+                self.journal.load()
+            self.journal.open(resume)
+            self.chunkids_seen = obnamlib.JournalledChunkIds(self.journal)
+        else:
+            self.journal = None
+            self.chunkids_seen = set()
+
+    def get_journal_filename(self):
+        filename = self.app.settings['fsck-journal']
+        if filename:
+            return filename
+        cache_dir = os.environ.get('XDG_CACHE_HOME')
+        if not cache_dir:
+            cache_dir = os.path.expanduser('~/.cache')
+        repo_hash = hashlib.sha1(self.app.settings['repository']).hexdigest()
+        return os.path.join(cache_dir, 'obnam', 'fsck-%s' % repo_hash)
+
+    def time_is_up(self):
+        # Don't stop before something has been recorded in the
+        # journal, so that each run gets further than the one before,
+        # however small the budget.
+        return (self.deadline is not None and
+                time.time() >= self.deadline and
+                self.journal.made_progress())
+
+    def is_done_already(self, work):
+        return self.journal is not None and self.journal.is_item_done(work)
+
+    def finish_item(self, work, record=True):
+        if self.journal is not None:
+            self.journal.finish_item(work, record=record)
+
+    def add_item(self, work, append=False, parent=None):
         logging.debug('adding: %s', str(work))
         work.warning = self.warning
         work.error = self.error
         work.repo = self.repo
         work.settings = self.app.settings
         work.chunkids_seen = self.chunkids_seen
+        work.journal = self.journal
+        work.time_is_up = self.time_is_up
+        work.fsck_parent = parent
         if append:
             self.work_items.append(work)
         else:
-            self.work_items.insert(pos, work)
+            self.work_items.appendleft(work)
         self.app.ts.increase('items', 1)
 
+    def prefetch_chunks(self):
+        # Give the chunk checks that are next in line to the worker
+        # threads, so that they are read while the main thread is
+        # busy with the ones before them. Only checks that need the
+        # chunk content are worth it; the others are cheap, or are
+        # skipped, if the chunk has been checked already.
+        if self.fetcher is None:
+            return
+        want_valid = not self.app.settings['fsck-skip-checksums']
+        upcoming = itertools.islice(self.work_items, self.prefetch_window)
+        for work in upcoming:
+            if (isinstance(work, CheckChunk) and work.future is None and
+                    work.checksummer is not None):
+                work.future = self.fetcher.submit(
+                    work.chunkid, True, want_valid)
+
     def error(self, msg):
         logging.error(msg)
         self.app.ts.error(msg)
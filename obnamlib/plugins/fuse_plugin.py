@@ -14,11 +14,16 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import bisect
+import collections
+import contextlib
 import os
+import Queue
 import stat
 import logging
 import errno
 import struct
+import threading
 
 try:
     import fuse
@@ -33,11 +38,12 @@ except ImportError:
             self.__dict__.update(kwds)
     fuse = Bunch(Fuse=object)
 
-import tracing
-
 import obnamlib
 
 
+tracer = obnamlib.Tracer(__file__)
+
+
 class FileNotFoundError(obnamlib.ObnamError):
 
     msg = 'FUSE: File not found: {filename}'
@@ -75,6 +81,213 @@ class ObnamFuseOptParse(object):
             self.fuse_args.add('ro')
 
 
+class ChunkOffsets(object):
+
+    '''Map offsets in a file to the chunks that contain them.
+
+    There is no guarantee all the chunks of a file are of the same
+    size: the user may have changed the chunk size setting between
+    backup runs. Thus the offset of a chunk is only known once the
+    sizes of all the chunks before it are known. This table is built
+    lazily, only as far into the file as reads have needed so far,
+    and lookups within the known part use a binary search.
+
+    '''
+
+    def __init__(self, chunkids, get_chunk_size):
+        self._chunkids = chunkids
+        self._get_chunk_size = get_chunk_size
+        self._ends = []
+
+    def find(self, offset):
+        '''Find the chunk containing a given offset.
+
+        Return a tuple of the index of the chunk in the list of chunk
+        ids and the offset of the start of the chunk in the file, or
+        None if the offset is past the last chunk.
+
+        '''
+
+        ends = self._ends
+        if ends and offset < ends[-1]:
+            i = bisect.bisect_right(ends, offset)
+        else:
+            while not ends or offset >= ends[-1]:
+                i = len(ends)
+                if i >= len(self._chunkids):
+                    return None
+                start = ends[-1] if ends else 0
+                ends.append(start + self._get_chunk_size(self._chunkids[i]))
+
+        start = ends[i - 1] if i > 0 else 0
+        return i, start
+
+
+class LRUCache(object):
+
+    '''A least-recently-used cache, bounded by the total size of values.
+
+    The size of each value is computed by the get_size function. The
+    cache is shared by all FUSE threads, so it is protected by a lock.
+
+    '''
+
+    def __init__(self, max_size, get_size):
+        self._max_size = max_size
+        self._get_size = get_size
+        self._values = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._values
+
+    def get(self, key):
+        with self._lock:
+            value = self._values.pop(key, None)
+            if value is not None:
+                self._values[key] = value
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            old = self._values.pop(key, None)
+            if old is not None:
+                self._size -= self._get_size(old)
+            self._values[key] = value
+            self._size += self._get_size(value)
+            while self._size > self._max_size and self._values:
+                _, evicted = self._values.popitem(last=False)
+                self._size -= self._get_size(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._size = 0
+
+
+class RepositoryPool(object):
+
+    '''A pool of repository objects for the FUSE threads.
+
+    Repository objects may not be used from several threads at once,
+    so each thread checks one out of the pool for the duration of a
+    FUSE request. A thread that already has one checked out gets the
+    same one again, so that nested uses do not deadlock.
+
+    '''
+
+    def __init__(self, open_repository, max_size):
+        self._open_repository = open_repository
+        self._available = threading.Semaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle = []
+        self._generation = 0
+        self._local = threading.local()
+
+    def add(self, repo):
+        with self._lock:
+            self._idle.append((self._generation, repo))
+
+    @contextlib.contextmanager
+    def repository(self):
+        repo = getattr(self._local, 'repo', None)
+        if repo is not None:
+            yield repo
+            return
+
+        self._available.acquire()
+        try:
+            with self._lock:
+                if self._idle:
+                    generation, repo = self._idle.pop()
+                else:
+                    generation = self._generation
+            if repo is None:
+                repo = self._open_repository()
+
+            self._local.repo = repo
+            try:
+                yield repo
+            finally:
+                self._local.repo = None
+                with self._lock:
+                    if generation == self._generation:
+                        self._idle.append((generation, repo))
+                        repo = None
+                if repo is not None:
+                    repo.close()
+        finally:
+            self._available.release()
+
+    def refresh(self):
+        '''Close idle repository objects and do not re-use busy ones.'''
+        with self._lock:
+            self._generation += 1
+            idle = self._idle
+            self._idle = []
+        for _, repo in idle:
+            repo.close()
+
+
+class ChunkReadAhead(object):
+
+    '''Fetch chunks into a chunk cache in a background thread.
+
+    The thread is started when it is first needed: FUSE forks into
+    the background after the mount is set up, and threads started
+    before that would not survive the fork.
+
+    '''
+
+    max_queued = 64
+
+    def __init__(self, cache, repo_pool):
+        self._cache = cache
+        self._repo_pool = repo_pool
+        self._queue = Queue.Queue(self.max_queued)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def prefetch(self, chunkids):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        for chunkid in chunkids:
+            if chunkid not in self._cache:
+                try:
+                    self._queue.put_nowait(chunkid)
+                except Queue.Full:
+                    break
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _run(self):
+        while True:
+            chunkid = self._queue.get()
+            if chunkid is None:
+                break
+            if chunkid not in self._cache:
+                try:
+                    with self._repo_pool.repository() as repo:
+                        contents = repo.get_chunk_content(chunkid)
+                except obnamlib.ObnamError as e:
+                    logging.warning(
+                        'Read-ahead of chunk %s failed: %s',
+                        chunkid, str(e))
+                else:
+                    self._cache.put(chunkid, contents)
+
+
 class ObnamFuseFile(object):
 
     fuse_fs = None  # points to active ObnamFuse object
@@ -89,9 +302,9 @@ class ObnamFuseFile(object):
         os.O_APPEND)
 
     def __init__(self, path, flags, *mode):
-        tracing.trace('path=%r', path)
-        tracing.trace('flags=%r', flags)
-        tracing.trace('mode=%r', mode)
+        tracer.trace('path=%r', path)
+        tracer.trace('flags=%r', flags)
+        tracer.trace('mode=%r', mode)
 
         self.path = path
 
@@ -102,6 +315,16 @@ class ObnamFuseFile(object):
         if self.reading_pid:
             return
 
+        self.chunkids = None
+        self.chunk_offsets = None
+        self.next_offset = 0
+        self.read_ahead_until = 0
+
+        # The kernel may send several reads for the same open file at
+        # once, but the state above can only be updated by one thread
+        # at a time.
+        self._state_lock = threading.Lock()
+
         try:
             self.metadata = self.fuse_fs.get_metadata_in_generation(path)
         except:
@@ -125,8 +348,8 @@ class ObnamFuseFile(object):
             return self.release_data(flags)
 
     def read_pid(self, length, offset):
-        tracing.trace('length=%r', length)
-        tracing.trace('offset=%r', offset)
+        tracer.trace('length=%r', length)
+        tracer.trace('offset=%r', offset)
         pid = str(os.getpid())
         if length < len(pid) or offset != 0:
             return ''
@@ -138,84 +361,101 @@ class ObnamFuseFile(object):
         return 0
 
     def fgetattr(self):
-        tracing.trace('called')
+        tracer.trace('called')
         return self.fuse_fs.getattr(self.path)
 
     def read_data(self, length, offset):
-        tracing.trace('self.path=%r', self.path)
-        tracing.trace('length=%r', length)
-        tracing.trace('offset=%r', offset)
+        tracer.trace('self.path=%r', self.path)
+        tracer.trace('length=%r', length)
+        tracer.trace('offset=%r', offset)
 
         if length == 0 or offset >= self.metadata.st_size:
             return ''
 
-        gen, repopath = self.fuse_fs.get_gen_path(self.path)
+        with self._state_lock:
+            return self.read_chunks(length, offset)
 
+    def read_chunks(self, length, offset):
         # The file has a list of chunks, and we need to find the right
-        # ones and return data from them. Note that we can't compute a
-        # seek: there is no guarantee all the chunks are of the same
-        # size. The user may have changed the chunk size setting
-        # between each backup run. Thus, we have to iterate over the
-        # list of chunk ids for the file, until we find the right
-        # place.
-        #
-        # This is, obviously, not good for performance.
-        #
-        # Note that previous code here did the wrong thing by assuming
-        # the chunk size was fixed, except for the last chunk for any
-        # file.
-
-        chunkids = self.fuse_fs.obnam.repo.get_file_chunk_ids(gen, repopath)
+        # ones and return data from them. The chunk offset table is
+        # kept for as long as the file is open, so that each read only
+        # touches the chunks it needs, after the first read that far
+        # into the file.
+
+        if self.chunk_offsets is None:
+            gen, repopath = self.fuse_fs.get_gen_path(self.path)
+            with self.fuse_fs.repo_pool.repository() as repo:
+                self.chunkids = repo.get_file_chunk_ids(gen, repopath)
+            self.chunk_offsets = ChunkOffsets(
+                self.chunkids, self.get_chunk_size)
+
         output = []
         output_length = 0
-        chunk_pos_in_file = 0
-        size_cache = self.fuse_fs.obnam.chunk_sizes
-
-        for chunkid in chunkids:
-            if chunkid in size_cache:
-                # Don't read the contents of the chunk until later,
-                # in case it can be skipped completely.
-                contents = None
-            else:
-                contents = self.fuse_fs.obnam.repo.get_chunk_content(chunkid)
-                size_cache[chunkid] = len(contents)
-            size = size_cache[chunkid]
-
-            if chunk_pos_in_file + size > offset + output_length:
-                start = offset + output_length - chunk_pos_in_file
-                n = min(length - output_length, size - start)
-                if contents is None:
-                    contents = self.fuse_fs.obnam.repo.get_chunk_content(
-                        chunkid)
-                output.append(contents[start:start+n])
-                output_length += n
-                assert output_length <= length
-                if output_length == length:
-                    break
-            chunk_pos_in_file += size
+        index = None
+
+        while output_length < length:
+            found = self.chunk_offsets.find(offset + output_length)
+            if found is None:
+                break
+            index, chunk_pos_in_file = found
+            contents = self.get_chunk_content(self.chunkids[index])
+            start = offset + output_length - chunk_pos_in_file
+            n = min(length - output_length, len(contents) - start)
+            output.append(contents[start:start+n])
+            output_length += n
+
+        # If the file is being read sequentially, fetch the next
+        # chunks in the background, so they're ready when needed.
+        if offset == self.next_offset and index is not None:
+            self.read_ahead(index + 1)
+        self.next_offset = offset + output_length
 
         return ''.join(output)
 
+    def read_ahead(self, first):
+        count = self.fuse_fs.obnam.app.settings['fuse-read-ahead']
+        start = max(first, self.read_ahead_until)
+        wanted = self.chunkids[start:first + count]
+        if wanted:
+            self.fuse_fs.chunk_read_ahead.prefetch(wanted)
+        self.read_ahead_until = max(self.read_ahead_until, first + count)
+
+    def get_chunk_size(self, chunkid):
+        size_cache = self.fuse_fs.obnam.chunk_sizes
+        if chunkid not in size_cache:
+            self.get_chunk_content(chunkid)
+        return size_cache[chunkid]
+
+    def get_chunk_content(self, chunkid):
+        cache = self.fuse_fs.chunk_cache
+        contents = cache.get(chunkid)
+        if contents is None:
+            with self.fuse_fs.repo_pool.repository() as repo:
+                contents = repo.get_chunk_content(chunkid)
+            cache.put(chunkid, contents)
+        self.fuse_fs.obnam.chunk_sizes[chunkid] = len(contents)
+        return contents
+
     def release_data(self, flags):
-        tracing.trace('flags=%r', flags)
+        tracer.trace('flags=%r', flags)
         return 0
 
     def fsync(self, isfsyncfile):
-        tracing.trace('called')
+        tracer.trace('called')
         return 0
 
     def flush(self):
-        tracing.trace('called')
+        tracer.trace('called')
         return 0
 
     def ftruncate(self, size):
-        tracing.trace('size=%r', size)
+        tracer.trace('size=%r', size)
         return 0
 
     def lock(self, cmd, owner, **kw):
-        tracing.trace('cmd=%r', cmd)
-        tracing.trace('owner=%r', owner)
-        tracing.trace('kw=%r', kw)
+        tracer.trace('cmd=%r', cmd)
+        tracer.trace('owner=%r', owner)
+        tracer.trace('kw=%r', kw)
         raise IOError(errno.EOPNOTSUPP, 'Operation not supported')
 
 
@@ -227,71 +467,105 @@ class ObnamFuse(fuse.Fuse):
         self.obnam = kw['obnam']
         ObnamFuseFile.fuse_fs = self
         self.file_class = ObnamFuseFile
+        settings = self.obnam.app.settings
+        self.repo_pool = self.obnam.repo_pool
+        self.chunk_cache = LRUCache(settings['fuse-chunk-cache-size'], len)
+        self.chunk_read_ahead = ChunkReadAhead(
+            self.chunk_cache, self.repo_pool)
+
+        # Generations in the repository do not change while mounted,
+        # so we can cache what we learn about them, until the root
+        # is refreshed.
+        self.gen_ids = {}
+        self.metadata_cache = LRUCache(
+            settings['fuse-metadata-cache-size'], lambda value: 1)
+        self.children_cache = LRUCache(
+            settings['fuse-metadata-cache-size'], len)
+
         self.init_root()
         fuse.Fuse.__init__(self, *args, **kw)
 
     def init_root(self):
+        with self.repo_pool.repository() as repo:
+            self.init_root_from_repository(repo)
+
+    def init_root_from_repository(self, repo):
         # we need the list of all real (non-checkpoint) generations
         client_name = self.obnam.app.settings['client-name']
         generations = [
             gen
-            for gen in self.obnam.repo.get_client_generation_ids(client_name)
-            if not self.obnam.repo.get_generation_key(
+            for gen in repo.get_client_generation_ids(client_name)
+            if not repo.get_generation_key(
                 gen, obnamlib.REPO_GENERATION_IS_CHECKPOINT)]
 
-        # self.rootlist holds the stat information for each entry at
+        # rootlist holds the stat information for each entry at
         # the root of the FUSE filesystem: /.pid, /latest, and one for
-        # each generation.
-        self.rootlist = {}
+        # each generation. Other threads may be using the old one, so
+        # we only replace self.rootlist once the new one is complete.
+        rootlist = {}
 
         used_generations = []
         for gen in generations:
-            genspec = self.obnam.repo.make_generation_spec(gen)
+            genspec = repo.make_generation_spec(gen)
             path = '/' + genspec
             try:
                 genstat = self.get_stat_in_generation(path)
-                end = self.obnam.repo.get_generation_key(
+                end = repo.get_generation_key(
                     gen, obnamlib.REPO_GENERATION_ENDED)
                 genstat.st_ctime = genstat.st_mtime = end
-                self.rootlist[path] = genstat
+                rootlist[path] = genstat
                 used_generations.append(gen)
             except obnamlib.ObnamError as e:
                 logging.warning('Ignoring error %s', str(e))
 
         assert used_generations
 
-        # self.rootstat is the stat information for the root of the
+        # rootstat is the stat information for the root of the
         # FUSE filesystem. We set it to the same as that of the latest
         # generation.
         latest_gen_id = used_generations[-1]
-        latest_gen_spec = self.obnam.repo.make_generation_spec(latest_gen_id)
-        latest_gen_root_stat = self.rootlist['/' + latest_gen_spec]
-        self.rootstat = fuse.Stat(**latest_gen_root_stat.__dict__)
+        latest_gen_spec = repo.make_generation_spec(latest_gen_id)
+        latest_gen_root_stat = rootlist['/' + latest_gen_spec]
+        rootstat = fuse.Stat(**latest_gen_root_stat.__dict__)
 
-        # Add an entry for /latest to self.rootlist.
+        # Add an entry for /latest to rootlist.
         symlink_stat = fuse.Stat(
             target=latest_gen_spec,
             **latest_gen_root_stat.__dict__)
         symlink_stat.st_mode &= ~(stat.S_IFDIR | stat.S_IFREG)
         symlink_stat.st_mode |= stat.S_IFLNK
-        self.rootlist['/latest'] = symlink_stat
+        rootlist['/latest'] = symlink_stat
 
-        # Add an entry for /.pid to self.rootlist.
-        pidstat = fuse.Stat(**self.rootstat.__dict__)
+        # Add an entry for /.pid to rootlist.
+        pidstat = fuse.Stat(**rootstat.__dict__)
         pidstat.st_mode = (
             stat.S_IFREG | stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
-        self.rootlist['/.pid'] = pidstat
+        rootlist['/.pid'] = pidstat
+
+        self.rootlist = rootlist
+        self.rootstat = rootstat
 
     def root_refresh(self):
-        tracing.trace('called')
-        self.obnam.reopen()
+        tracer.trace('called')
+        self.repo_pool.refresh()
+        self.gen_ids = {}
+        self.metadata_cache.clear()
+        self.children_cache.clear()
         self.init_root()
 
+    def stop_read_ahead(self):
+        self.chunk_read_ahead.stop()
+
     def get_metadata_in_generation(self, path):
-        tracing.trace('path=%r', path)
+        tracer.trace('path=%r', path)
+
+        metadata = self.metadata_cache.get(path)
+        if metadata is not None:
+            return metadata
 
         gen, filename = self.get_gen_path(path)
-        metadata = self.obnam.repo.get_metadata_from_file_keys(gen, filename)
+        with self.repo_pool.repository() as repo:
+            metadata = repo.get_metadata_from_file_keys(gen, filename)
 
         # FUSE does not allow negative timestamps, truncate to zero
         if metadata.st_atime_sec < 0:
@@ -299,10 +573,21 @@ class ObnamFuse(fuse.Fuse):
         if metadata.st_mtime_sec < 0:
             metadata.st_mtime_sec = 0
 
+        self.metadata_cache.put(path, metadata)
         return metadata
 
+    def get_file_children(self, path):
+        children = self.children_cache.get(path)
+        if children is None:
+            with self.repo_pool.repository() as repo:
+                children = [
+                    os.path.basename(x)
+                    for x in repo.get_file_children(*self.get_gen_path(path))]
+            self.children_cache.put(path, children)
+        return children
+
     def get_stat_in_generation(self, path):
-        tracing.trace('path=%r', path)
+        tracer.trace('path=%r', path)
         metadata = self.get_metadata_in_generation(path)
         st = fuse.Stat()
         st.st_mode = metadata.st_mode
@@ -317,17 +602,21 @@ class ObnamFuse(fuse.Fuse):
         return st
 
     def get_gen_path(self, path):
-        client_name = self.obnam.app.settings['client-name']
         if path.count('/') == 1:
             gen_spec = path[1:]
-            gen_id = self.obnam.repo.interpret_generation_spec(
-                client_name, gen_spec)
-            return (gen_id, '/')
+            return (self.get_gen_id(gen_spec), '/')
         else:
             gen_spec, repopath = path[1:].split('/', 1)
-            gen_id = self.obnam.repo.interpret_generation_spec(
-                client_name, gen_spec)
-            return (gen_id, '/' + repopath)
+            return (self.get_gen_id(gen_spec), '/' + repopath)
+
+    def get_gen_id(self, gen_spec):
+        gen_ids = self.gen_ids
+        if gen_spec not in gen_ids:
+            client_name = self.obnam.app.settings['client-name']
+            with self.repo_pool.repository() as repo:
+                gen_ids[gen_spec] = repo.interpret_generation_spec(
+                    client_name, gen_spec)
+        return gen_ids[gen_spec]
 
     def getattr(self, path):
         try:
@@ -347,16 +636,13 @@ class ObnamFuse(fuse.Fuse):
             raise
 
     def readdir(self, path, fh):
-        tracing.trace('path=%r', path)
-        tracing.trace('fh=%r', fh)
+        tracer.trace('path=%r', path)
+        tracer.trace('fh=%r', fh)
         try:
             if path == '/':
                 listdir = [x[1:] for x in self.rootlist.keys()]
             else:
-                listdir = [
-                    os.path.basename(x)
-                    for x in self.obnam.repo.get_file_children(
-                        *self.get_gen_path(path))]
+                listdir = self.get_file_children(path)
             return [fuse.Direntry(name) for name in ['.', '..'] + listdir]
         except obnamlib.ObnamError:
             raise IOError(errno.EINVAL, 'Invalid argument')
@@ -381,19 +667,20 @@ class ObnamFuse(fuse.Fuse):
             raise
 
     def statfs(self):
-        tracing.trace('called')
+        tracer.trace('called')
 
         client_name = self.obnam.app.settings['client-name']
 
-        total_data = sum(
-            self.obnam.repo.get_generation_key(
-                gen, obnamlib.REPO_GENERATION_TOTAL_DATA)
-            for gen in self.obnam.repo.get_client_generation_ids(client_name))
+        with self.repo_pool.repository() as repo:
+            total_data = sum(
+                repo.get_generation_key(
+                    gen, obnamlib.REPO_GENERATION_TOTAL_DATA)
+                for gen in repo.get_client_generation_ids(client_name))
 
-        files = sum(
-            self.obnam.repo.get_generation_key(
-                gen, obnamlib.REPO_GENERATION_FILE_COUNT)
-            for gen in self.obnam.repo.get_client_generation_ids(client_name))
+            files = sum(
+                repo.get_generation_key(
+                    gen, obnamlib.REPO_GENERATION_FILE_COUNT)
+                for gen in repo.get_client_generation_ids(client_name))
 
         stv = fuse.StatVfs()
         stv.f_bsize = 65536
@@ -410,9 +697,9 @@ class ObnamFuse(fuse.Fuse):
         return stv
 
     def getxattr(self, path, name, size):
-        tracing.trace('path=%r', path)
-        tracing.trace('name=%r', name)
-        tracing.trace('size=%r', size)
+        tracer.trace('path=%r', path)
+        tracer.trace('name=%r', name)
+        tracer.trace('size=%r', size)
 
         try:
             gen_id, repopath = self.get_gen_path(path)
@@ -421,8 +708,8 @@ class ObnamFuse(fuse.Fuse):
         except obnamlib.RepositoryGenerationDoesNotExist:
             return ''
 
-        tracing.trace('gen_id=%r', gen_id)
-        tracing.trace('repopath=%r', repopath)
+        tracer.trace('gen_id=%r', gen_id)
+        tracer.trace('repopath=%r', repopath)
 
         try:
             try:
@@ -454,8 +741,8 @@ class ObnamFuse(fuse.Fuse):
             raise
 
     def listxattr(self, path, size):
-        tracing.trace('path=%r', path)
-        tracing.trace('size=%r', size)
+        tracer.trace('path=%r', path)
+        tracer.trace('size=%r', size)
 
         try:
             gen_id, repopath = self.get_gen_path(path)
@@ -464,8 +751,8 @@ class ObnamFuse(fuse.Fuse):
         except obnamlib.RepositoryGenerationDoesNotExist:
             return []
 
-        tracing.trace('gen_id=%r', gen_id)
-        tracing.trace('repopath=%r', repopath)
+        tracer.trace('gen_id=%r', gen_id)
+        tracer.trace('repopath=%r', repopath)
 
         try:
             metadata = self.get_metadata_in_generation(path)
@@ -546,6 +833,36 @@ class MountPlugin(obnamlib.ObnamPlugin):
             'options to pass directly to Fuse',
             metavar='FUSE',
             group=mount_group)
+        self.app.settings.bytesize(
+            ['fuse-chunk-cache-size'],
+            'size of in-memory cache for file data chunks, '
+            'shared by all files open in the mounted repository',
+            metavar='SIZE',
+            default=obnamlib.DEFAULT_FUSE_CHUNK_CACHE_BYTES,
+            group=mount_group)
+        self.app.settings.integer(
+            ['fuse-read-ahead'],
+            'when a file in the mounted repository is read '
+            'sequentially, fetch up to COUNT of the following chunks '
+            'in the background; set to 0 to disable',
+            metavar='COUNT',
+            default=obnamlib.DEFAULT_FUSE_READ_AHEAD_CHUNKS,
+            group=mount_group)
+        self.app.settings.integer(
+            ['fuse-metadata-cache-size'],
+            'remember metadata and directory listings for up to '
+            'COUNT files in the mounted repository',
+            metavar='COUNT',
+            default=obnamlib.DEFAULT_FUSE_METADATA_CACHE_ENTRIES,
+            group=mount_group)
+        self.app.settings.integer(
+            ['fuse-repository-handles'],
+            'serve requests to the mounted repository in several '
+            'threads, using at most COUNT open connections to the '
+            'repository; set to 1 to serve one request at a time',
+            metavar='COUNT',
+            default=obnamlib.DEFAULT_FUSE_REPOSITORY_HANDLES,
+            group=mount_group)
 
     def mount(self, args):
         '''Mount a backup repository as a FUSE filesystem.
@@ -590,7 +907,9 @@ class MountPlugin(obnamlib.ObnamPlugin):
         # chdir to where we are now, so this doesn't break.
         self.cwd = os.getcwd()
 
-        self.repo = self.app.get_repository_object()
+        handles = max(1, self.app.settings['fuse-repository-handles'])
+        self.repo_pool = RepositoryPool(self.open_repository, handles)
+        self.repo_pool.add(self.app.get_repository_object())
 
         logging.debug(
             'FUSE Mounting %s@%s:/ to %s',
@@ -600,23 +919,22 @@ class MountPlugin(obnamlib.ObnamPlugin):
 
         # For speed, we need to remember how large each chunk is.
         # We store it here in the plugin so the cache survives a
-        # re-open.
+        # refresh.
         self.chunk_sizes = {}
 
         ObnamFuseOptParse.obnam = self
         fuse_fs = ObnamFuse(obnam=self, parser_class=ObnamFuseOptParse)
         fuse_fs.flags = 0
-        fuse_fs.multithreaded = 0
+        fuse_fs.multithreaded = handles > 1
         fuse_fs.parse()
         fuse_fs.main()
+        fuse_fs.stop_read_ahead()
 
-        self.repo.close()
-
-    def reopen(self):
-        self.repo.close()
+        self.repo_pool.refresh()
 
+    def open_repository(self):
         # Change to original working directory, to allow relative paths
         # for --repository to work correctly.
         os.chdir(self.cwd)
 
-        self.repo = self.app.get_repository_object()
+        return self.app.get_repository_object()
@@ -14,7 +14,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import hashlib
 import logging
 import os
 import stat
@@ -76,6 +75,50 @@ class Hardlinks(object):
             self.inodes[key] = (filename, nlinks - 1)
 
 
+class RestoreBatch(object):
+
+    '''Collect small files whose data is restored together.
+
+    Restoring files one at a time reads their chunks in file order,
+    but a repository may store the chunks of many files together, in
+    which case the same storage object gets read many times. A batch
+    collects files until it has about max_bytes of data, so that all
+    their chunks can be fetched at once, in whatever order suits the
+    repository. The metadata of the files, and of the directories
+    containing them, must be set only after the data has been written,
+    so the batch also queues those, in the order they were added.
+
+    '''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.files = []
+        self.metadata = []
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.files)
+
+    def wants(self, metadata):
+        return metadata.st_size <= self.max_bytes
+
+    def add_file(self, filename, metadata, chunkids):
+        self.files.append((filename, metadata, chunkids))
+        self.bytes += metadata.st_size
+
+    def add_metadata(self, filename, metadata):
+        self.metadata.append((filename, metadata))
+
+    def is_full(self):
+        return self.bytes >= self.max_bytes
+
+    def get_chunk_ids(self):
+        result = []
+        for _, _, chunkids in self.files:
+            result.extend(chunkids)
+        return result
+
+
 class RestorePlugin(obnamlib.ObnamPlugin):
 
     # A note about the implementation: we need to make sure all the
@@ -104,6 +147,14 @@ class RestorePlugin(obnamlib.ObnamPlugin):
             'even if not root or backed up file had different owner '
             'than user running restore',
             default=False)
+        self.app.settings.bytesize(
+            ['restore-batch-size'],
+            'restore files smaller than SIZE in batches of about SIZE '
+            'bytes, reading their data in the order it is stored in '
+            'the repository; set to 0 to restore each file separately',
+            metavar='SIZE',
+            default=obnamlib.DEFAULT_RESTORE_BATCH_BYTES,
+            group=obnamlib.option_group['perf'])
 
     @property
     def write_ok(self):
@@ -143,6 +194,11 @@ class RestorePlugin(obnamlib.ObnamPlugin):
 
         self.downloaded_bytes = 0
         self.file_count = 0
+
+        # Chunks known to contain only zeroes, for restoring holes in
+        # sparse files without fetching the chunks again. Keys are
+        # chunk ids, values are sizes.
+        self.zero_chunks = {}
         self.started = time.time()
 
         self.repo = self.app.get_repository_object()
@@ -151,6 +207,7 @@ class RestorePlugin(obnamlib.ObnamPlugin):
         if self.write_ok:
             self.fs = self.app.fsf.new(self.app.settings['to'], create=True)
             self.fs.connect()
+            self.app.vfs_latency.instrument('restore-target', self.fs)
 
             # The --to directory MUST be empty, to prevent users from
             # accidentally restoring over /.
@@ -168,6 +225,7 @@ class RestorePlugin(obnamlib.ObnamPlugin):
             self.fs = None  # this will trigger error if we try to really write
 
         self.hardlinks = Hardlinks()
+        self.batch = RestoreBatch(self.app.settings['restore-batch-size'])
 
         self.errors = False
 
@@ -176,6 +234,8 @@ class RestorePlugin(obnamlib.ObnamPlugin):
             raise WrongNumberOfGenerationSettingsError()
         gen = self.repo.interpret_generation_spec(client_name, generations[0])
 
+        self.checksum_key = self.repo.get_client_checksum_key(client_name)
+
         self.configure_ttystatus()
         self.app.ts['total'] = self.repo.get_generation_key(
             gen, obnamlib.REPO_GENERATION_FILE_COUNT)
@@ -205,6 +265,7 @@ class RestorePlugin(obnamlib.ObnamPlugin):
             self.file_count += 1
             self.app.ts['current'] = pathname
             self.restore_safely(gen, pathname)
+        self.restore_batch()
 
     def restore_safely(self, gen, pathname):
         try:
@@ -230,22 +291,70 @@ class RestorePlugin(obnamlib.ObnamPlugin):
             else:
                 self.restore_first_link(gen, pathname, metadata)
             if set_metadata and self.write_ok:
-                always = self.app.settings['always-restore-setuid']
-                try:
-                    obnamlib.set_metadata(
-                        self.fs, './' + pathname, metadata,
-                        always_set_id_bits=always)
-                except obnamlib.SetMetadataError as e:
-                    self.app.ts.error(str(e))
-                    self.errors = True
+                if self.batch:
+                    self.batch.add_metadata(pathname, metadata)
+                else:
+                    self.set_metadata(pathname, metadata)
         except Exception, e:  # pylint: disable=broad-except
-            # Reaching this code path means we've hit a bug, so we log
-            # a full traceback.
-            msg = "Failed to restore %s:" % (pathname,)
-            logging.exception(msg)
-            self.app.ts.error(msg + " " + str(e))
+            self.restore_failed(pathname, e)
+
+        if self.batch.is_full():
+            self.restore_batch()
+
+    def restore_failed(self, pathname, e):
+        # Reaching this code path means we've hit a bug, so we log
+        # a full traceback.
+        msg = "Failed to restore %s:" % (pathname,)
+        logging.exception(msg)
+        self.app.ts.error(msg + " " + str(e))
+        self.errors = True
+
+    def set_metadata(self, pathname, metadata):
+        always = self.app.settings['always-restore-setuid']
+        try:
+            obnamlib.set_metadata(
+                self.fs, './' + pathname, metadata,
+                always_set_id_bits=always)
+        except obnamlib.SetMetadataError as e:
+            self.app.ts.error(str(e))
             self.errors = True
 
+    def restore_batch(self):
+        batch = self.batch
+        self.batch = RestoreBatch(batch.max_bytes)
+        if not batch.files and not batch.metadata:
+            return
+
+        logging.debug(
+            'restoring batch of %d files, %d bytes', len(batch), batch.bytes)
+        contents = {}
+        try:
+            for chunkid, data in self.repo.get_chunk_contents(
+                    batch.get_chunk_ids()):
+                contents[chunkid] = data
+        except Exception:  # pylint: disable=broad-except
+            # Fall back to reading chunks file by file, so that any
+            # errors get reported for the files they affect.
+            logging.exception('Failed to read chunks for restore batch')
+
+        def get_chunk_content(chunkid):
+            if chunkid in contents:
+                return contents[chunkid]
+            return self.repo.get_chunk_content(chunkid)
+
+        for filename, metadata, chunkids in batch.files:
+            try:
+                self.write_regular_file(
+                    filename, metadata, chunkids, get_chunk_content)
+            except Exception, e:  # pylint: disable=broad-except
+                self.restore_failed(filename, e)
+
+        for pathname, metadata in batch.metadata:
+            try:
+                self.set_metadata(pathname, metadata)
+            except Exception, e:  # pylint: disable=broad-except
+                self.restore_failed(pathname, e)
+
     def restore_dir(self, gen, root, metadata):
         logging.debug('restoring dir %s', root)
         if self.write_ok:
@@ -281,43 +390,71 @@ class RestorePlugin(obnamlib.ObnamPlugin):
     def restore_regular_file(self, gen, filename, metadata):
         logging.debug('restoring regular %s', filename)
         if self.write_ok:
-            f = self.fs.open('./' + filename, 'wb')
-            if obnamlib.REPO_FILE_MD5 in self.repo.get_allowed_file_keys():
-                summer = hashlib.md5()
+            chunkids = self.repo.get_file_chunk_ids(gen, filename)
+            if self.batch.max_bytes > 0 and self.batch.wants(metadata):
+                # Create the file now, so that hardlinks to it can
+                # be made before the batch is restored.
+                self.fs.open('./' + filename, 'wb').close()
+                self.batch.add_file(filename, metadata, chunkids)
             else:
-                summer = None
+                self.write_regular_file(
+                    filename, metadata, chunkids,
+                    self.repo.get_chunk_content)
 
-            try:
-                chunkids = self.repo.get_file_chunk_ids(gen, filename)
-                self.restore_chunks(f, chunkids, summer)
-            except obnamlib.MissingFilterError, e:
-                msg = '%s: %s' % (filename, str(e))
-                logging.error(msg)
-                self.app.ts.notify(msg)
-                self.errors = True
-            f.close()
-
-            correct_checksum = metadata.md5
-            if summer and summer.digest() != correct_checksum:
-                msg = 'File checksum restore error: %s' % filename
-                msg += ' (%s vs %s)' % (
-                    summer.hexdigest(), correct_checksum.encode('hex'))
-                logging.error(msg)
-                self.app.ts.notify(msg)
-                self.errors = True
-
-    def restore_chunks(self, f, chunkids, checksummer):
+    def write_regular_file(self, filename, metadata, chunkids,
+                           get_chunk_content):
+        f = self.fs.open('./' + filename, 'wb')
+        summer = obnamlib.WholeFileCheckSummer(self.checksum_key)
+
+        try:
+            self.restore_chunks(f, chunkids, summer, get_chunk_content)
+        except obnamlib.MissingFilterError, e:
+            msg = '%s: %s' % (filename, str(e))
+            logging.error(msg)
+            self.app.ts.notify(msg)
+            self.errors = True
+        f.close()
+
+        correct_checksum = self.get_whole_file_checksum(metadata)
+        checksum = summer.get_checksum()
+        if correct_checksum and checksum != correct_checksum:
+            msg = 'File checksum restore error: %s' % filename
+            msg += ' (%s vs %s)' % (
+                self.format_checksum(checksum),
+                self.format_checksum(correct_checksum))
+            logging.error(msg)
+            self.app.ts.notify(msg)
+            self.errors = True
+
+    def get_whole_file_checksum(self, metadata):
+        for key, name in obnamlib.metadata_file_key_mapping:
+            if key == self.checksum_key:
+                return getattr(metadata, name)
+        return None
+
+    def format_checksum(self, checksum):
+        if self.checksum_key == obnamlib.REPO_FILE_MD5:
+            return checksum.encode('hex')
+        return checksum
+
+    def restore_chunks(self, f, chunkids, checksummer, get_chunk_content):
         zeroes = ''
         hole_at_end = False
         for chunkid in chunkids:
-            data = self.repo.get_chunk_content(chunkid)
-            self.verify_chunk_checksum(data, chunkid)
-            if checksummer:
-                checksummer.update(data)
-            self.downloaded_bytes += len(data)
-            if len(data) != len(zeroes):
-                zeroes = '\0' * len(data)
+            if chunkid in self.zero_chunks:
+                size = self.zero_chunks[chunkid]
+                if size != len(zeroes):
+                    zeroes = '\0' * size
+                data = zeroes
+            else:
+                data = get_chunk_content(chunkid)
+                self.verify_chunk_checksum(data, chunkid)
+                self.downloaded_bytes += len(data)
+                if len(data) != len(zeroes):
+                    zeroes = '\0' * len(data)
+            checksummer.append_chunk(data, chunkid)
             if data == zeroes:
+                self.zero_chunks[chunkid] = len(data)
                 f.seek(len(data), 1)
                 hole_at_end = True
             else:
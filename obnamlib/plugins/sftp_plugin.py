@@ -157,7 +157,12 @@ class SftpFS(obnamlib.VirtualFileSystem):
         self.sftp = None
         self.settings = settings
         self._roundtrips = 0
+        # None until the first posix-rename tells us if it works.
+        self._posix_rename_works = None
         self._initial_dir = None
+        # Open files whose data has been requested by prefetch, but
+        # not yet read by cat.
+        self._prefetched = {}
         self.reinit(baseurl, create=create)
         # Backwards compatibility with old, deprecated option:
         if settings and settings['strict-ssh-host-keys']:
@@ -320,6 +325,7 @@ class SftpFS(obnamlib.VirtualFileSystem):
 
     def close(self):
         logging.debug('SftpFS.close called')
+        self._forget_prefetched()
         self.sftp.close()
         self.sftp = None
         if self.transport:
@@ -347,6 +353,7 @@ class SftpFS(obnamlib.VirtualFileSystem):
         self._delay()
 
         if self.sftp:
+            self._forget_prefetched()
             if create:
                 self._create_root_if_missing()
             logging.debug('chdir to %s', path)
@@ -362,6 +369,7 @@ class SftpFS(obnamlib.VirtualFileSystem):
 
     @ioerror_to_oserror
     def chdir(self, pathname):
+        self._forget_prefetched()
         self._delay()
         self.sftp.chdir(pathname)
 
@@ -483,6 +491,7 @@ class SftpFS(obnamlib.VirtualFileSystem):
 
     @ioerror_to_oserror
     def remove(self, pathname):
+        self._forget_prefetched(pathname)
         self._delay()
         self.sftp.remove(pathname)
 
@@ -496,10 +505,47 @@ class SftpFS(obnamlib.VirtualFileSystem):
 
     @ioerror_to_oserror
     def rename(self, old, new):
+        self._forget_prefetched(old)
+        self._forget_prefetched(new)
         self._delay()
+        if self._posix_rename(old, new):
+            return
         self._remove_if_exists(new)
         self.sftp.rename(old, new)
 
+    def _posix_rename(self, old, new):
+        '''Rename with the OpenSSH posix-rename extension, if possible.
+
+        Plain SFTP rename fails if the target exists, so we need to
+        remove it first, which costs a round trip. The extension
+        replaces the target atomically in one request. Return True if
+        the rename was done, False if the caller needs to do it the
+        old way.
+
+        '''
+
+        posix_rename = getattr(self.sftp, 'posix_rename', None)
+        if posix_rename is None or self._posix_rename_works is False:
+            return False
+        try:
+            posix_rename(old, new)
+        except IOError, e:
+            if e.errno is not None:
+                raise
+            # Paramiko doesn't tell us why the request failed. If it
+            # has never worked, assume the server does not support
+            # the extension, and stop trying. Otherwise, just fall
+            # back this time, and let the old way report any error.
+            if self._posix_rename_works is None:
+                logging.debug(
+                    'SFTP posix-rename not supported: %s', str(e))
+                self._posix_rename_works = False
+            else:
+                logging.debug('SFTP posix-rename failed: %s', str(e))
+            return False
+        self._posix_rename_works = True
+        return True
+
     @ioerror_to_oserror
     def lstat(self, pathname):
         self._delay()
@@ -558,9 +604,11 @@ class SftpFS(obnamlib.VirtualFileSystem):
         return self.sftp.file(pathname, mode, bufsize=bufsize)
 
     def cat(self, pathname):
-        self._delay()
-        f = self.open(pathname, 'rb')
-        self._prefetch(pathname, f)
+        f = self._prefetched.pop(pathname, None)
+        if f is None:
+            self._delay()
+            f = self.open(pathname, 'rb')
+            self._prefetch(pathname, f)
         chunks = []
         while True:
             chunk = f.read(self.chunk_size)
@@ -571,6 +619,42 @@ class SftpFS(obnamlib.VirtualFileSystem):
         f.close()
         return ''.join(chunks)
 
+    def prefetch(self, pathnames):
+        # Open each file and send all the read requests for it right
+        # away. The server sends the data while we open the next file,
+        # and cat reads it without waiting for any more responses.
+        for pathname in pathnames:
+            if pathname in self._prefetched:
+                continue
+            self._delay()
+            try:
+                f = self.open(pathname, 'rb')
+            except (IOError, OSError):
+                # If the file is read, cat will report the error.
+                continue
+            try:
+                self._prefetch(pathname, f)
+            except (IOError, OSError):
+                f.close()
+                continue
+            self._prefetched[pathname] = f
+
+    def _forget_prefetched(self, pathname=None):
+        '''Close prefetched files that may no longer be up to date.
+
+        With no pathname, close all of them.
+
+        '''
+
+        if pathname is None:
+            pathnames = self._prefetched.keys()
+        else:
+            pathnames = [pathname]
+        for name in pathnames:
+            f = self._prefetched.pop(name, None)
+            if f is not None:
+                f.close()
+
     def _prefetch(self, pathname, f):
         '''Call f.prefetch in the right way.
 
@@ -631,15 +715,10 @@ class SftpFS(obnamlib.VirtualFileSystem):
 
         '''Create a new file with a random name, return handle and name.'''
 
-        if dirname:
-            try:
-                self.makedirs(dirname)
-            except OSError:
-                # We ignore the error, on the assumption that it was due
-                # to the directory already existing. If it didn't exist
-                # and the error was for something else, then we'll catch
-                # that when we open the file for writing.
-                pass
+        # The directory usually exists already, so we only try to
+        # create it if creating the file fails, rather than spending
+        # round trips on checking first.
+        dirname_created = not dirname
 
         # Create a file with a random filename. This is unfortunately
         # a bit tricky, since paramiko doesn't seem to provide enough
@@ -667,11 +746,22 @@ class SftpFS(obnamlib.VirtualFileSystem):
             except (IOError, OSError):
                 if try_number == max_tries - 1:
                     raise
+                if not dirname_created:
+                    dirname_created = True
+                    try:
+                        self.makedirs(dirname)
+                    except OSError:
+                        # We ignore the error, on the assumption that
+                        # it was due to the directory already existing.
+                        # If it was for something else, then we'll
+                        # catch that when we open the file again.
+                        pass
             else:
                 return f, pathname
 
     @ioerror_to_oserror
     def overwrite_file(self, pathname, contents):
+        self._forget_prefetched(pathname)
         self._delay()
         dirname = os.path.dirname(pathname)
         f, tempname = self._tempfile(dirname)
@@ -680,6 +770,11 @@ class SftpFS(obnamlib.VirtualFileSystem):
         self.rename(tempname, pathname)
 
     def _write_helper(self, f, contents):
+        # In pipelined mode, paramiko sends each write without waiting
+        # for the server to acknowledge the previous one, and only
+        # checks the responses when the file is closed. Otherwise
+        # every chunk costs a full round trip.
+        f.set_pipelined(True)
         for pos in range(0, len(contents), self.chunk_size):
             chunk = contents[pos:pos + self.chunk_size]
             f.write(chunk)
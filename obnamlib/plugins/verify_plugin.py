@@ -77,6 +77,7 @@ class VerifyPlugin(obnamlib.ObnamPlugin):
         gen_id = self.repo.interpret_generation_spec(
             client_name,
             self.app.settings['generation'][0])
+        self.checksum_key = self.repo.get_client_checksum_key(client_name)
 
         self.app.ts['done'] = 0
         self.app.ts['total'] = 0
@@ -195,7 +196,8 @@ class VerifyPlugin(obnamlib.ObnamPlugin):
         f = self.fs.open(filename, 'r')
 
         chunkids = self.repo.get_file_chunk_ids(gen_id, filename)
-        if not self.verify_chunks(f, chunkids):
+        summer = obnamlib.WholeFileCheckSummer(self.checksum_key)
+        if not self.verify_chunks(f, chunkids, summer):
             raise Fail(filename=filename, reason='data changed')
 
         data = f.read(1)
@@ -204,13 +206,21 @@ class VerifyPlugin(obnamlib.ObnamPlugin):
 
         f.close()
 
-    def verify_chunks(self, f, chunkids):
+        if self.checksum_key is not None:
+            correct_checksum = self.repo.get_file_key(
+                gen_id, filename, self.checksum_key)
+            if correct_checksum and summer.get_checksum() != correct_checksum:
+                raise Fail(
+                    filename=filename, reason='whole-file checksum mismatch')
+
+    def verify_chunks(self, f, chunkids, summer):
         for chunkid in chunkids:
             backed_up = self.repo.get_chunk_content(chunkid)
             live_data = f.read(len(backed_up))
             self.app.ts['done_bytes'] += len(backed_up)
             if backed_up != live_data:
                 return False
+            summer.append_chunk(backed_up, chunkid)
         return True
 
     def walk(self, gen_id, args):
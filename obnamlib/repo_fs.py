@@ -18,11 +18,12 @@
 
 import os
 
-import tracing
-
 import obnamlib
 
 
+tracer = obnamlib.Tracer(__file__)
+
+
 class RepositoryFS(object):
 
     '''A wrapper around a VFS object, with calls to hooks.
@@ -37,12 +38,16 @@ class RepositoryFS(object):
     that is necessary for repository access, to allow easier
     implementation of new repository storage methods.
 
+    The time spent in the filters and in the wrapped VFS reading and
+    writing files is recorded in a PhaseStats object.
+
     '''
 
-    def __init__(self, repo, fs, hooks):
+    def __init__(self, repo, fs, hooks, phase_stats=None):
         self.repo = repo
         self.fs = fs
         self.hooks = hooks
+        self.phase_stats = phase_stats or obnamlib.PhaseStats()
 
     def _get_toplevel(self, filename):
         parts = filename.split(os.sep)
@@ -88,15 +93,21 @@ class RepositoryFS(object):
         return self.fs.rename(old_name, new_name)
 
     def cat(self, filename, runfilters=True):
-        data = self.fs.cat(filename)
+        with self.phase_stats.timer('repository-read'):
+            data = self.fs.cat(filename)
+        self.phase_stats.count('repository-files-read')
         if not runfilters:  # pragma: no cover
             return data
         toplevel = self._get_toplevel(filename)
-        return self.hooks.filter_read('repository-data', data,
-                                      repo=self.repo, toplevel=toplevel)
+        with self.phase_stats.timer('filter-read'):
+            return self.hooks.filter_read('repository-data', data,
+                                          repo=self.repo, toplevel=toplevel)
+
+    def prefetch(self, filenames):
+        self.fs.prefetch(filenames)
 
     def create_and_init_toplevel(self, filename):
-        tracing.trace('filename=%s', filename)
+        tracer.trace('filename=%s', filename)
         toplevel = self._get_toplevel(filename)
         if not self.fs.exists(toplevel):
             self.fs.mkdir(toplevel)
@@ -105,16 +116,28 @@ class RepositoryFS(object):
     def write_file(self, filename, data, runfilters=True):
         toplevel = self._get_toplevel(filename)
         if runfilters:
-            data = self.hooks.filter_write('repository-data', data,
-                                           repo=self.repo, toplevel=toplevel)
-        self.fs.write_file(filename, data)
+            with self.phase_stats.timer('filter-write'):
+                data = self.hooks.filter_write(
+                    'repository-data', data,
+                    repo=self.repo, toplevel=toplevel)
+        with self.phase_stats.timer('repository-write'):
+            self.fs.write_file(filename, data)
+        self.phase_stats.count('repository-files-written')
 
     def overwrite_file(self, filename, data, runfilters=True):
         toplevel = self._get_toplevel(filename)
         if runfilters:
-            data = self.hooks.filter_write('repository-data', data,
-                                           repo=self.repo, toplevel=toplevel)
-        self.fs.overwrite_file(filename, data)
+            with self.phase_stats.timer('filter-write'):
+                data = self.hooks.filter_write(
+                    'repository-data', data,
+                    repo=self.repo, toplevel=toplevel)
+        with self.phase_stats.timer('repository-write'):
+            self.fs.overwrite_file(filename, data)
+        self.phase_stats.count('repository-files-written')
+
+    def sync(self):
+        with self.phase_stats.timer('repository-sync'):
+            self.fs.sync()
 
 
 class ToplevelIsFileError(obnamlib.ObnamError):
@@ -60,8 +60,10 @@ REPO_FILE_SHA224 = _get_next_id()
 REPO_FILE_SHA256 = _get_next_id()
 REPO_FILE_SHA384 = _get_next_id()
 REPO_FILE_SHA512 = _get_next_id()
+REPO_FILE_BLAKE2B = _get_next_id()
+REPO_FILE_BLAKE2S = _get_next_id()
 
-_MAX_STRING_KEY = REPO_FILE_SHA512
+_MAX_STRING_KEY = REPO_FILE_BLAKE2S
 
 REPO_GENERATION_STARTED = _get_next_id()
 REPO_GENERATION_ENDED = _get_next_id()
@@ -132,6 +134,8 @@ metadata_file_key_mapping = [
     (REPO_FILE_SHA256, 'sha256'),
     (REPO_FILE_SHA384, 'sha384'),
     (REPO_FILE_SHA512, 'sha512'),
+    (REPO_FILE_BLAKE2B, 'blake2b'),
+    (REPO_FILE_BLAKE2S, 'blake2s'),
 ]
 
 
@@ -569,6 +573,12 @@ class RepositoryInterface(object):
         Note that the caller MUST also call unlock_client. Otherwise
         the client list remains locked.
 
+        Committing finishes the generation created with
+        create_generation, if any. The caller may then create another
+        generation, without unlocking the client first. Backups use
+        this for checkpoints, so that they can continue with the
+        same repository object and its caches.
+
         '''
         raise NotImplementedError()
 
@@ -870,6 +880,25 @@ class RepositoryInterface(object):
         '''Return the contents of a chunk, given its id.'''
         raise NotImplementedError()
 
+    def get_chunk_contents(self, chunk_ids):
+        '''Generate (chunk_id, content) pairs for several chunks.
+
+        Each distinct chunk id is returned once, but the order is
+        up to the implementation: it may re-order the reads to match
+        how chunks are stored, to avoid reading the same storage
+        object more than once.
+
+        Sub-classes do not need to define this method; the base
+        class provides a generic implementation.
+
+        '''
+
+        seen = set()
+        for chunk_id in chunk_ids:
+            if chunk_id not in seen:
+                seen.add(chunk_id)
+                yield chunk_id, self.get_chunk_content(chunk_id)
+
     def has_chunk(self, chunk_id):
         '''Does a chunk (still) exist in the repository?'''
         raise NotImplementedError()
@@ -891,8 +920,16 @@ class RepositoryInterface(object):
         '''
         raise NotImplementedError()
 
-    def lock_chunk_indexes(self):
-        '''Locks chunk indexes for updates.'''
+    def lock_chunk_indexes(self, tokens=None):
+        '''Locks chunk indexes for updates.
+
+        If tokens is given, it is a list of tokens from
+        prepare_chunk_for_indexes. Only the parts of the chunk indexes
+        needed to put chunks with those tokens into the indexes need
+        to be locked, and only put_chunk_into_indexes may be used for
+        them. An implementation may lock more than that.
+
+        '''
         raise NotImplementedError()
 
     def unlock_chunk_indexes(self):
@@ -905,7 +942,7 @@ class RepositoryInterface(object):
         raise NotImplementedError()
 
     def got_chunk_indexes_lock(self):
-        '''Have we got the chunk index lock?'''
+        '''Have we got the chunk index lock, or any part of it?'''
         raise NotImplementedError()
 
     def force_chunk_indexes_lock(self):
@@ -921,6 +958,22 @@ class RepositoryInterface(object):
         '''
         raise NotImplementedError()
 
+    def get_chunk_index_lock_groups(self, tokens):
+        '''Group tokens by the parts of the chunk indexes they need.
+
+        Return a list of lists of tokens, which together contain all
+        the tokens. Each list can be given to lock_chunk_indexes, to
+        put the chunks for it into the indexes, one list at a time.
+        This lets several clients update different parts of the chunk
+        indexes at the same time. The default is to have one group.
+
+        '''
+
+        tokens = list(tokens)
+        if tokens:
+            return [tokens]
+        return []
+
     def prepare_chunk_for_indexes(self, data):
         '''Prepare chunk for putting into indexes.
 
@@ -1722,6 +1775,28 @@ class RepositoryInterfaceTests(unittest.TestCase):  # pragma: no cover
         gen_id_2 = self.repo.create_generation('fooclient')
         self.assertTrue(self.repo.file_exists(gen_id_2, '/foo/bar'))
 
+    def test_creates_generation_after_commit_without_unlocking(self):
+        gen_id = self.create_generation()
+        self.repo.add_file(gen_id, '/foo/bar')
+        self.repo.set_file_key(
+            gen_id, '/foo/bar', obnamlib.REPO_FILE_MODE, stat.S_IFREG)
+        self.repo.commit_client('fooclient')
+
+        gen_id_2 = self.repo.create_generation('fooclient')
+        self.assertTrue(self.repo.file_exists(gen_id_2, '/foo/bar'))
+        self.repo.add_file(gen_id_2, '/foo/foobar')
+        self.repo.set_file_key(
+            gen_id_2, '/foo/foobar', obnamlib.REPO_FILE_MODE, stat.S_IFREG)
+        self.repo.commit_client('fooclient')
+        self.repo.unlock_client('fooclient')
+
+        self.assertEqual(
+            self.repo.get_client_generation_ids('fooclient'),
+            [gen_id, gen_id_2])
+        self.assertFalse(self.repo.file_exists(gen_id, '/foo/foobar'))
+        self.assertTrue(self.repo.file_exists(gen_id_2, '/foo/bar'))
+        self.assertTrue(self.repo.file_exists(gen_id_2, '/foo/foobar'))
+
     def test_removes_added_file_from_current_generation(self):
         gen_id = self.create_generation()
         self.repo.add_file(gen_id, '/foo/bar')
@@ -1981,7 +2056,9 @@ class RepositoryInterfaceTests(unittest.TestCase):  # pragma: no cover
              obnamlib.REPO_FILE_SHA224,
              obnamlib.REPO_FILE_SHA256,
              obnamlib.REPO_FILE_SHA384,
-             obnamlib.REPO_FILE_SHA512])
+             obnamlib.REPO_FILE_SHA512,
+             obnamlib.REPO_FILE_BLAKE2B,
+             obnamlib.REPO_FILE_BLAKE2S])
 
     def test_new_file_has_no_chunk_ids(self):
         gen_id = self.create_generation()
@@ -2153,6 +2230,15 @@ class RepositoryInterfaceTests(unittest.TestCase):  # pragma: no cover
         self.assertTrue(self.repo.has_chunk(chunk_id))
         self.assertEqual(self.repo.get_chunk_content(chunk_id), 'foochunk')
 
+    def test_gets_several_chunks_at_once(self):
+        chunk_id_1 = self.repo.put_chunk_content('foochunk')
+        chunk_id_2 = self.repo.put_chunk_content('otherchunk')
+        self.repo.flush_chunks()
+        chunk_ids = [chunk_id_2, chunk_id_1, chunk_id_2]
+        self.assertEqual(
+            sorted(self.repo.get_chunk_contents(chunk_ids)),
+            sorted([(chunk_id_1, 'foochunk'), (chunk_id_2, 'otherchunk')]))
+
     def test_get_chunk_ids_returns_nothing_initially(self):
         self.assertEqual(list(self.repo.get_chunk_ids()), [])
 
@@ -2283,6 +2369,32 @@ class RepositoryInterfaceTests(unittest.TestCase):  # pragma: no cover
         self.assertEqual(
             self.repo.find_chunk_ids_by_token(token), [chunk_id])
 
+    def test_chunk_index_lock_groups_contain_all_tokens(self):
+        tokens = [
+            self.repo.prepare_chunk_for_indexes(data)
+            for data in ['foo', 'bar', 'foobar', 'yo']]
+        groups = self.repo.get_chunk_index_lock_groups(tokens)
+        self.assertEqual(
+            sorted(token for group in groups for token in group),
+            sorted(tokens))
+
+    def test_adds_chunks_to_indexes_one_lock_group_at_a_time(self):
+        self.setup_client()
+        chunks = {}
+        for data in ['foo', 'bar', 'foobar', 'yo']:
+            token = self.repo.prepare_chunk_for_indexes(data)
+            chunks[token] = self.repo.put_chunk_content(data)
+        for group in self.repo.get_chunk_index_lock_groups(chunks.keys()):
+            self.repo.lock_chunk_indexes(tokens=group)
+            for token in group:
+                self.repo.put_chunk_into_indexes(
+                    chunks[token], token, 'fooclient')
+            self.repo.commit_chunk_indexes()
+            self.repo.unlock_chunk_indexes()
+        for token, chunk_id in chunks.items():
+            self.assertEqual(
+                self.repo.find_chunk_ids_by_token(token), [chunk_id])
+
     def test_committing_does_NOT_remove_chunk_indexes_lock(self):
         self.repo.lock_chunk_indexes()
         self.repo.commit_chunk_indexes()
@@ -0,0 +1,81 @@
+# Copyright (C) 2016  Lars Wirzenius
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+import os
+import sys
+
+import tracing
+
+
+_patterns = []
+_tracers = []
+
+
+def add_trace_pattern(pattern):
+    '''Enable tracing for source files whose name contains pattern.
+
+    This also enables tracing in other code using the tracing
+    library, such as larch.
+
+    '''
+
+    _patterns.append(pattern)
+    tracing.trace_add_pattern(pattern)
+    for tracer in _tracers:
+        tracer.update()
+
+
+def _do_not_trace(msg, *args):
+    pass
+
+
+class Tracer(object):
+
+    '''Trace debugging messages for one source file.
+
+    Create one instance per module, and call its trace method like
+    logging.debug: the message is only formatted with the arguments
+    if tracing is enabled for the module with add_trace_pattern.
+    When it isn't, trace does nothing, and hot loops can check the
+    enabled attribute to avoid even the call.
+
+    '''
+
+    def __init__(self, filename):
+        if filename.endswith('.pyc') or filename.endswith('.pyo'):
+            filename = filename[:-1]
+        self.filename = filename
+        self.enabled = False
+        self.trace = _do_not_trace
+        _tracers.append(self)
+        self.update()
+
+    def update(self):
+        self.enabled = any(pattern in self.filename for pattern in _patterns)
+        if self.enabled:
+            self.trace = self._trace
+        else:
+            self.trace = _do_not_trace
+
+    def _trace(self, msg, *args):
+        if args:
+            msg = msg % args
+        caller = sys._getframe(1)  # pylint: disable=protected-access
+        logging.debug(
+            '%s:%s:%s: %s',
+            os.path.basename(self.filename), caller.f_lineno,
+            caller.f_code.co_name, msg)
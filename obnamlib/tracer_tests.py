@@ -0,0 +1,47 @@
+# Copyright (C) 2016  Lars Wirzenius
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import obnamlib
+
+
+class Unformattable(object):
+
+    def __str__(self):
+        raise AssertionError('formatted argument when not tracing')
+
+
+class TracerTests(unittest.TestCase):
+
+    def test_is_disabled_for_file_not_matching_any_pattern(self):
+        tracer = obnamlib.Tracer('/no/such/trace-test-foo.py')
+        self.assertFalse(tracer.enabled)
+
+    def test_does_not_format_arguments_when_disabled(self):
+        tracer = obnamlib.Tracer('/no/such/trace-test-bar.py')
+        tracer.trace('%s', Unformattable())
+
+    def test_is_enabled_by_adding_pattern(self):
+        tracer = obnamlib.Tracer('/no/such/trace-test-foobar.pyc')
+        obnamlib.add_trace_pattern('trace-test-foobar.py')
+        self.assertTrue(tracer.enabled)
+        tracer.trace('%s %d', 'foo', 42)
+
+    def test_is_enabled_when_created_after_pattern_was_added(self):
+        obnamlib.add_trace_pattern('trace-test-yo')
+        tracer = obnamlib.Tracer('/no/such/trace-test-yo.py')
+        self.assertTrue(tracer.enabled)
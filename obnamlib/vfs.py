@@ -18,6 +18,7 @@
 import logging
 import os
 import stat
+import time
 import unicodedata
 import urlparse
 
@@ -90,7 +91,7 @@ class VirtualFileSystem(object):
         logging.debug('VFS: __init__: baseurl=%s', self.baseurl)
 
     def log_stats(self):
-        logging.debug(
+        logging.info(
             'VFS: baseurl=%s read=%d written=%d',
             self.baseurl, self.bytes_read, self.bytes_written)
 
@@ -137,6 +138,17 @@ class VirtualFileSystem(object):
     def unlock(self, lockname):
         '''Remove a lock file.'''
 
+    def wait_for_removal(self, pathname, timeout):
+        '''Wait until a file may have been removed.
+
+        Wait at most timeout seconds. Implementations that can be told
+        when a file is removed return as soon as that happens. The
+        default is to just sleep.
+
+        '''
+
+        time.sleep(timeout)
+
     def exists(self, pathname):
         '''Does the file or directory exist?'''
 
@@ -242,6 +254,16 @@ class VirtualFileSystem(object):
     def cat(self, pathname):
         '''Return the contents of a file.'''
 
+    def prefetch(self, pathnames):
+        '''Tell that the files will soon be read with cat.
+
+        Implementations where each request costs a round trip may
+        start reading all the files at once, rather than one at a time
+        as cat is called. This is only a hint: errors are reported by
+        cat, not here.
+
+        '''
+
     def write_file(self, pathname, contents):
         '''Write a new file.
 
@@ -257,8 +279,17 @@ class VirtualFileSystem(object):
     def overwrite_file(self, pathname, contents):
         '''Like write_file, but overwrites existing file.'''
 
+    def sync(self):
+        '''Make sure files written so far are committed to disk.
+
+        Implementations may delay committing written files to
+        persistent storage, so that a whole batch of them can be
+        committed at once. This is called at commit boundaries.
+
+        '''
+
     def scan_tree(self, dirname, ok=None, dirst=None, log=logging.error,
-                  error_handler=None):
+                  error_handler=None, dir_ok=None):
         '''Scan a tree for files.
 
         Return a generator that returns ``(pathname, stat_result)``
@@ -272,6 +303,14 @@ class VirtualFileSystem(object):
         directory, ``scan_tree`` will not recurse into the
         directory.
 
+        If ``dir_ok`` is not None, it is called for each directory
+        that ``ok`` accepts, after the directory has been listed. It
+        gets the pathname, stat result, and the list of basenames in
+        the directory as arguments. If it returns False, the directory
+        is treated as if ``ok`` had returned False. This allows
+        checking for files in a directory without further system
+        calls.
+
         ``dirst`` is for internal optimization, and should not
         be used by the caller. ``log`` is used by unit tests and
         should not be used by the caller.
@@ -305,11 +344,12 @@ class VirtualFileSystem(object):
             except OSError, e:
                 log('listdir failed: %s: %s' % (e.filename, e.strerror))
                 error_handler(pathname, e)
-                return []
+                return [], []
             else:
+                basenames = [basename for basename, _ in pairs]
                 pairs = [(os.path.join(pathname, basename), st)
                          for basename, st in pairs]
-                return important_first(pairs, is_directory)
+                return basenames, important_first(pairs, is_directory)
 
         def lstat(pathname):
             try:
@@ -319,13 +359,17 @@ class VirtualFileSystem(object):
                 return e
 
         def process_dir(dirname, metadata, items):
+            basenames, pairs = list_files(dirname)
+            if not dir_ok(dirname, metadata, basenames):
+                return items
             new_items = [
                 (subname, submeta, False)
-                for subname, submeta in list_files(dirname)]
+                for subname, submeta in pairs]
             return new_items + [(dirname, metadata, True)] + items
 
         error_handler = error_handler or (lambda name, e: None)
         ok = ok or (lambda name, st: True)
+        dir_ok = dir_ok or (lambda name, st, basenames: True)
 
         items = [(dirname, lstat(dirname), False)]
         while items:
@@ -693,6 +737,18 @@ class VfsTests(object):  # pragma: no cover
     def test_cat_fails_for_nonexistent_file(self):
         self.assertRaises(IOError, self.fs.cat, 'foo')
 
+    def test_cat_reads_prefetched_file(self):
+        self.fs.write_file('foo', 'bar')
+        self.fs.prefetch(['foo', 'missing'])
+        self.assertEqual(self.fs.cat('foo'), 'bar')
+        self.assertRaises(IOError, self.fs.cat, 'missing')
+
+    def test_cat_reads_prefetched_file_that_has_been_overwritten(self):
+        self.fs.write_file('foo', 'bar')
+        self.fs.prefetch(['foo'])
+        self.fs.overwrite_file('foo', 'foobar')
+        self.assertEqual(self.fs.cat('foo'), 'foobar')
+
     def test_has_read_nothing_initially(self):
         self.assertEqual(self.fs.bytes_read, 0)
 
@@ -726,6 +782,23 @@ class VfsTests(object):  # pragma: no cover
         self.fs.overwrite_file('foo', 'foobar')
         self.assertEqual(self.fs.cat('foo'), 'foobar')
 
+    def test_overwrite_leaves_no_other_files(self):
+        self.fs.write_file('foo', 'bar')
+        self.fs.overwrite_file('foo', 'foobar')
+        self.assertEqual(self.fs.listdir('.'), ['foo'])
+
+    def test_write_works_after_directory_is_recreated(self):
+        self.fs.write_file('foo/bar', 'bar')
+        self.fs.remove('foo/bar')
+        self.fs.rmdir('foo')
+        self.fs.write_file('foo/bar', 'foobar')
+        self.assertEqual(self.fs.cat('foo/bar'), 'foobar')
+
+    def test_sync_keeps_written_files(self):
+        self.fs.write_file('foo', 'bar')
+        self.fs.sync()
+        self.assertEqual(self.fs.cat('foo'), 'bar')
+
     def test_has_written_nothing_initially(self):
         self.assertEqual(self.fs.bytes_written, 0)
 
@@ -788,3 +861,15 @@ class VfsTests(object):  # pragma: no cover
             sorted([self.basepath] +
                    [os.path.join(self.basepath, x)
                     for x in ['foo', 'symfoo']]))
+
+    def test_scan_tree_filters_away_subdirs_by_contents(self):
+        def dir_ok(pathname, st, basenames):
+            return 'subway' not in basenames
+        self.set_up_scan_tree()
+        result = list(self.fs.scan_tree(self.basepath, dir_ok=dir_ok))
+        pathnames = [pathname for pathname, _ in result]
+        self.assertEqual(
+            sorted(pathnames),
+            sorted([self.basepath] +
+                   [os.path.join(self.basepath, x)
+                    for x in ['foo', 'foobar', 'symfoo']]))
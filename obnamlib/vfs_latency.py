@@ -0,0 +1,200 @@
+# Copyright (C) 2016  Lars Wirzenius
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+import threading
+import time
+
+
+# The VFS methods whose calls are timed by VfsLatencyStats.instrument.
+# These are the ones that turn into a round-trip for a remote
+# filesystem.
+TIMED_VFS_OPERATIONS = (
+    'cat',
+    'write_file',
+    'overwrite_file',
+    'sync',
+    'lstat',
+    'exists',
+    'lock',
+    'unlock',
+    'listdir',
+    'rename',
+    'remove',
+)
+
+
+class LatencyHistogram(object):
+
+    '''A histogram of latencies, in the style of HdrHistogram.
+
+    Latencies are recorded as whole microseconds. Each power of two
+    is divided into the same number of buckets, so that the relative
+    error of a recorded value is the same for fast and slow calls,
+    and the histogram stays small however long the run is.
+
+    '''
+
+    sub_bucket_bits = 4
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self._buckets = {}
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1000000 + 0.5))
+        index = self.bucket_index(value)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def bucket_index(self, value):
+        sub_buckets = 1 << self.sub_bucket_bits
+        if value < sub_buckets:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        return (shift + 1) * sub_buckets + (value >> shift) - sub_buckets
+
+    def bucket_range(self, index):
+        '''Return lowest and highest value that go into a bucket.'''
+        sub_buckets = 1 << self.sub_bucket_bits
+        if index < sub_buckets:
+            return index, index
+        shift = index / sub_buckets - 1
+        low = (index % sub_buckets + sub_buckets) << shift
+        return low, low + (1 << shift) - 1
+
+    def get_buckets(self):
+        '''Return list of (low, high, count) for non-empty buckets.'''
+        result = []
+        for index in sorted(self._buckets):
+            low, high = self.bucket_range(index)
+            result.append((low, high, self._buckets[index]))
+        return result
+
+    def get_percentile(self, percent):
+        '''Return value at or below which percent of values are.
+
+        The value is the highest one in its bucket, but never more
+        than the largest recorded value.
+
+        '''
+
+        if self.count == 0:
+            return 0
+        wanted = self.count * percent / 100.0
+        seen = 0
+        for low, high, count in self.get_buckets():
+            seen += count
+            if seen >= wanted:
+                return min(high, self.max)
+        return self.max  # pragma: no cover
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total-us': self.total,
+            'min-us': self.min,
+            'max-us': self.max,
+            'p50-us': self.get_percentile(50),
+            'p90-us': self.get_percentile(90),
+            'p99-us': self.get_percentile(99),
+            'buckets': [list(bucket) for bucket in self.get_buckets()],
+        }
+
+
+class VfsLatencyStats(object):
+
+    '''Latency histograms for calls to VFS methods.
+
+    A VFS is instrumented by calling instrument with a name for it.
+    This replaces the timed methods of that VFS instance with ones
+    that record how long each call takes in a histogram, one per
+    name and method. Any object with the VFS methods can be
+    instrumented, including RepositoryFS.
+
+    '''
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def instrument(self, name, fs, operations=TIMED_VFS_OPERATIONS):
+        for operation in operations:
+            method = getattr(fs, operation, None)
+            if method is None or getattr(method, 'latency_timed', False):
+                continue
+            setattr(fs, operation, self._timed(name, operation, method))
+        return fs
+
+    def _timed(self, name, operation, method):
+        def timed(*args, **kwargs):
+            started = self._clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.record(name, operation, self._clock() - started)
+        timed.latency_timed = True
+        return timed
+
+    def record(self, name, operation, seconds):
+        with self._lock:
+            key = (name, operation)
+            if key not in self._histograms:
+                self._histograms[key] = LatencyHistogram()
+            self._histograms[key].record(seconds)
+
+    def get_names(self):
+        return sorted(set(name for name, operation in self._histograms))
+
+    def get_operations(self, name):
+        return sorted(
+            operation
+            for name2, operation in self._histograms
+            if name2 == name)
+
+    def get_histogram(self, name, operation):
+        return self._histograms.get((name, operation))
+
+    def as_dict(self):
+        with self._lock:
+            result = {}
+            for (name, operation), histogram in self._histograms.items():
+                result.setdefault(name, {})[operation] = histogram.as_dict()
+            return result
+
+    def log(self):
+        for name in self.get_names():
+            for operation in self.get_operations(name):
+                histogram = self.get_histogram(name, operation)
+                logging.info(
+                    'VFS latency: %s %s: calls=%d total=%dus min=%dus '
+                    'p50=%dus p90=%dus p99=%dus max=%dus',
+                    name, operation, histogram.count, histogram.total,
+                    histogram.min, histogram.get_percentile(50),
+                    histogram.get_percentile(90),
+                    histogram.get_percentile(99), histogram.max)
+                logging.debug(
+                    'VFS latency: %s %s: buckets (low, high, count): %r',
+                    name, operation, histogram.get_buckets())
@@ -0,0 +1,174 @@
+# Copyright (C) 2016  Lars Wirzenius
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+import unittest
+
+import obnamlib
+
+
+class LatencyHistogramTests(unittest.TestCase):
+
+    def setUp(self):
+        self.histogram = obnamlib.LatencyHistogram()
+
+    def test_is_empty_initially(self):
+        self.assertEqual(self.histogram.count, 0)
+        self.assertEqual(self.histogram.get_buckets(), [])
+        self.assertEqual(self.histogram.get_percentile(50), 0)
+
+    def test_records_microseconds(self):
+        self.histogram.record(0.000003)
+        self.histogram.record(0.000005)
+        self.assertEqual(self.histogram.count, 2)
+        self.assertEqual(self.histogram.total, 8)
+        self.assertEqual(self.histogram.min, 3)
+        self.assertEqual(self.histogram.max, 5)
+        self.assertEqual(
+            self.histogram.get_buckets(), [(3, 3, 1), (5, 5, 1)])
+
+    def test_every_value_is_in_the_range_of_its_bucket(self):
+        for value in range(100000):
+            low, high = self.histogram.bucket_range(
+                self.histogram.bucket_index(value))
+            self.assertTrue(low <= value <= high, value)
+
+    def test_buckets_are_contiguous(self):
+        prev_high = -1
+        for index in range(200):
+            low, high = self.histogram.bucket_range(index)
+            self.assertEqual(low, prev_high + 1)
+            prev_high = high
+
+    def test_bucket_width_is_small_relative_to_value(self):
+        low, high = self.histogram.bucket_range(
+            self.histogram.bucket_index(10**6))
+        self.assertTrue(float(high - low) / low < 0.07)
+
+    def test_returns_percentiles(self):
+        for i in range(1, 101):
+            self.histogram.record(i / 1000000.0)
+        self.assertEqual(self.histogram.get_percentile(10), 10)
+        p90 = self.histogram.get_percentile(90)
+        self.assertTrue(90 <= p90 < 96, p90)
+        self.assertEqual(self.histogram.get_percentile(100), 100)
+
+    def test_percentile_is_at_most_maximum(self):
+        self.histogram.record(0.001)
+        self.assertEqual(self.histogram.get_percentile(50), 1000)
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeFS(object):
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.bytes_read = 0
+
+    def cat(self, filename):
+        self.clock.now += 0.002
+        self.bytes_read += 3
+        return 'foo'
+
+    def exists(self, filename):
+        self.clock.now += 0.001
+        raise OSError('bar')
+
+    def getcwd(self):
+        return '/'
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class VfsLatencyStatsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.stats = obnamlib.VfsLatencyStats(clock=self.clock)
+        self.fs = FakeFS(self.clock)
+        self.stats.instrument('repo', self.fs)
+
+    def test_has_no_histograms_initially(self):
+        self.assertEqual(self.stats.get_names(), [])
+        self.assertEqual(self.stats.as_dict(), {})
+
+    def test_instrumented_method_works_as_before(self):
+        self.assertEqual(self.fs.cat('x'), 'foo')
+        self.assertEqual(self.fs.bytes_read, 3)
+
+    def test_records_latency_of_call(self):
+        self.fs.cat('x')
+        self.assertEqual(self.stats.get_names(), ['repo'])
+        self.assertEqual(self.stats.get_operations('repo'), ['cat'])
+        histogram = self.stats.get_histogram('repo', 'cat')
+        self.assertEqual(histogram.count, 1)
+        self.assertEqual(histogram.max, 2000)
+
+    def test_records_latency_of_failing_call(self):
+        self.assertRaises(OSError, self.fs.exists, 'x')
+        histogram = self.stats.get_histogram('repo', 'exists')
+        self.assertEqual(histogram.count, 1)
+
+    def test_does_not_time_other_methods(self):
+        self.fs.getcwd()
+        self.assertEqual(self.stats.get_names(), [])
+
+    def test_instrumenting_twice_records_call_once(self):
+        self.stats.instrument('repo', self.fs)
+        self.fs.cat('x')
+        self.assertEqual(self.stats.get_histogram('repo', 'cat').count, 1)
+
+    def test_returns_dict(self):
+        self.fs.cat('x')
+        d = self.stats.as_dict()
+        self.assertEqual(d.keys(), ['repo'])
+        self.assertEqual(d['repo'].keys(), ['cat'])
+        self.assertEqual(d['repo']['cat']['count'], 1)
+        self.assertEqual(d['repo']['cat']['p50-us'], 2000)
+
+    def test_logs_histograms(self):
+        self.fs.cat('x')
+        handler = RecordingHandler()
+        logger = logging.getLogger()
+        old_level = logger.level
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        try:
+            self.stats.log()
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(old_level)
+        self.assertEqual(len(handler.messages), 2)
+        self.assertTrue(
+            handler.messages[0].startswith('VFS latency: repo cat: calls=1'))
+        self.assertTrue('max=2000us' in handler.messages[0])
+        self.assertTrue('buckets' in handler.messages[1])
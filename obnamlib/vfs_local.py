@@ -22,11 +22,13 @@ import os
 import pwd
 import tempfile
 import time
-import tracing
 
 import obnamlib
 
 
+tracer = obnamlib.Tracer(__file__)
+
+
 # Pylint doesn't see the function defined in _obnam. We silence, for
 # this module only, the no-member warning.
 #
@@ -36,6 +38,9 @@ import obnamlib
 # O_NOATIME is Linux specific:
 EXTRA_OPEN_FLAGS = getattr(os, "O_NOATIME", 0)
 
+# O_DIRECTORY is not everywhere either:
+DIR_OPEN_FLAGS = os.O_RDONLY | getattr(os, "O_DIRECTORY", 0)
+
 
 class MallocError(obnamlib.ObnamError):
 
@@ -49,6 +54,11 @@ class RootIsNotADirectory(obnamlib.ObnamError):
 
 class LocalFSFile(file):
 
+    # Descriptor for finding holes in the file. It is separate from
+    # the one used for reading, since seeking on that one would
+    # confuse the buffering done by file.
+    extent_fd = None
+
     def read(self, amount=-1):
         offset = self.tell()
         data = file.read(self, amount)
@@ -63,6 +73,43 @@ class LocalFSFile(file):
         fd = self.fileno()
         obnamlib._obnam.fadvise_dontneed(fd, offset, len(data))
 
+    def close(self):
+        if self.extent_fd is not None:
+            os.close(self.extent_fd)
+            self.extent_fd = None
+        file.close(self)
+
+    def find_data(self, offset):
+        '''Find the first extent of data at or after offset.
+
+        Return the start and end offsets of the extent, or None if
+        there is no more data in the file. Everything else is a hole.
+        If the system can't find holes, the rest of the file is
+        reported as data.
+
+        '''
+
+        if self.extent_fd is None:
+            self.extent_fd = os.open(self.name, os.O_RDONLY)
+        fd = self.extent_fd
+
+        # SEEK_DATA and SEEK_HOLE are not supported everywhere.
+        if hasattr(obnamlib._obnam, 'SEEK_DATA'):
+            try:
+                start = os.lseek(fd, offset, obnamlib._obnam.SEEK_DATA)
+                end = os.lseek(fd, start, obnamlib._obnam.SEEK_HOLE)
+                return start, end
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    return None
+                if e.errno != errno.EINVAL:  # pragma: no cover
+                    raise
+
+        size = os.fstat(fd).st_size
+        if offset >= size:
+            return None
+        return offset, size
+
 
 class LocalFS(obnamlib.VirtualFileSystem):
 
@@ -70,10 +117,25 @@ class LocalFS(obnamlib.VirtualFileSystem):
 
     chunk_size = 1024 * 1024
 
+    # How many directories to keep open for writing files into.
+    max_dir_fds = 64
+
     def __init__(self, baseurl, create=False):
-        tracing.trace('baseurl=%s', baseurl)
-        tracing.trace('create=%s', create)
+        tracer.trace('baseurl=%s', baseurl)
+        tracer.trace('create=%s', create)
         obnamlib.VirtualFileSystem.__init__(self, baseurl)
+
+        # Open directories, for writing new files with write_file_at.
+        # The unnamed temporary files it uses need /proc to be linked
+        # into a directory. If the filesystem doesn't support them, we
+        # fall back to the portable, but slower, way.
+        self.dir_fds = {}
+        self.use_tmpfile = os.path.isdir('/proc/self/fd')
+        self.temp_counter = 0
+
+        # Have we written something that hasn't been synced yet?
+        self.unsynced = False
+
         self.reinit(baseurl, create=create)
 
         # For checking that we do not unlock something we didn't lock
@@ -100,15 +162,16 @@ class LocalFS(obnamlib.VirtualFileSystem):
         # We fake chdir so that it doesn't mess with the caller's
         # perception of current working directory. This also benefits
         # unit tests. To do this, we store the baseurl as the cwd.
-        tracing.trace('baseurl=%s', baseurl)
-        tracing.trace('create=%s', create)
+        tracer.trace('baseurl=%s', baseurl)
+        tracer.trace('create=%s', create)
+        self.forget_dir_fds()
         self.cwd = os.path.abspath(baseurl)
         if os.path.exists(self.cwd):  # pragma: no cover
             if not os.path.isdir(self.cwd):
                 raise RootIsNotADirectory(baseurl=baseurl)
         if not self.isdir('.'):
             if create:
-                tracing.trace('creating %s', baseurl)
+                tracer.trace('creating %s', baseurl)
                 try:
                     os.mkdir(baseurl)
                 except OSError, e:  # pragma: no cover
@@ -120,18 +183,22 @@ class LocalFS(obnamlib.VirtualFileSystem):
                 err = errno.ENOENT
                 raise OSError(err, os.strerror(err), self.cwd)
 
+    def close(self):
+        self.forget_dir_fds()
+        obnamlib.VirtualFileSystem.close(self)
+
     def getcwd(self):
         return self.cwd
 
     def chdir(self, pathname):
-        tracing.trace('LocalFS(%s).chdir(%s)', self.baseurl, pathname)
+        tracer.trace('LocalFS(%s).chdir(%s)', self.baseurl, pathname)
         newcwd = os.path.abspath(self.join(pathname))
         if not os.path.isdir(newcwd):
             raise OSError('%s is not a directory' % newcwd)
         self.cwd = newcwd
 
     def lock(self, lockname):
-        tracing.trace('attempting lockname=%s', lockname)
+        tracer.trace('attempting lockname=%s', lockname)
         try:
             tempname = self._create_tempfile(lockname)
             self._rename_temp_to_real(tempname, lockname)
@@ -141,15 +208,13 @@ class LocalFS(obnamlib.VirtualFileSystem):
                     lock_name=lockname, reason='already exists')
             else:
                 raise  # pragma: no cover
-        tracing.trace('got lockname=%s', lockname)
-        tracing.trace('time=%f' % time.time())
+        tracer.trace('got lockname=%s', lockname)
+        tracer.trace('time=%f', time.time())
         self.our_locks.add(lockname)
 
-    def _create_tempfile(self, pathname):  # pragma: no cover
-        path = self.join(pathname)
-        dirname = os.path.dirname(path)
+    def _create_missing_dir(self, dirname):
         if not os.path.exists(dirname):
-            tracing.trace('os.makedirs(%s)' % dirname)
+            tracer.trace('os.makedirs(%s)', dirname)
             try:
                 os.makedirs(dirname, mode=obnamlib.NEW_DIR_MODE)
             except OSError as e:  # pragma: no cover
@@ -160,6 +225,11 @@ class LocalFS(obnamlib.VirtualFileSystem):
                 if e.errno != errno.EEXIST:
                     raise
 
+    def _create_tempfile(self, pathname):  # pragma: no cover
+        path = self.join(pathname)
+        dirname = os.path.dirname(path)
+        self._create_missing_dir(dirname)
+
         fd, tempname = tempfile.mkstemp(dir=dirname)
         os.fchmod(fd, obnamlib.NEW_FILE_MODE)
         os.close(fd)
@@ -181,10 +251,10 @@ class LocalFS(obnamlib.VirtualFileSystem):
         # example, but it's the best we can do. If this paragraph is
         # wrong, tell the authors.
 
-        tracing.trace('tempname=%r', tempname)
-        tracing.trace('pathname=%r', pathname)
+        tracer.trace('tempname=%r', tempname)
+        tracer.trace('pathname=%r', pathname)
         path = self.join(pathname)
-        tracing.trace('path=%r', path)
+        tracer.trace('path=%r', path)
 
         # Try link(2) for creating target file.
         try:
@@ -193,7 +263,7 @@ class LocalFS(obnamlib.VirtualFileSystem):
             pass
         else:
             os.remove(tempname)
-            tracing.trace('link+remove worked')
+            tracer.trace('link+remove worked')
             return
 
         # Nope, didn't work. Now try with O_EXCL instead.
@@ -207,26 +277,37 @@ class LocalFS(obnamlib.VirtualFileSystem):
             # Give up.
             os.remove(tempname)
             raise
-        tracing.trace('O_EXCL+rename worked')
+        tracer.trace('O_EXCL+rename worked')
 
     def unlock(self, lockname):
-        tracing.trace('lockname=%s', lockname)
+        tracer.trace('lockname=%s', lockname)
         assert lockname in self.our_locks
         self.remove(lockname)
         self.our_locks.remove(lockname)
-        tracing.trace('time=%f' % time.time())
+        tracer.trace('time=%f', time.time())
+
+    def wait_for_removal(self, pathname, timeout):
+        # Use inotify, where it's available, so that we wake up as soon
+        # as the file goes away.
+        ret = obnamlib._obnam.wait_for_removal(
+            self.join(pathname), int(timeout * 1000))
+        if ret == -1:  # pragma: no cover
+            time.sleep(timeout)
 
     def join(self, pathname):
         return os.path.join(self.cwd, pathname)
 
     def remove(self, pathname):
-        tracing.trace('remove %s', pathname)
+        tracer.trace('remove %s', pathname)
         os.remove(self.join(pathname))
         self.maybe_crash()
 
     def rename(self, old, new):
-        tracing.trace('rename %s %s', old, new)
+        tracer.trace('rename %s %s', old, new)
         os.rename(self.join(old), self.join(new))
+        if self.dir_fds:
+            # Any open directory may be under the renamed one.
+            self.forget_dir_fds()
         self.maybe_crash()
 
     def lstat(self, pathname):
@@ -283,7 +364,7 @@ class LocalFS(obnamlib.VirtualFileSystem):
             raise OSError(ret, os.strerror(ret), filename)
 
     def lchown(self, pathname, uid, gid):  # pragma: no cover
-        tracing.trace('lchown %s %d %d', pathname, uid, gid)
+        tracer.trace('lchown %s %d %d', pathname, uid, gid)
         os.lchown(self.join(pathname), uid, gid)
 
     # This method is excluded from test coverage because the platform
@@ -291,7 +372,7 @@ class LocalFS(obnamlib.VirtualFileSystem):
     # the if statement is taken, and the other branch shows up as not
     # being tested by the unit tests.
     def chmod_symlink(self, pathname, mode):  # pragma: no cover
-        tracing.trace('chmod_symlink %s %o', pathname, mode)
+        tracer.trace('chmod_symlink %s %o', pathname, mode)
         if self.got_lchmod:
             lchmod = getattr(os, 'lchmod')
             lchmod(self.join(pathname), mode)
@@ -299,7 +380,7 @@ class LocalFS(obnamlib.VirtualFileSystem):
             self.lstat(pathname)
 
     def chmod_not_symlink(self, pathname, mode):
-        tracing.trace('chmod_not_symlink %s %o', pathname, mode)
+        tracer.trace('chmod_not_symlink %s %o', pathname, mode)
         os.chmod(self.join(pathname), mode)
 
     def lutimes(self, pathname, atime_sec, atime_nsec, mtime_sec, mtime_nsec):
@@ -314,8 +395,8 @@ class LocalFS(obnamlib.VirtualFileSystem):
             raise OSError(ret, os.strerror(ret), pathname)
 
     def link(self, existing, new):
-        tracing.trace('existing=%s', existing)
-        tracing.trace('new=%s', new)
+        tracer.trace('existing=%s', existing)
+        tracer.trace('new=%s', new)
         os.link(self.join(existing), self.join(new))
         self.maybe_crash()
 
@@ -323,24 +404,24 @@ class LocalFS(obnamlib.VirtualFileSystem):
         return os.readlink(self.join(pathname))
 
     def symlink(self, existing, new):
-        tracing.trace('existing=%s', existing)
-        tracing.trace('new=%s', new)
+        tracer.trace('existing=%s', existing)
+        tracer.trace('new=%s', new)
         os.symlink(existing, self.join(new))
         self.maybe_crash()
 
     def open(self, pathname, mode, bufsize=None):
-        tracing.trace('pathname=%s', pathname)
-        tracing.trace('mode=%s', mode)
+        tracer.trace('pathname=%s', pathname)
+        tracer.trace('mode=%s', mode)
         f = LocalFSFile(self.join(pathname), mode)
-        tracing.trace('opened %s', pathname)
+        tracer.trace('opened %s', pathname)
         try:
             flags = fcntl.fcntl(f.fileno(), fcntl.F_GETFL)
             flags |= EXTRA_OPEN_FLAGS
             fcntl.fcntl(f.fileno(), fcntl.F_SETFL, flags)
         except IOError, e:  # pragma: no cover
-            tracing.trace('fcntl F_SETFL failed: %s', repr(e))
+            tracer.trace('fcntl F_SETFL failed: %r', e)
             return f  # ignore any problems setting flags
-        tracing.trace('returning ok')
+        tracer.trace('returning ok')
         return f
 
     def exists(self, pathname):
@@ -350,27 +431,28 @@ class LocalFS(obnamlib.VirtualFileSystem):
         return os.path.isdir(self.join(pathname))
 
     def mknod(self, pathname, mode):
-        tracing.trace('pathname=%s', pathname)
-        tracing.trace('mode=%o', mode)
+        tracer.trace('pathname=%s', pathname)
+        tracer.trace('mode=%o', mode)
         os.mknod(self.join(pathname), mode)
 
     def mkdir(self, pathname, mode=obnamlib.NEW_DIR_MODE):
-        tracing.trace('mkdir %s', pathname)
+        tracer.trace('mkdir %s', pathname)
         os.mkdir(self.join(pathname), obnamlib.NEW_DIR_MODE)
         self.maybe_crash()
 
     def makedirs(self, pathname):
-        tracing.trace('makedirs %s', pathname)
+        tracer.trace('makedirs %s', pathname)
         os.makedirs(self.join(pathname), obnamlib.NEW_DIR_MODE)
         self.maybe_crash()
 
     def rmdir(self, pathname):
-        tracing.trace('rmdir %s', pathname)
+        tracer.trace('rmdir %s', pathname)
         os.rmdir(self.join(pathname))
+        self.forget_dir_fd(self.join(pathname))
         self.maybe_crash()
 
     def cat(self, pathname):
-        tracing.trace('pathname=%s' % pathname)
+        tracer.trace('pathname=%s', pathname)
         pathname = self.join(pathname)
         f = self.open(pathname, 'rb')
         chunks = []
@@ -384,30 +466,102 @@ class LocalFS(obnamlib.VirtualFileSystem):
         data = ''.join(chunks)
         return data
 
-    def write_file(self, pathname, contents):  # pragma: no cover
-        tempname = self._create_tempfile(pathname)
-        f = self.open(tempname, 'wb')
-        f.write(contents)
-        f.close()
-        self.bytes_written += len(contents)
+    def get_dir_fd(self, dirname):
+        fd = self.dir_fds.get(dirname)
+        if fd is None:
+            if len(self.dir_fds) >= self.max_dir_fds:
+                self.forget_dir_fds()
+            fd = os.open(dirname, DIR_OPEN_FLAGS)
+            self.dir_fds[dirname] = fd
+        return fd
+
+    def forget_dir_fd(self, dirname):
+        fd = self.dir_fds.pop(dirname, None)
+        if fd is not None:
+            os.close(fd)
+
+    def forget_dir_fds(self):
+        for fd in self.dir_fds.values():
+            os.close(fd)
+        self.dir_fds = {}
+
+    def _write_with_tmpfile(self, pathname, contents, overwrite):
+        # Write the file into an unnamed temporary file, and link that
+        # into the directory. This needs neither a named temporary
+        # file, nor opening the file twice. Return True if this
+        # worked, False if the filesystem doesn't support it.
 
         path = self.join(pathname)
-        self._rename_temp_to_real(tempname, path)
+        dirname, basename = os.path.split(path)
+        tempname = None
+        if overwrite:
+            self.temp_counter += 1
+            tempname = '.%s.%d.%d.tmp' % (
+                basename, os.getpid(), self.temp_counter)
+
+        try:
+            return self._write_file_at(dirname, basename, contents, tempname)
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                raise
+            # Either the directory doesn't exist yet, or it has been
+            # removed since we opened it. What the error is in the
+            # latter case depends on the kernel. Try again once with a
+            # freshly created directory.
+            self.forget_dir_fd(dirname)
+            self._create_missing_dir(dirname)
+            return self._write_file_at(dirname, basename, contents, tempname)
+
+    def _write_file_at(self, dirname, basename, contents, tempname):
+        dir_fd = self.get_dir_fd(dirname)
+        try:
+            ok = obnamlib._obnam.write_file_at(
+                dir_fd, basename, contents, obnamlib.NEW_FILE_MODE, tempname)
+        except OSError as e:
+            raise OSError(e.errno, e.strerror, os.path.join(dirname, basename))
+        if not ok:  # pragma: no cover
+            tracer.trace('no O_TMPFILE support for %s', dirname)
+            self.use_tmpfile = False
+        return ok
+
+    def write_file(self, pathname, contents):  # pragma: no cover
+        if not (self.use_tmpfile and
+                self._write_with_tmpfile(pathname, contents, False)):
+            tempname = self._create_tempfile(pathname)
+            f = self.open(tempname, 'wb')
+            f.write(contents)
+            f.close()
+            path = self.join(pathname)
+            self._rename_temp_to_real(tempname, path)
+
+        self.bytes_written += len(contents)
+        self.unsynced = True
         self.maybe_crash()
 
     def overwrite_file(self, pathname, contents):
-        tracing.trace('overwrite_file %s', pathname)
+        tracer.trace('overwrite_file %s', pathname)
+
+        if not (self.use_tmpfile and
+                self._write_with_tmpfile(pathname, contents, True)):
+            tempname = self._create_tempfile(pathname)
+            f = self.open(tempname, 'wb')
+            f.write(contents)
+            f.close()
+            path = self.join(pathname)
+            os.rename(tempname, path)
 
-        tempname = self._create_tempfile(pathname)
-        f = self.open(tempname, 'wb')
-        f.write(contents)
-        f.close()
         self.bytes_written += len(contents)
-
-        path = self.join(pathname)
-        os.rename(tempname, path)
+        self.unsynced = True
         self.maybe_crash()
 
+    def sync(self):
+        # Commit everything written since the last sync with one
+        # system call, rather than with an fsync per file.
+        if self.unsynced:
+            tracer.trace('syncing %s', self.cwd)
+            obnamlib._obnam.sync_filesystem(self.get_dir_fd(self.cwd))
+            self.unsynced = False
+
     def listdir(self, dirname):
         return os.listdir(self.join(dirname))
 
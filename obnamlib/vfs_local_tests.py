@@ -16,6 +16,7 @@
 
 import os
 import shutil
+import stat
 import tempfile
 import unittest
 
@@ -56,6 +57,94 @@ class LocalFSTests(unittest.TestCase, obnamlib.VfsTests):
         # group. We're fine with either.
         self.assertTrue(self.fs.get_groupname(0) in ['root', 'wheel'])
 
+    def test_wait_for_removal_returns_at_once_for_missing_file(self):
+        # The timeout is long enough to make the test hang noticeably,
+        # if the wait isn't cut short.
+        self.fs.wait_for_removal('does-not-exist', 60)
+
+    def test_write_works_after_directory_is_removed_behind_its_back(self):
+        self.fs.write_file('foo/bar', 'bar')
+        shutil.rmtree(os.path.join(self.basepath, 'foo'))
+        self.fs.write_file('foo/bar', 'foobar')
+        self.assertEqual(self.fs.cat('foo/bar'), 'foobar')
+
+    def test_write_works_without_tmpfile(self):
+        self.fs.use_tmpfile = False
+        self.fs.write_file('foo', 'bar')
+        self.fs.overwrite_file('foo', 'foobar')
+        self.assertEqual(self.fs.cat('foo'), 'foobar')
+        self.assertEqual(self.fs.listdir('.'), ['foo'])
+
+    def test_written_files_have_new_file_mode_despite_umask(self):
+        old_umask = os.umask(0277)
+        try:
+            self.fs.write_file('foo', 'bar')
+            self.fs.overwrite_file('bar', 'foo')
+        finally:
+            os.umask(old_umask)
+        for basename in ['foo', 'bar']:
+            st = os.stat(os.path.join(self.basepath, basename))
+            self.assertEqual(
+                stat.S_IMODE(st.st_mode), obnamlib.NEW_FILE_MODE)
+
+    def test_keeps_at_most_max_dir_fds_directories_open(self):
+        self.fs.max_dir_fds = 2
+        for dirname in ['foo', 'bar', 'foobar']:
+            self.fs.write_file(os.path.join(dirname, 'file'), dirname)
+            self.assertTrue(len(self.fs.dir_fds) <= 2)
+        for dirname in ['foo', 'bar', 'foobar']:
+            self.assertEqual(
+                self.fs.cat(os.path.join(dirname, 'file')), dirname)
+
+    def test_sync_is_not_needed_after_it_is_done(self):
+        self.fs.write_file('foo', 'bar')
+        self.assertTrue(self.fs.unsynced)
+        self.fs.sync()
+        self.assertFalse(self.fs.unsynced)
+
+    def test_find_data_finds_data_after_hole(self):
+        with open(os.path.join(self.basepath, 'foo'), 'wb') as f:
+            f.seek(1024**2)
+            f.write('data')
+        f = self.fs.open('foo', 'r')
+        start, end = f.find_data(0)
+        f.close()
+        # Filesystems without holes report zeroes as data.
+        self.assertTrue(start in (0, 1024**2))
+        self.assertTrue(end >= 1024**2 + len('data'))
+
+    def test_find_data_returns_none_at_end_of_file(self):
+        self.fs.write_file('foo', 'data')
+        f = self.fs.open('foo', 'r')
+        self.assertEqual(f.find_data(len('data')), None)
+        f.close()
+
+    def test_find_data_does_not_move_read_position(self):
+        self.fs.write_file('foo', 'data')
+        f = self.fs.open('foo', 'r')
+        self.assertEqual(f.read(2), 'da')
+        f.find_data(0)
+        self.assertEqual(f.read(), 'ta')
+        f.close()
+
+    def test_find_data_reports_rest_of_file_without_seek_data(self):
+        self.fs.write_file('foo', 'data')
+        f = self.fs.open('foo', 'r')
+        extension = obnamlib._obnam
+        obnamlib._obnam = object()
+        try:
+            self.assertEqual(f.find_data(1), (1, len('data')))
+            self.assertEqual(f.find_data(len('data')), None)
+        finally:
+            obnamlib._obnam = extension
+            f.close()
+
+    def test_close_closes_directories(self):
+        self.fs.write_file('foo/bar', 'bar')
+        self.assertNotEqual(self.fs.dir_fds, {})
+        self.fs.close()
+        self.assertEqual(self.fs.dir_fds, {})
+
 
 class XAttrTests(unittest.TestCase):
     '''Tests for extended attributes.'''